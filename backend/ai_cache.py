@@ -0,0 +1,147 @@
+# backend/ai_cache.py
+# AI结果缓存：以 (结果类型, 模型名, 内容, 参数) 的哈希为键。
+# 内存中是有容量上限的LRU，磁盘上是独立的SQLite文件，重启后仍可命中。
+# 异步接口（aget/aset）只在内存层未命中时才把磁盘读写放到线程池，不阻塞事件循环。
+# 磁盘命中时只有记录的访问时间早于 AI_CACHE_TOUCH_SECONDS 才更新，避免每次命中都写库。
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from starlette.concurrency import run_in_threadpool
+
+AI_CACHE_PATH = os.getenv("AI_CACHE_PATH", "./ai_cache.db")
+AI_CACHE_MEMORY_ENTRIES = int(os.getenv("AI_CACHE_MEMORY_ENTRIES", "2048"))
+AI_CACHE_DISK_ENTRIES = int(os.getenv("AI_CACHE_DISK_ENTRIES", "200000"))
+AI_CACHE_TOUCH_SECONDS = float(os.getenv("AI_CACHE_TOUCH_SECONDS", "600"))
+
+
+def make_key(kind: str, model: str, content: str, **params) -> str:
+    payload = json.dumps(
+        {"kind": kind, "model": model, "content": content, "params": params},
+        ensure_ascii=False, sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AICache:
+    def __init__(self, path=AI_CACHE_PATH, max_entries=AI_CACHE_MEMORY_ENTRIES, max_disk_entries=AI_CACHE_DISK_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory = OrderedDict()
+        # _lock 只保护内存层和计数，磁盘读写另用 _disk_lock，内存命中不必等磁盘I/O
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._conn = None
+        self._writes_since_trim = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _db(self):
+        # 首次使用时才打开磁盘缓存文件
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS ai_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_ai_cache_accessed ON ai_cache (accessed_at)")
+            self._conn.commit()
+        return self._conn
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        value = self._get_memory(key)
+        return value if value is not None else self._get_disk(key)
+
+    async def aget(self, key):
+        value = self._get_memory(key)
+        return value if value is not None else await run_in_threadpool(self._get_disk, key)
+
+    def set(self, key, value):
+        with self._lock:
+            self._remember(key, value)
+        self._set_disk(key, value)
+
+    async def aset(self, key, value):
+        with self._lock:
+            self._remember(key, value)
+        await run_in_threadpool(self._set_disk, key, value)
+
+    def _get_memory(self, key):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return self._memory[key]
+        return None
+
+    def _get_disk(self, key):
+        with self._disk_lock:
+            conn = self._db()
+            row = conn.execute("SELECT value, accessed_at FROM ai_cache WHERE key = ?", (key,)).fetchone()
+            if row is not None and time.time() - row[1] > AI_CACHE_TOUCH_SECONDS:
+                conn.execute("UPDATE ai_cache SET accessed_at = ? WHERE key = ?", (time.time(), key))
+                conn.commit()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            value = json.loads(row[0])
+            self._remember(key, value)
+            self.disk_hits += 1
+            return value
+
+    def _set_disk(self, key, value):
+        with self._disk_lock:
+            conn = self._db()
+            conn.execute(
+                "INSERT OR REPLACE INTO ai_cache (key, value, accessed_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), time.time())
+            )
+            self._writes_since_trim += 1
+            # 每写入一批才检查一次磁盘容量，按最近访问时间淘汰
+            if self._writes_since_trim >= 1000:
+                self._writes_since_trim = 0
+                conn.execute(
+                    "DELETE FROM ai_cache WHERE key IN ("
+                    "SELECT key FROM ai_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_disk_entries,)
+                )
+            conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        with self._disk_lock:
+            conn = self._db()
+            conn.execute("DELETE FROM ai_cache")
+            conn.commit()
+
+    def close(self):
+        with self._disk_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_entries": len(self._memory),
+                "memory_capacity": self.max_entries,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else None,
+            }
@@ -0,0 +1,148 @@
+# backend/ai_tag_jobs.py
+# 批量AI标签后台任务：把整个笔记库按批送入关键词批量提取（keywords.extract_batch，与语义搜索共用向量模型），
+# 每批的标签写入和断点进度在同一个事务里提交，进程崩溃后从断点继续。
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from sqlalchemy.orm import undefer
+from models import AITagJob, Note
+import keywords
+import tag_service
+
+AI_TAG_JOB_WORKERS = int(os.getenv("AI_TAG_JOB_WORKERS", "1"))
+AI_TAG_JOB_BATCH_SIZE = int(os.getenv("AI_TAG_JOB_BATCH_SIZE", "32"))
+
+ACTIVE_STATUSES = ("pending", "running")
+
+
+def job_to_dict(job: AITagJob) -> dict:
+    return {
+        "id": job.id,
+        "status": job.status,
+        "top_n": job.top_n,
+        "total": job.total,
+        "processed": job.processed,
+        "progress": round(job.processed / job.total, 4) if job.total else 1.0,
+        "notes_per_sec": round(job.processed / job.elapsed_seconds, 2) if job.elapsed_seconds else None,
+        "elapsed_seconds": round(job.elapsed_seconds or 0.0, 3),
+        "error": job.error,
+        "created_at": job.created_at,
+        "updated_at": job.updated_at,
+    }
+
+
+class AITagJobManager:
+    def __init__(self, session_factory, cache, workers=AI_TAG_JOB_WORKERS, batch_size=AI_TAG_JOB_BATCH_SIZE):
+        self.session_factory = session_factory
+        self.cache = cache
+        self.workers = workers
+        self.batch_size = batch_size
+        self._executor = None
+        self._cancel_events = {}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def start(self):
+        # 启动时恢复上次未完成的任务
+        self._stopping.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ai-tag-job")
+        db = self.session_factory()
+        try:
+            job_ids = [job_id for (job_id,) in db.query(AITagJob.id).filter(AITagJob.status.in_(ACTIVE_STATUSES)).all()]
+        finally:
+            db.close()
+        for job_id in job_ids:
+            self._schedule(job_id)
+
+    def shutdown(self):
+        # 正在运行的任务在当前批次提交后停下，状态保持 running，下次启动时续跑
+        self._stopping.set()
+        if self._executor:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def submit(self, db, user_id: int, top_n: int = 5) -> AITagJob:
+        total = db.query(Note).filter(Note.user_id == user_id).count()
+        job = AITagJob(user_id=user_id, top_n=top_n, total=total, status="pending")
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        self._schedule(job.id)
+        return job
+
+    def cancel(self, db, job: AITagJob) -> AITagJob:
+        if job.status in ACTIVE_STATUSES:
+            with self._lock:
+                event = self._cancel_events.get(job.id)
+            if event:
+                event.set()
+            job.status = "cancelled"
+            db.commit()
+            db.refresh(job)
+        return job
+
+    def _schedule(self, job_id: int):
+        with self._lock:
+            self._cancel_events[job_id] = threading.Event()
+        self._executor.submit(self._run, job_id)
+
+    def _run(self, job_id: int):
+        with self._lock:
+            cancelled = self._cancel_events[job_id]
+        db = self.session_factory()
+        try:
+            job = db.query(AITagJob).filter(AITagJob.id == job_id).first()
+            if not job or job.status not in ACTIVE_STATUSES:
+                return
+            job.status = "running"
+            db.commit()
+            while not cancelled.is_set() and not self._stopping.is_set():
+                has_more = self._run_batch(db, job)
+                # 取消可能由其他会话写入，重新读取状态
+                db.refresh(job)
+                if job.status != "running":
+                    break
+                if not has_more:
+                    job.status = "completed"
+                    db.commit()
+                    break
+        except Exception as e:
+            db.rollback()
+            job = db.query(AITagJob).filter(AITagJob.id == job_id).first()
+            if job:
+                job.status = "failed"
+                job.error = str(e)
+                db.commit()
+        finally:
+            db.close()
+            with self._lock:
+                self._cancel_events.pop(job_id, None)
+
+    def _run_batch(self, db, job: AITagJob) -> bool:
+        # 处理一批笔记，返回后面是否可能还有未处理的笔记
+        start = time.perf_counter()
+        notes = db.query(Note).options(undefer(Note.content)).filter(
+            Note.user_id == job.user_id, Note.id > job.last_note_id
+        ).order_by(Note.id).limit(self.batch_size).all()
+        if not notes:
+            return False
+
+        taggable = [note for note in notes if note.content and note.content.strip()]
+        tag_lists = keywords.extract_keyword_names_batch(
+            [note.content for note in taggable], job.top_n, self.cache
+        ) if taggable else []
+
+        tag_service.assign_tags(
+            db, job.user_id, {note.id: names for note, names in zip(taggable, tag_lists)}, replace=True
+        )
+
+        # 在同一个事务里推进断点
+        job.last_note_id = notes[-1].id
+        job.processed += len(notes)
+        job.total = max(job.total, job.processed)
+        job.elapsed_seconds = (job.elapsed_seconds or 0.0) + time.perf_counter() - start
+        job.updated_at = datetime.utcnow()
+        db.commit()
+        return len(notes) == self.batch_size
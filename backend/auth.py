@@ -0,0 +1,118 @@
+# backend/auth.py
+# 登录令牌：/login 签发 HMAC-SHA256 签名的令牌，内含用户ID、用户名和过期时间。
+# 请求时只需验签，用户ID→用户名的解析经过一个带TTL的LRU缓存，热路径上不再每次查 users 表。
+# 令牌还带有密码版本（由密码哈希导出），与用户当前的密码版本不一致即失效：修改密码后旧令牌全部作废。
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+# 未配置时每次启动随机生成（启动时打印警告），重启后需要重新登录；多进程部署必须显式配置，否则各进程签发的令牌互不认可
+AUTH_SECRET_CONFIGURED = bool(os.getenv("AUTH_SECRET"))
+AUTH_SECRET = os.getenv("AUTH_SECRET") or secrets.token_urlsafe(32)
+AUTH_TOKEN_TTL_SECONDS = int(os.getenv("AUTH_TOKEN_TTL_SECONDS", str(7 * 24 * 3600)))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL_SECONDS = int(os.getenv("USER_CACHE_TTL_SECONDS", "300"))
+
+
+logger = logging.getLogger(__name__)
+
+
+class CurrentUser(NamedTuple):
+    id: int
+    username: str
+    password_version: str = ""
+
+
+def warn_if_secret_missing():
+    if not AUTH_SECRET_CONFIGURED:
+        logger.warning("未配置 AUTH_SECRET，使用随机密钥：重启后令牌全部失效，多进程部署时各进程的令牌互不认可")
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _sign(payload: str) -> str:
+    return _b64encode(hmac.new(AUTH_SECRET.encode("utf-8"), payload.encode("ascii"), hashlib.sha256).digest())
+
+
+def password_version(hashed_password: str) -> str:
+    # 密码哈希的带密钥摘要，放进令牌不会泄露哈希本身
+    return _sign(hashlib.sha256((hashed_password or "").encode("utf-8")).hexdigest())[:16]
+
+
+def create_token(user: CurrentUser, ttl: int = AUTH_TOKEN_TTL_SECONDS) -> str:
+    payload = _b64encode(json.dumps(
+        {"uid": user.id, "sub": user.username, "pwv": user.password_version, "exp": int(time.time()) + ttl},
+        ensure_ascii=False
+    ).encode("utf-8"))
+    return f"{payload}.{_sign(payload)}"
+
+
+def verify_token(token: str) -> Optional[dict]:
+    # 签名不符、格式错误或已过期时返回 None
+    try:
+        payload, signature = token.split(".", 1)
+        if not hmac.compare_digest(signature, _sign(payload)):
+            return None
+        claims = json.loads(_b64decode(payload))
+    except (ValueError, UnicodeError):
+        return None
+    if not isinstance(claims, dict) or claims.get("exp", 0) < time.time():
+        return None
+    return claims
+
+
+def bearer_token(authorization: Optional[str]) -> Optional[str]:
+    if not authorization:
+        return None
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    return token.strip()
+
+
+class UserCache:
+    # user_id -> CurrentUser 的 TTL + LRU 缓存
+    def __init__(self, max_entries=USER_CACHE_SIZE, ttl=USER_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int) -> Optional[CurrentUser]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[1] < now:
+                self._entries.pop(user_id, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, user: CurrentUser):
+        with self._lock:
+            self._entries[user.id] = (user, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._entries.pop(user_id, None)
@@ -0,0 +1,259 @@
+# backend/autosave.py
+# 笔记自动保存的延迟写入：PATCH 只把改动合并进内存中的待写表后立即返回，
+# 同一笔记在一个窗口（AUTOSAVE_WINDOW_MS）内的多次改动合并为一次写入；窗口结束时后台线程把所有待写笔记
+# 放在一个事务中提交（每个事务最多 AUTOSAVE_MAX_BATCH 篇），全文索引、查重签名、历史版本、计数和同步变更随同一事务更新。
+# 停止服务时写完全部待写改动。PUT/DELETE 读取笔记之前调用 settle()：丢弃该笔记更早的待写改动并等进行中的提交结束，
+# 避免旧改动覆盖新数据。整批提交失败时逐篇重试，只有仍然失败的改动放回待写表、下个窗口重试；
+# 同一改动失败 AUTOSAVE_MAX_ATTEMPTS 次后丢弃并记录日志，一篇坏数据不会拖住其他笔记的保存。
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from sqlalchemy.orm import undefer
+from models import Folder, Note
+import duplicates
+import note_counts
+import revisions
+import search_index
+import sync_log
+import vector_index
+
+AUTOSAVE_WINDOW_MS = float(os.getenv("AUTOSAVE_WINDOW_MS", "1000"))
+AUTOSAVE_MAX_BATCH = int(os.getenv("AUTOSAVE_MAX_BATCH", "200"))
+# 停止服务时写入失败（如数据库被锁）的重试次数
+AUTOSAVE_SHUTDOWN_RETRIES = 3
+AUTOSAVE_MAX_ATTEMPTS = int(os.getenv("AUTOSAVE_MAX_ATTEMPTS", "5"))
+
+FIELDS = ("title", "content", "folder_id")
+# 待写改动被 PUT/DELETE 取代时记录的错误，等待写入的 PATCH 据此返回 409
+SUPERSEDED = "改动已被之后的保存或删除取代"
+
+logger = logging.getLogger(__name__)
+
+
+class PendingWrite:
+    # 一篇笔记尚未写入的改动；changes 只含客户端提交过的字段，后到的覆盖先到的
+    __slots__ = ("user_id", "changes", "updated_at", "patches", "done", "revision", "error", "attempts")
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.changes = {}
+        self.updated_at = None
+        self.patches = 0
+        self.done = threading.Event()
+        self.revision = None
+        self.error = None
+        self.attempts = 0
+
+
+class AutosaveWriter:
+    def __init__(self, session_factory, window_ms=AUTOSAVE_WINDOW_MS, max_batch=AUTOSAVE_MAX_BATCH,
+                 max_attempts=AUTOSAVE_MAX_ATTEMPTS):
+        self.session_factory = session_factory
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.max_attempts = max_attempts
+        self._pending = {}  # note_id -> PendingWrite，按第一次改动的先后排列
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        # 取出并提交一批改动的全过程都持有，settle() 靠它等待进行中的提交
+        self._flush_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self.patches_total = 0
+        self.transactions_total = 0
+        self.notes_written_total = 0
+        self.failures_total = 0
+        self.dropped_total = 0
+        self.last_error = None
+
+    def submit(self, user_id: int, note_id: int, changes: dict) -> PendingWrite:
+        # 合并改动并返回该笔记的待写记录；调用方已校验笔记和文件夹属于该用户
+        with self._lock:
+            entry = self._pending.get(note_id)
+            if entry is None:
+                entry = self._pending[note_id] = PendingWrite(user_id)
+                self._wakeup.notify()
+            entry.changes.update(changes)
+            entry.updated_at = datetime.utcnow()
+            entry.patches += 1
+            self.patches_total += 1
+            self._ensure_thread()
+        return entry
+
+    def pending_owner(self, note_id: int):
+        # 有待写改动的笔记已校验过归属，返回其用户ID，没有则为 None
+        with self._lock:
+            entry = self._pending.get(note_id)
+            return entry.user_id if entry else None
+
+    def settle(self, note_id: int, user_id: int):
+        # PUT/DELETE 读取笔记之前调用：该笔记更早的待写改动被这次写入取代，直接丢弃
+        with self._lock:
+            entry = self._pending.get(note_id)
+            if entry and entry.user_id == user_id:
+                del self._pending[note_id]
+            else:
+                entry = None
+        if entry:
+            entry.error = SUPERSEDED
+            entry.done.set()
+        with self._flush_lock:
+            pass
+
+    def save_now(self, entry: PendingWrite) -> bool:
+        # 立即写入（连同其他待写改动一起提交），返回该记录是否已写入
+        self.flush()
+        return entry.done.is_set() and not entry.error
+
+    def flush(self):
+        # 把当前全部待写改动写入数据库，每 max_batch 篇一个事务
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    note_ids = list(self._pending)[:self.max_batch]
+                    batch = {note_id: self._pending.pop(note_id) for note_id in note_ids}
+                if not batch:
+                    return
+                if not self._commit(batch):
+                    return
+
+    def shutdown(self):
+        # 停止后台线程并写完剩余改动
+        self._stopping.set()
+        with self._lock:
+            self._wakeup.notify()
+            thread, self._thread = self._thread, None
+        if thread:
+            thread.join()
+        for _ in range(AUTOSAVE_SHUTDOWN_RETRIES):
+            self.flush()
+            with self._lock:
+                if not self._pending:
+                    return
+            time.sleep(self.window)
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            "pending": pending,
+            "patches_total": self.patches_total,
+            "transactions_total": self.transactions_total,
+            "notes_written_total": self.notes_written_total,
+            "failures_total": self.failures_total,
+            "dropped_total": self.dropped_total,
+            "last_error": self.last_error,
+        }
+
+    def _ensure_thread(self):
+        # 调用方持有 self._lock
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._loop, name="autosave-writer", daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        while not self._stopping.is_set():
+            with self._lock:
+                while not self._pending and not self._stopping.is_set():
+                    self._wakeup.wait()
+            # 第一条改动到达后再等一个窗口，期间的改动合并进同一批
+            self._stopping.wait(self.window)
+            self.flush()
+
+    def _commit(self, batch: dict) -> bool:
+        # 返回是否全部写入；整批失败时逐篇单独提交，找出并隔离出错的笔记
+        if self._try_commit(batch):
+            return True
+        if len(batch) > 1:
+            failed = {}
+            for note_id, entry in batch.items():
+                if not self._try_commit({note_id: entry}):
+                    failed[note_id] = entry
+        else:
+            failed = batch
+        self._requeue(failed)
+        return False
+
+    def _try_commit(self, batch: dict) -> bool:
+        db = self.session_factory()
+        try:
+            touched = self._write(db, batch)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            self.failures_total += 1
+            self.last_error = str(e)
+            return False
+        finally:
+            db.close()
+        self.transactions_total += 1
+        self.notes_written_total += sum(len(note_ids) for note_ids in touched.values())
+        for user_id, note_ids in touched.items():
+            for note_id in note_ids:
+                vector_index.mark_dirty(user_id, note_id)
+        for entry in batch.values():
+            entry.done.set()
+        return True
+
+    def _write(self, db, batch: dict) -> dict:
+        # 在一个事务中应用一批改动，返回 {user_id: [写入的笔记ID]}；期间被删除的笔记直接跳过
+        notes = {note.id: note for note in db.query(Note).options(undefer(Note.content)).filter(Note.id.in_(list(batch))).all()}
+        # 文件夹在 PATCH 时校验过，但可能在等待写入期间被删除
+        folder_ids = {entry.changes["folder_id"] for entry in batch.values() if entry.changes.get("folder_id")}
+        folders = set(db.query(Folder.id, Folder.user_id).filter(Folder.id.in_(folder_ids)).all()) if folder_ids else set()
+        # 先在内存中应用改动，需要重建索引的笔记统一分词后再写库：
+        # SQLite 在第一条写语句时才加写锁，分词期间不阻塞其他写入
+        written, moves, edited = [], [], []
+        for note_id, entry in batch.items():
+            note = notes.get(note_id)
+            if note is None or note.user_id != entry.user_id:
+                continue
+            changes = entry.changes
+            previous = (note.title, note.content)
+            if "folder_id" in changes and (changes["folder_id"] is None or (changes["folder_id"], entry.user_id) in folders):
+                moves.append((entry.user_id, note.folder_id, changes["folder_id"]))
+                note.folder_id = changes["folder_id"]
+            note.title = changes.get("title", note.title)
+            note.content = changes.get("content", note.content)
+            note.updated_at = entry.updated_at
+            # 只移动文件夹时不需要重新分词和计算签名
+            if (note.title, note.content) != previous:
+                edited.append(note)
+            written.append((note, entry, previous))
+        search_index.index_notes(db, edited)
+        for user_id, old_folder_id, new_folder_id in moves:
+            note_counts.move_note(db, user_id, old_folder_id, new_folder_id)
+        for note in edited:
+            duplicates.index_note(db, note)
+        touched = {}
+        for note, entry, (previous_title, previous_content) in written:
+            entry.revision = revisions.record(db, note, previous_title, previous_content)
+            touched.setdefault(entry.user_id, []).append(note.id)
+        for user_id, note_ids in touched.items():
+            sync_log.touch(db, user_id, sync_log.NOTE, note_ids)
+        return touched
+
+    def _requeue(self, batch: dict):
+        # 提交失败：改动放回待写表，下个窗口重试；期间又有新改动的笔记合并到新记录中（新改动优先），
+        # 等待旧记录的请求得到失败结果。失败次数达到上限的改动直接丢弃
+        with self._lock:
+            for note_id, entry in batch.items():
+                entry.attempts += 1
+                if entry.attempts >= self.max_attempts:
+                    self.dropped_total += 1
+                    logger.error("笔记 %s 的自动保存连续失败 %s 次，已丢弃：%s", note_id, entry.attempts, self.last_error)
+                    entry.error = "保存失败，改动已丢弃"
+                    entry.done.set()
+                    continue
+                newer = self._pending.get(note_id)
+                if newer is None:
+                    self._pending[note_id] = entry
+                    continue
+                newer.changes = dict(entry.changes, **newer.changes)
+                newer.patches += entry.patches
+                newer.attempts = max(newer.attempts, entry.attempts)
+                entry.error = "保存失败，改动将稍后重试"
+                entry.done.set()
@@ -0,0 +1,558 @@
+# backend/benchmark.py
+# 基准测试：在临时 SQLite 库中直接生成合成的大规模笔记库（中英混合正文、嵌套文件夹、标签），
+# 进程内驱动应用，按接口逐个顺序请求，统计吞吐和 p50/p95/p99 延迟，结果写成 JSON 便于在提交之间对比。
+# 每个规模在独立子进程中运行（数据库地址在导入 models 时确定）；AI 模型默认使用替身模型。
+#
+#   python benchmark.py                              # 1k/10k/100k 笔记各跑一轮
+#   python benchmark.py --sizes 1000 10000 --requests 100
+#   python benchmark.py --data-dir ~/.cache/ai-notes-bench   # 复用生成好的数据库（按规模和种子区分）
+#   python benchmark.py --compare bench_results/a.json bench_results/b.json
+#   python benchmark.py --startup                    # 冷启动：进程启动到首个请求返回、各能力预热完成的耗时
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from load_test import percentile
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+BENCH_USER = "bench"
+BENCH_PASSWORD = "bench-password"
+# 生成器逻辑变化时加一，避免复用旧的缓存数据库
+GENERATOR_VERSION = 3
+INSERT_BATCH_SIZE = 2000
+# 复制已有笔记再略作修改的比例（模拟导入和复制粘贴产生的近似重复）
+DUPLICATE_RATE = 0.02
+# 粘贴的日志、转写稿等超长笔记的比例
+LOG_RATE = 0.03
+# 子进程默认使用的替身模型，可在环境变量中覆盖
+STUB_MODELS = {"SUMMARIZER_MODEL": "stub", "ASR_MODEL": "stub", "EMBEDDING_MODEL": "stub"}
+
+CN_WORDS = (
+    "今天 明天 会议 项目 需求 设计 评审 上线 测试 回归 优化 性能 数据库 索引 缓存 接口 前端 后端 服务 部署 "
+    "监控 告警 日志 用户 反馈 问题 方案 计划 目标 进度 风险 总结 复盘 学习 笔记 读书 机器学习 深度学习 模型 训练 "
+    "数据 特征 算法 实验 结果 分析 报告 文档 整理 记录 想法 灵感 生活 旅行 健身 跑步 饮食 早餐 咖啡 电影 音乐 "
+    "周末 家人 朋友 预算 账单 购物 清单 待办 完成 延期 重要 紧急 客户 合同 沟通 邮件 电话 安排 时间 地点 "
+    "北京 上海 深圳 杭州 公司 团队 同事 经理 招聘 面试 培训 分享 技术 架构 重构 迁移 版本 发布 依赖 升级"
+).split()
+EN_WORDS = (
+    "the a of to and in for on with is are was this that api server client cache index query latency "
+    "throughput release deploy review design meeting notes todo fix bug issue feature python react sqlite "
+    "fastapi docker kubernetes linux git branch merge commit test benchmark profile memory cpu thread async "
+    "model training dataset paper idea plan weekly report customer email budget travel coffee book chapter"
+).split()
+
+GeneratedNote = namedtuple("GeneratedNote", "id title content user_id")
+
+
+# ---------- 合成数据 ----------
+
+class LibraryGenerator:
+    def __init__(self, seed: int):
+        self.rng = random.Random(seed)
+
+    def word(self) -> str:
+        return self.rng.choice(CN_WORDS) if self.rng.random() < 0.75 else self.rng.choice(EN_WORDS)
+
+    def words(self, low: int, high: int) -> str:
+        # 英文词前后留空格，中文词直接相连
+        text = "".join(f" {word} " if word.isascii() else word for word in (self.word() for _ in range(self.rng.randint(low, high))))
+        return " ".join(text.split())
+
+    def sentence(self) -> str:
+        return self.words(6, 20) + ("。" if self.rng.random() < 0.8 else ". ")
+
+    def title(self) -> str:
+        return self.words(2, 5)
+
+    def content(self) -> str:
+        # 长度大致服从对数正态分布：中位数约300字，少数长文达到上万字
+        target = min(20000, max(20, int(math.exp(self.rng.gauss(math.log(300), 1.0)))))
+        paragraphs, length = [], 0
+        while length < target:
+            kind = self.rng.random()
+            if kind < 0.1:
+                paragraph = "## " + self.title()
+            elif kind < 0.25:
+                paragraph = "\n".join("- " + self.sentence() for _ in range(self.rng.randint(2, 5)))
+            else:
+                paragraph = "".join(self.sentence() for _ in range(self.rng.randint(2, 6)))
+            paragraphs.append(paragraph)
+            length += len(paragraph)
+        return "\n\n".join(paragraphs)
+
+    def log(self) -> str:
+        # 粘贴的服务日志：每行结构相同，只有时间、级别和少量字段变化
+        start = datetime(2024, 1, 1) + timedelta(seconds=self.rng.randint(0, 365 * 86400))
+        lines = []
+        for i in range(self.rng.randint(100, 1000)):
+            at = start + timedelta(milliseconds=i * self.rng.randint(5, 500))
+            level = self.rng.choice(("INFO", "INFO", "INFO", "DEBUG", "WARN", "ERROR"))
+            lines.append(f"{at.isoformat(sep=' ', timespec='milliseconds')} {level} [{self.rng.choice(EN_WORDS)}] "
+                         f"{self.words(3, 8)} request_id={self.rng.getrandbits(32):08x} cost={self.rng.randint(1, 900)}ms")
+        return self.sentence() + "\n\n" + "\n".join(lines)
+
+    def query(self) -> str:
+        return " ".join(self.rng.choice(CN_WORDS) for _ in range(self.rng.randint(1, 2)))
+
+
+def generate_library(engine, user_id: int, size: int, seed: int) -> dict:
+    # 直接写库：文件夹（最多5层嵌套）、标签、笔记及其全文索引、查重签名和标签关联，最后补齐同步变更索引和计数统计
+    from models import Folder, Note, Tag, note_tags
+    import duplicates
+    import note_counts
+    import search_index
+    import sync_log
+
+    gen = LibraryGenerator(seed)
+    folder_count = min(2000, max(5, size // 50))
+    tag_count = min(500, max(20, size // 100))
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        folder_ids, depth = [], {}
+        for i in range(folder_count):
+            parents = [fid for fid in folder_ids if depth[fid] < 4]
+            parent_id = gen.rng.choice(parents) if parents and gen.rng.random() < 0.7 else None
+            folder_id = conn.execute(Folder.__table__.insert().values(
+                name=f"{gen.title()}{i}", user_id=user_id, parent_id=parent_id, created_at=now,
+            )).inserted_primary_key[0]
+            folder_ids.append(folder_id)
+            depth[folder_id] = depth[parent_id] + 1 if parent_id else 0
+        tag_ids = [
+            conn.execute(Tag.__table__.insert().values(name=f"{gen.rng.choice(CN_WORDS)}-{i}", user_id=user_id))
+            .inserted_primary_key[0]
+            for i in range(tag_count)
+        ]
+        next_id = (conn.execute(Note.__table__.select().with_only_columns(Note.id).order_by(Note.id.desc()).limit(1))
+                   .scalar() or 0) + 1
+        for start in range(0, size, INSERT_BATCH_SIZE):
+            notes, rows, links = [], [], []
+            for note_id in range(next_id + start, next_id + min(size, start + INSERT_BATCH_SIZE)):
+                kind = gen.rng.random()
+                if notes and kind < DUPLICATE_RATE:
+                    content = f"{gen.rng.choice(notes).content} {gen.title()}"
+                elif kind > 1 - LOG_RATE:
+                    content = gen.log()
+                else:
+                    content = gen.content()
+                note = GeneratedNote(note_id, gen.title(), content, user_id)
+                notes.append(note)
+                rows.append({
+                    "id": note.id, "title": note.title, "content": note.content, "user_id": user_id,
+                    "folder_id": gen.rng.choice(folder_ids) if gen.rng.random() < 0.85 else None,
+                    "updated_at": now - timedelta(seconds=gen.rng.randint(0, 2 * 365 * 86400)),
+                })
+                # 标签使用频率前重后轻
+                chosen = {tag_ids[min(len(tag_ids) - 1, int(gen.rng.paretovariate(1.2)) - 1)]
+                          for _ in range(gen.rng.randint(0, 4))}
+                links.extend({"note_id": note.id, "tag_id": tag_id} for tag_id in chosen)
+            conn.execute(Note.__table__.insert(), rows)
+            if links:
+                conn.execute(note_tags.insert(), links)
+            search_index.index_new_notes(conn, notes)
+            duplicates.index_new_notes(conn, notes)
+    sync_log.backfill(engine)
+    note_counts.rebuild(engine)
+    return {"notes": size, "folders": folder_count, "tags": tag_count}
+
+
+# ---------- 单个规模的测量（在子进程中执行） ----------
+
+def summarize(latencies, failed, elapsed):
+    return {
+        "ok": len(latencies),
+        "failed": failed,
+        "per_sec": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "p50_ms": percentile(latencies, 0.5),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+    }
+
+
+async def measure(client, make_request, requests: int, budget: float, min_requests: int = 3):
+    # 先发一次不计入统计的请求（冷缓存），再顺序请求直到次数或时间预算用完
+    start = time.perf_counter()
+    r = await make_request()
+    first_ms = round((time.perf_counter() - start) * 1000, 2)
+    latencies, failed = [], 0 if r.status_code == 200 else 1
+    begin = time.perf_counter()
+    while len(latencies) + failed < requests and (len(latencies) + failed < min_requests or time.perf_counter() - begin < budget):
+        start = time.perf_counter()
+        r = await make_request()
+        if r.status_code == 200:
+            latencies.append(time.perf_counter() - start)
+        else:
+            failed += 1
+    return dict(summarize(latencies, failed, time.perf_counter() - begin), first_ms=first_ms)
+
+
+async def keyword_throughput(client, note_ids, batch_size: int = 100) -> dict:
+    # 同一批笔记：逐篇调用单篇接口 vs 每次 batch_size 篇调用批量接口；两者 top_n 不同，互不命中结果缓存
+    from models import SessionLocal, Note
+
+    db = SessionLocal()
+    try:
+        contents = [content for (content,) in db.query(Note.content).filter(Note.id.in_(note_ids)).order_by(Note.id).all()]
+    finally:
+        db.close()
+    start = time.perf_counter()
+    for content in contents:
+        r = await client.post("/extract_keywords/", json={"content": content, "top_n": 5})
+        r.raise_for_status()
+    single = time.perf_counter() - start
+    start = time.perf_counter()
+    for i in range(0, len(note_ids), batch_size):
+        r = await client.post("/extract_keywords/batch", json={"note_ids": note_ids[i:i + batch_size], "top_n": 6})
+        r.raise_for_status()
+    batch = time.perf_counter() - start
+    return {
+        "model": os.environ.get("EMBEDDING_MODEL"),
+        "notes": len(note_ids),
+        "batch_size": batch_size,
+        "single_per_sec": round(len(note_ids) / single, 1),
+        "batch_per_sec": round(len(note_ids) / batch, 1),
+        "speedup": round(single / batch, 1),
+    }
+
+
+async def bench_size(args):
+    import httpx
+    from sqlalchemy import func
+    import main
+    from models import SessionLocal, Note, Folder, Tag
+
+    transport = httpx.ASGITransport(app=main.app, raise_app_exceptions=False)
+    report = {}
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            await client.post("/register", json={"username": BENCH_USER, "password": BENCH_PASSWORD})
+            r = await client.post("/login", json={"username": BENCH_USER, "password": BENCH_PASSWORD})
+            r.raise_for_status()
+            client.headers["Authorization"] = f"Bearer {r.json()['access_token']}"
+            # 等后台预热结束再测量，模型加载期间 AI 接口会返回 503
+            for _ in range(1200):
+                r = await client.get("/readyz")
+                if all(info["state"] not in ("pending", "warming") for info in r.json()["capabilities"].values()):
+                    break
+                await asyncio.sleep(0.1)
+
+            db = SessionLocal()
+            try:
+                user_id = db.query(main.User.id).filter(main.User.username == BENCH_USER).scalar()
+                existing = db.query(func.count(Note.id)).filter(Note.user_id == user_id).scalar()
+            finally:
+                db.close()
+            if existing == 0:
+                start = time.perf_counter()
+                report["library"] = await asyncio.to_thread(generate_library, main.engine, user_id, args.size, args.seed)
+                report["library"]["generate_seconds"] = round(time.perf_counter() - start, 1)
+                if args.cache_path:
+                    # 在写接口测量之前保存一份，复用时数据与新生成的完全一致
+                    with main.engine.connect() as conn:
+                        conn.exec_driver_sql("VACUUM INTO ?", (args.cache_path,))
+            else:
+                report["library"] = {"notes": existing, "reused": True}
+            with main.engine.connect() as conn:
+                pages = (conn.exec_driver_sql("PRAGMA page_count").scalar()
+                         - conn.exec_driver_sql("PRAGMA freelist_count").scalar())
+                report["library"]["db_mb"] = round(pages * conn.exec_driver_sql("PRAGMA page_size").scalar() / 2 ** 20, 1)
+
+            db = SessionLocal()
+            try:
+                note_ids = [i for (i,) in db.query(Note.id).filter(Note.user_id == user_id).all()]
+                folder_ids = [i for (i,) in db.query(Folder.id).filter(
+                    Folder.user_id == user_id, Folder.notes.any()).all()]
+                tag_names = [n for (n,) in db.query(Tag.name).filter(Tag.user_id == user_id).all()]
+            finally:
+                db.close()
+
+            gen = LibraryGenerator(args.seed + 1)
+            user = {"username": BENCH_USER}
+
+            def get_notes():
+                return client.get(f"/notes/{BENCH_USER}")
+
+            def list_notes():
+                return client.get(f"/notes/{BENCH_USER}/list", params={"limit": 50})
+
+            def search_notes():
+                return client.get(f"/search/{BENCH_USER}", params={"query": gen.query()})
+
+            def get_folder_tree():
+                return client.get(f"/folders/{BENCH_USER}/tree")
+
+            def get_folder_notes():
+                return client.get(f"/folders/{gen.rng.choice(folder_ids)}/notes", params=user)
+
+            def get_folder_counts():
+                return client.get(f"/folders/{BENCH_USER}/counts")
+
+            def get_tag_counts():
+                return client.get(f"/tags/{BENCH_USER}/counts")
+
+            def similar_notes():
+                return client.get(f"/notes/{gen.rng.choice(note_ids)}/similar")
+
+            def find_duplicates():
+                return client.get(f"/users/{BENCH_USER}/duplicates")
+
+            def add_tags():
+                return client.post(f"/notes/{gen.rng.choice(note_ids)}/tags", params=user,
+                                   json=gen.rng.sample(tag_names, 2))
+
+            def create_note():
+                return client.post("/notes/", json={
+                    "title": gen.title(), "content": gen.content(), "folder_id": gen.rng.choice(folder_ids), **user,
+                })
+
+            def update_note():
+                return client.put(f"/notes/{gen.rng.choice(note_ids)}", json={
+                    "title": gen.title(), "content": gen.content(), "folder_id": gen.rng.choice(folder_ids), **user,
+                })
+
+            def summarize_note():
+                return client.post("/summarize/", json={"content": gen.content()})
+
+            def extract_keywords():
+                return client.post("/extract_keywords/", json={"content": gen.content()})
+
+            def extract_keywords_batch():
+                return client.post("/extract_keywords/batch", json={"contents": [gen.content() for _ in range(50)]})
+
+            endpoints = {
+                "get_notes": get_notes,
+                "list_notes": list_notes,
+                "search_notes": search_notes,
+                "get_folder_tree": get_folder_tree,
+                "get_folder_notes": get_folder_notes,
+                "get_folder_counts": get_folder_counts,
+                "get_tag_counts": get_tag_counts,
+                "similar_notes": similar_notes,
+                "find_duplicates": find_duplicates,
+                "add_tags": add_tags,
+                "create_note": create_note,
+                "update_note": update_note,
+            }
+            if args.ai:
+                endpoints.update(summarize=summarize_note, extract_keywords=extract_keywords,
+                                 extract_keywords_batch=extract_keywords_batch)
+            report["endpoints"] = {}
+            for name, make_request in endpoints.items():
+                if args.only and name not in args.only:
+                    continue
+                report["endpoints"][name] = await measure(client, make_request, args.requests, args.budget)
+            if args.ai and (not args.only or "extract_keywords" in args.only):
+                report["keywords_throughput"] = await keyword_throughput(client, note_ids[:1000])
+    # 子进程的内存峰值；本次新生成数据库时包含生成过程
+    report["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return report
+
+
+async def startup_probe(spawned_at: float, budget: float) -> dict:
+    # 从父进程创建子进程的时刻算起：导入完成、开始服务、首个请求返回、各能力就绪的时间（秒）
+    def since():
+        return round(time.time() - spawned_at, 3)
+
+    import httpx
+    import main
+    report = {"imported": since()}
+    # 能力状态的时间以服务端记录为准（轮询请求在词典加载期间会被拖慢）
+    base = since() - (time.perf_counter() - main.capabilities.started)
+    transport = httpx.ASGITransport(app=main.app, raise_app_exceptions=False)
+    async with main.app.router.lifespan_context(main.app):
+        report["serving"] = since()
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            r = await client.get("/")
+            report["first_request"] = since()
+            report["first_status"] = r.status_code
+            capabilities = {}
+            deadline = time.perf_counter() + budget
+            while time.perf_counter() < deadline:
+                r = await client.get("/readyz")
+                if r.status_code == 404:
+                    break
+                pending = False
+                for name, info in r.json()["capabilities"].items():
+                    if info["state"] in ("pending", "warming"):
+                        pending = True
+                    elif name not in capabilities:
+                        capabilities[name] = {"state": info["state"], "at": round(base + info["seconds"], 3)}
+                if not pending:
+                    break
+                await asyncio.sleep(0.05)
+            report["capabilities"] = capabilities
+    return report
+
+
+def run_startup(args) -> dict:
+    # 每次都是全新进程和空数据库，取各项耗时的中位数
+    runs = []
+    for _ in range(args.repeat):
+        workdir = tempfile.mkdtemp(prefix="ai-notes-bench-")
+        env = dict(STUB_MODELS, **os.environ)
+        env.update(DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+                   AI_CACHE_PATH=os.path.join(workdir, "ai_cache.db"))
+        try:
+            out = subprocess.run([sys.executable, os.path.abspath(__file__), "--startup-probe", str(time.time()),
+                                  "--budget", str(args.budget)], env=env, capture_output=True, text=True)
+            if out.returncode != 0:
+                raise RuntimeError(f"冷启动测量失败:\n{out.stderr[-4000:]}")
+            runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def median(values):
+        values = sorted(values)
+        return values[len(values) // 2] if values else None
+
+    report = {key: median([run[key] for run in runs]) for key in ("imported", "serving", "first_request")}
+    names = {name for run in runs for name in run["capabilities"]}
+    report["capabilities"] = {
+        name: {
+            "state": runs[-1]["capabilities"].get(name, {}).get("state"),
+            "at": median([run["capabilities"][name]["at"] for run in runs if name in run["capabilities"]]),
+        }
+        for name in sorted(names)
+    }
+    report["runs"] = runs
+    return report
+
+
+# ---------- 驱动与对比 ----------
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_size(size: int, args) -> dict:
+    # 缓存的数据库先复制到临时目录再使用，写接口的测量不会污染缓存
+    workdir = tempfile.mkdtemp(prefix="ai-notes-bench-")
+    db_path = os.path.join(workdir, "bench.db")
+    cached = None
+    if args.data_dir:
+        os.makedirs(args.data_dir, exist_ok=True)
+        cached = os.path.join(args.data_dir, f"library-{size}-seed{args.seed}-v{GENERATOR_VERSION}.db")
+        if os.path.exists(cached):
+            shutil.copyfile(cached, db_path)
+    env = dict(STUB_MODELS, **os.environ)
+    env.update(DATABASE_URL=f"sqlite:///{db_path}", AI_CACHE_PATH=os.path.join(workdir, "ai_cache.db"))
+    argv = [sys.executable, os.path.abspath(__file__), "--size", str(size), "--seed", str(args.seed),
+            "--requests", str(args.requests), "--budget", str(args.budget)]
+    if args.ai:
+        argv.append("--ai")
+    if args.only:
+        argv += ["--only", *args.only]
+    if cached and not os.path.exists(cached):
+        argv += ["--cache-path", cached]
+    try:
+        out = subprocess.run(argv, env=env, capture_output=True, text=True)
+        if out.returncode != 0:
+            raise RuntimeError(f"{size} 条笔记的基准测试失败:\n{out.stderr[-4000:]}")
+        return json.loads(out.stdout.strip().splitlines()[-1])
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def compare(old_path: str, new_path: str):
+    with open(old_path, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)
+    print(f"{old.get('commit')} -> {new.get('commit')}")
+    print(f"{'size':>7} {'endpoint':<18} {'p50_ms':>22} {'p99_ms':>22} {'per_sec':>20}")
+    for size, result in new["sizes"].items():
+        before = old["sizes"].get(size, {}).get("endpoints", {})
+        for name, stats in result["endpoints"].items():
+            base = before.get(name)
+            cells = []
+            for key in ("p50_ms", "p99_ms", "per_sec"):
+                value = stats.get(key)
+                if base and base.get(key) and value is not None:
+                    change = (value - base[key]) / base[key] * 100
+                    cells.append(f"{base[key]}->{value} ({change:+.0f}%)")
+                else:
+                    cells.append(f"{value}")
+            print(f"{size:>7} {name:<18} {cells[0]:>22} {cells[1]:>22} {cells[2]:>20}")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="合成大规模笔记库上的接口基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="笔记数量规模")
+    parser.add_argument("--requests", type=int, default=200, help="每个接口最多请求次数")
+    parser.add_argument("--budget", type=float, default=10.0, help="每个接口最多测量秒数（至少3次请求）")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--ai", action="store_true", help="同时测量摘要和关键词接口")
+    parser.add_argument("--only", nargs="+", help="只测量这些接口")
+    parser.add_argument("--data-dir", help="缓存生成的数据库，下次同规模同种子时直接复用")
+    parser.add_argument("--output", help="结果JSON路径，默认 bench_results/<时间>-<提交>.json")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="对比两份结果")
+    parser.add_argument("--startup", action="store_true", help="测量冷启动耗时")
+    parser.add_argument("--repeat", type=int, default=3, help="冷启动测量次数")
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--startup-probe", type=float, help=argparse.SUPPRESS)
+    parser.add_argument("--cache-path", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    if args.startup_probe:
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        print(json.dumps(asyncio.run(startup_probe(args.startup_probe, args.budget)), ensure_ascii=False))
+        return
+    if args.startup:
+        report = run_startup(args)
+        print(json.dumps({key: value for key, value in report.items() if key != "runs"}, ensure_ascii=False, indent=2))
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(dict(report, commit=git_commit()), f, ensure_ascii=False, indent=2)
+        return
+    if args.size:
+        # 子进程：数据库地址已由父进程通过环境变量给出
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        print(json.dumps(asyncio.run(bench_size(args)), ensure_ascii=False))
+        return
+
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "config": {"requests": args.requests, "budget": args.budget, "seed": args.seed, "ai": args.ai},
+        "sizes": {},
+    }
+    for size in args.sizes:
+        print(f"[{size}] 生成数据并测量 ...", file=sys.stderr)
+        report["sizes"][str(size)] = result = run_size(size, args)
+        for name, stats in result["endpoints"].items():
+            print(f"[{size}] {name:<18} p50={stats['p50_ms']}ms p95={stats['p95_ms']}ms "
+                  f"p99={stats['p99_ms']}ms {stats['per_sec']}/s", file=sys.stderr)
+        print(f"[{size}] db_mb={result['library']['db_mb']} peak_rss_mb={result['peak_rss_mb']}", file=sys.stderr)
+        if "keywords_throughput" in result:
+            print(f"[{size}] keywords_throughput {result['keywords_throughput']}", file=sys.stderr)
+    output = args.output or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "bench_results",
+        f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{commit}.json",
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(output)
+
+
+if __name__ == "__main__":
+    main_cli()
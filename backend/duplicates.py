@@ -0,0 +1,227 @@
+# backend/duplicates.py
+# 近似重复笔记检测：取正文分词结果中连续 DUPLICATE_SHINGLE_SIZE 个词作为 shingle，
+# 计算 MinHash 签名（两篇笔记签名相同位置相等的比例即 shingle 集合 Jaccard 相似度的估计）。
+# 签名切成 DUPLICATE_LSH_BANDS 段，每段哈希成一个桶写入 note_lsh_bands；至少有一段同桶的笔记才是候选，
+# 全库查重只需按桶分组，单篇查相似只需按桶查索引，都不需要两两比较。
+# 分词结果直接读全文索引里写入时存下的（search_index），不再调用 jieba，须在 search_index 索引之后调用。
+# 签名在笔记写入时于调用方的事务中计算；没有签名的旧笔记在该用户第一次查重时补算。
+import hashlib
+import os
+import threading
+import zlib
+import numpy as np
+from sqlalchemy import select, text
+from models import NoteMinHash
+import metrics
+import search_index
+
+DUPLICATE_SHINGLE_SIZE = int(os.getenv("DUPLICATE_SHINGLE_SIZE", "3"))
+DUPLICATE_PERMUTATIONS = int(os.getenv("DUPLICATE_PERMUTATIONS", "128"))
+# 分段数越多，越低的相似度也能成为候选：16段×8行时相似度0.7左右的笔记有一半概率成为候选，0.9以上几乎必然
+DUPLICATE_LSH_BANDS = int(os.getenv("DUPLICATE_LSH_BANDS", "16"))
+# 只对正文前这么多个词计算签名，限制超长笔记的写入开销
+DUPLICATE_MAX_TOKENS = int(os.getenv("DUPLICATE_MAX_TOKENS", "10000"))
+DUPLICATE_BACKFILL_BATCH = 500
+
+ROWS_PER_BAND = DUPLICATE_PERMUTATIONS // DUPLICATE_LSH_BANDS
+SCHEME = f"k{DUPLICATE_SHINGLE_SIZE}p{ROWS_PER_BAND * DUPLICATE_LSH_BANDS}b{DUPLICATE_LSH_BANDS}"
+
+# 排列函数 (a*x + b) mod p；x 为32位哈希，a、b < p = 2^31-1，乘积不超过 uint64
+_PRIME = np.uint64((1 << 31) - 1)
+_rng = np.random.RandomState(20240501)
+_A = _rng.randint(1, (1 << 31) - 1, size=ROWS_PER_BAND * DUPLICATE_LSH_BANDS).astype(np.uint64)
+_B = _rng.randint(0, (1 << 31) - 1, size=ROWS_PER_BAND * DUPLICATE_LSH_BANDS).astype(np.uint64)
+_CHUNK = 2048
+
+# 本进程中已补算过签名的用户；之后的写入都会同步维护签名，不需要再检查
+_indexed_users = set()
+_backfill_lock = threading.Lock()
+
+
+def shingles(indexed: str) -> set:
+    # indexed 为全文索引中以空格分隔的分词结果；标点不参与
+    tokens = [tok for tok in (indexed or "").lower().split(maxsplit=DUPLICATE_MAX_TOKENS)[:DUPLICATE_MAX_TOKENS]
+              if any(ch.isalnum() for ch in tok)]
+    if len(tokens) < DUPLICATE_SHINGLE_SIZE:
+        return {" ".join(tokens)} if tokens else set()
+    return {" ".join(tokens[i:i + DUPLICATE_SHINGLE_SIZE]) for i in range(len(tokens) - DUPLICATE_SHINGLE_SIZE + 1)}
+
+
+def signature(indexed: str):
+    # 返回 uint32 签名；没有可用词的笔记返回 None
+    with metrics.section("minhash"):
+        words = shingles(indexed)
+        if not words:
+            return None
+        hashes = np.fromiter((zlib.crc32(w.encode("utf-8")) for w in words), dtype=np.uint64, count=len(words))
+        result = np.full(len(_A), _PRIME, dtype=np.uint64)
+        for start in range(0, len(hashes), _CHUNK):
+            chunk = hashes[start:start + _CHUNK, None]
+            np.minimum(result, ((chunk * _A + _B) % _PRIME).min(axis=0), out=result)
+        return result.astype(np.uint32)
+
+
+def buckets(sig) -> list:
+    # 每段签名的 8 字节哈希，作为有符号64位整数存入 SQLite
+    return [
+        int.from_bytes(hashlib.blake2b(band.tobytes(), digest_size=8).digest(), "big", signed=True)
+        for band in sig.reshape(DUPLICATE_LSH_BANDS, ROWS_PER_BAND)
+    ]
+
+
+def _decode(blob):
+    return np.frombuffer(blob, dtype=np.uint32)
+
+
+def _write(db, user_id: int, note_ids):
+    # 从全文索引读出分词结果计算签名，覆盖旧签名和旧分段
+    if not note_ids:
+        return
+    indexed = dict(db.execute(text(
+        f"SELECT rowid, content FROM {search_index.FTS_TABLE} WHERE rowid IN (%s)"
+        % ",".join(str(int(note_id)) for note_id in note_ids)
+    )).all())
+    # 写入走文本SQL：每次保存都会调用，ORM 批量语句的编译开销比计算签名本身还大
+    db.execute(text("DELETE FROM note_lsh_bands WHERE note_id IN (%s)" % ",".join(str(int(i)) for i in note_ids)))
+    rows, bands = [], []
+    for note_id in note_ids:
+        sig = signature(indexed.get(note_id))
+        rows.append({"note_id": note_id, "user_id": user_id, "scheme": SCHEME,
+                     "signature": sig.tobytes() if sig is not None else b""})
+        if sig is not None:
+            bands.extend({"note_id": note_id, "band": band, "user_id": user_id, "bucket": bucket}
+                         for band, bucket in enumerate(buckets(sig)))
+    db.execute(text(
+        "INSERT OR REPLACE INTO note_minhash (note_id, user_id, scheme, signature) "
+        "VALUES (:note_id, :user_id, :scheme, :signature)"
+    ), rows)
+    if bands:
+        db.execute(text(
+            "INSERT INTO note_lsh_bands (note_id, band, user_id, bucket) VALUES (:note_id, :band, :user_id, :bucket)"
+        ), bands)
+
+
+def index_note(db, note):
+    # 在调用方的事务中更新签名，随 db.commit() 一起提交
+    if note.id is None:
+        db.flush()
+    _write(db, note.user_id, [note.id])
+
+
+def index_new_notes(db, notes):
+    # 批量导入用：notes 须属于同一个用户
+    if notes:
+        _write(db, notes[0].user_id, [note.id for note in notes])
+
+
+def remove_note(db, note_id: int):
+    db.execute(text("DELETE FROM note_lsh_bands WHERE note_id = :id"), {"id": note_id})
+    db.execute(text("DELETE FROM note_minhash WHERE note_id = :id"), {"id": note_id})
+
+
+def backfill(db, user_id: int):
+    # 为没有当前参数签名的笔记补算签名，分批提交
+    if user_id in _indexed_users:
+        return
+    with _backfill_lock:
+        if user_id in _indexed_users:
+            return
+        missing = db.execute(text(
+            "SELECT n.id FROM notes n LEFT JOIN note_minhash m ON m.note_id = n.id AND m.scheme = :scheme "
+            "WHERE n.user_id = :user_id AND m.note_id IS NULL"
+        ), {"scheme": SCHEME, "user_id": user_id}).scalars().all()
+        for i in range(0, len(missing), DUPLICATE_BACKFILL_BATCH):
+            _write(db, user_id, missing[i:i + DUPLICATE_BACKFILL_BATCH])
+            db.commit()
+        _indexed_users.add(user_id)
+
+
+def _signatures(db, note_ids) -> dict:
+    rows = db.execute(
+        select(NoteMinHash.note_id, NoteMinHash.signature).where(
+            NoteMinHash.note_id.in_(list(note_ids)), NoteMinHash.scheme == SCHEME
+        )
+    ).all()
+    return {row.note_id: _decode(row.signature) for row in rows if row.signature}
+
+
+def similar_notes(db, user_id: int, note_id: int, threshold: float, limit: int) -> list:
+    # 返回 [(note_id, 估计相似度)]，按相似度从高到低，不含笔记自身
+    backfill(db, user_id)
+    # CROSS JOIN 固定连接顺序：先按主键取出本篇的分段，再逐段查桶索引；否则 SQLite 可能先扫描该用户的全部分段
+    candidates = db.execute(text(
+        "SELECT DISTINCT b.note_id FROM note_lsh_bands a CROSS JOIN note_lsh_bands b "
+        "ON b.user_id = :user_id AND b.band = a.band AND b.bucket = a.bucket "
+        "WHERE a.note_id = :note_id AND b.note_id != :note_id"
+    ), {"note_id": note_id, "user_id": user_id}).scalars().all()
+    if not candidates:
+        return []
+    signatures = _signatures(db, [note_id, *candidates])
+    own = signatures.pop(note_id, None)
+    if own is None or not signatures:
+        return []
+    ids = list(signatures)
+    sims = (np.stack([signatures[i] for i in ids]) == own).mean(axis=1)
+    found = [(ids[i], round(float(sims[i]), 4)) for i in np.argsort(-sims, kind="stable") if sims[i] >= threshold]
+    return found[:limit]
+
+
+class _Groups:
+    # 并查集：把相似的笔记连成组
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, x):
+        root = self.parent.setdefault(x, x)
+        while root != self.parent[root]:
+            root = self.parent[root]
+        while x != root:
+            self.parent[x], x = root, self.parent[x]
+        return root
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            self.parent[max(a, b)] = min(a, b)
+
+
+def duplicate_groups(db, user_id: int, threshold: float) -> list:
+    # 返回 [[(note_id, 与组内最早笔记的估计相似度)], ...]，每组按笔记ID升序，组按大小从大到小
+    backfill(db, user_id)
+    rows = db.execute(text(
+        "SELECT group_concat(note_id) FROM note_lsh_bands WHERE user_id = :user_id "
+        "GROUP BY band, bucket HAVING count(*) > 1"
+    ), {"user_id": user_id}).scalars().all()
+    if not rows:
+        return []
+    buckets_members = [sorted({int(x) for x in row.split(",")}) for row in rows]
+    signatures = _signatures(db, {note_id for members in buckets_members for note_id in members})
+    groups = _Groups()
+    with metrics.section("minhash"):
+        for members in buckets_members:
+            members = [note_id for note_id in members if note_id in signatures]
+            # 每轮以剩余的第一篇为锚点，与其余笔记一次向量化比较，相似的并入锚点所在组，其余进入下一轮；
+            # 全部相同的大桶只需一轮，不必两两比较
+            while len(members) > 1:
+                anchor, rest = members[0], members[1:]
+                sims = (np.stack([signatures[i] for i in rest]) == signatures[anchor]).mean(axis=1)
+                for note_id, sim in zip(rest, sims):
+                    if sim >= threshold:
+                        groups.union(anchor, note_id)
+                members = [note_id for note_id, sim in zip(rest, sims) if sim < threshold]
+    clusters = {}
+    for note_id in groups.parent:
+        clusters.setdefault(groups.find(note_id), []).append(note_id)
+    result = []
+    for root, members in clusters.items():
+        if len(members) < 2:
+            continue
+        members.sort()
+        sims = (np.stack([signatures[i] for i in members]) == signatures[members[0]]).mean(axis=1)
+        result.append([(note_id, round(float(sim), 4)) for note_id, sim in zip(members, sims)])
+    result.sort(key=lambda group: (-len(group), group[0][0]))
+    return result
+
+
+def reset():
+    _indexed_users.clear()
@@ -0,0 +1,94 @@
+# backend/folder_tree.py
+# 文件夹树：一次查询取出用户全部文件夹，在内存中拼装成树，并按用户缓存。
+# create_folder / update_folder / delete_folder 提交后调用 invalidate() 使缓存失效。
+# 每个用户有一个代数，invalidate() 时加一；加载期间代数变了说明读到的可能是旧数据，只返回不缓存。
+import threading
+from models import Folder
+import metrics
+
+_lock = threading.Lock()
+# user_id -> {"tree": [...], "parents": {folder_id: parent_id}}
+_cache = {}
+# user_id -> 代数
+_generations = {}
+
+
+def _load(db, user_id: int):
+    rows = db.query(
+        Folder.id, Folder.name, Folder.color, Folder.created_at, Folder.parent_id
+    ).filter(Folder.user_id == user_id).order_by(Folder.id).all()
+
+    nodes = {}
+    parents = {}
+    for row in rows:
+        nodes[row.id] = {
+            "id": row.id,
+            "name": row.name,
+            "color": row.color,
+            "created_at": row.created_at,
+            "children": []
+        }
+        parents[row.id] = row.parent_id
+
+    tree = []
+    for folder_id, parent_id in parents.items():
+        if parent_id is None:
+            tree.append(nodes[folder_id])
+        elif parent_id in nodes:
+            nodes[parent_id]["children"].append(nodes[folder_id])
+    return {"tree": tree, "parents": parents}
+
+
+def _get(db, user_id: int):
+    with _lock:
+        entry = _cache.get(user_id)
+        generation = _generations.get(user_id, 0)
+    if entry is None:
+        with metrics.section("folder_tree"):
+            entry = _load(db, user_id)
+        with _lock:
+            if _generations.get(user_id, 0) == generation:
+                _cache[user_id] = entry
+    return entry
+
+
+def get_tree(db, user_id: int):
+    # 返回的结构被多个请求共享，调用方不要修改
+    return _get(db, user_id)["tree"]
+
+
+def would_create_cycle(db, user_id: int, folder_id: int, new_parent_id) -> bool:
+    # 沿新父节点向上走，若经过 folder_id 自身，说明会形成环
+    if new_parent_id is None:
+        return False
+    parents = _get(db, user_id)["parents"]
+    current = new_parent_id
+    seen = set()
+    while current is not None and current not in seen:
+        if current == folder_id:
+            return True
+        seen.add(current)
+        current = parents.get(current)
+    return current is not None
+
+
+def subtree_totals(db, user_id: int, direct: dict) -> dict:
+    # direct: {folder_id: 直接包含的笔记数}；返回 {folder_id: 含全部子孙文件夹的笔记数}
+    parents = _get(db, user_id)["parents"]
+    totals = {folder_id: direct.get(folder_id, 0) for folder_id in parents}
+    for folder_id, count in direct.items():
+        if not count or folder_id not in parents:
+            continue
+        current = parents[folder_id]
+        seen = {folder_id}
+        while current is not None and current not in seen and current in totals:
+            totals[current] += count
+            seen.add(current)
+            current = parents.get(current)
+    return totals
+
+
+def invalidate(user_id: int):
+    with _lock:
+        _cache.pop(user_id, None)
+        _generations[user_id] = _generations.get(user_id, 0) + 1
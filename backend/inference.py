@@ -0,0 +1,326 @@
+# backend/inference.py
+# 模型推理子系统：模型常驻在独立的进程池中，请求先进入有界队列，
+# 调度协程把并发到达的请求按 (最大批大小, 最长等待时间) 合并成一批再送入模型，
+# 这样事件循环和其他CRUD接口不会被模型推理拖住。
+import asyncio
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import metrics
+
+SUMMARIZER_MODEL = os.getenv("SUMMARIZER_MODEL", "facebook/bart-large-cnn")
+SUMMARIZER_WORKERS = int(os.getenv("SUMMARIZER_WORKERS", "1"))
+SUMMARIZER_MAX_BATCH = int(os.getenv("SUMMARIZER_MAX_BATCH", "8"))
+SUMMARIZER_MAX_WAIT_MS = float(os.getenv("SUMMARIZER_MAX_WAIT_MS", "20"))
+SUMMARIZER_QUEUE_SIZE = int(os.getenv("SUMMARIZER_QUEUE_SIZE", "64"))
+
+ASR_MODEL = os.getenv("ASR_MODEL", "openai/whisper-tiny")
+ASR_WORKERS = int(os.getenv("ASR_WORKERS", "1"))
+ASR_MAX_BATCH = int(os.getenv("ASR_MAX_BATCH", "4"))
+ASR_MAX_WAIT_MS = float(os.getenv("ASR_MAX_WAIT_MS", "20"))
+ASR_QUEUE_SIZE = int(os.getenv("ASR_QUEUE_SIZE", "32"))
+
+
+class InferenceBusy(Exception):
+    # 队列已满，调用方应返回 503 让客户端稍后重试
+    pass
+
+
+class StubSummarizer:
+    # 测试用的替身模型：接口与 transformers 的 summarization pipeline 一致，取前若干个字符作为摘要
+    def __call__(self, texts, max_length=150, min_length=30, **kwargs):
+        if isinstance(texts, str):
+            texts = [texts]
+        return [{"summary_text": text[:max_length]} for text in texts]
+
+
+def load_summarizer(model_name: str):
+    if model_name == "stub":
+        return StubSummarizer()
+    from transformers import pipeline
+    return pipeline("summarization", model=model_name)
+
+
+def run_summarizer(model, texts, params):
+    outputs = model(list(texts), batch_size=len(texts), do_sample=False, **params)
+    return [output["summary_text"] for output in outputs]
+
+
+class StubTranscriber:
+    # 测试用的替身模型：接口与 transformers 的 automatic-speech-recognition pipeline 一致，输出音频时长和音量
+    def __call__(self, inputs, **kwargs):
+        if isinstance(inputs, dict):
+            inputs = [inputs]
+        outputs = []
+        for item in inputs:
+            audio = item["raw"]
+            rms = float((audio ** 2).mean() ** 0.5) if len(audio) else 0.0
+            outputs.append({"text": f"[{len(audio) / item['sampling_rate']:.1f}s rms={rms:.2f}]"})
+        return outputs
+
+
+def load_transcriber(model_name: str):
+    if model_name == "stub":
+        return StubTranscriber()
+    from transformers import pipeline
+    return pipeline("automatic-speech-recognition", model=model_name)
+
+
+def run_transcriber(model, windows, params):
+    # windows 为单声道 float32 数组，采样率由 params["sampling_rate"] 给出
+    sampling_rate = params.get("sampling_rate", 16000)
+    if windows and isinstance(windows[0], str):
+        # 预热输入：一秒静音
+        import numpy as np
+        windows = [np.zeros(sampling_rate, dtype=np.float32)]
+    inputs = [{"raw": window, "sampling_rate": sampling_rate} for window in windows]
+    outputs = model(inputs, batch_size=len(inputs))
+    return [output["text"] for output in outputs]
+
+
+# ---------- 以下函数在工作进程中执行 ----------
+
+_worker_model = None
+_worker_runner = None
+
+
+def _init_worker(loader, runner, model_name):
+    global _worker_model, _worker_runner
+    _worker_model = loader(model_name)
+    _worker_runner = runner
+
+
+def _run_batch(texts, params):
+    return _worker_runner(_worker_model, texts, params)
+
+
+def _warmup():
+    # 进程初始化时已加载模型，这里跑一条输入让权重真正进入内存
+    start = time.perf_counter()
+    _worker_runner(_worker_model, ["warm up"], {})
+    return time.perf_counter() - start
+
+
+# ---------- 以下在主进程的事件循环中执行 ----------
+
+class BatchingWorker:
+    def __init__(self, name, model_name, loader, runner, workers=1, max_batch_size=8,
+                 max_wait_ms=20, max_queue_size=64):
+        self.name = name
+        self.model_name = model_name
+        self.loader = loader
+        self.runner = runner
+        self.workers = workers
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue_size = max_queue_size
+
+        self._queue = None
+        self._pool = None
+        self._dispatcher = None
+        self._slots = None
+        self._running = set()
+
+        self.warm = False
+        self.warmup_seconds = None
+        self.warmup_error = None
+        self._warmup = None
+        self.requests_total = 0
+        self.rejected_total = 0
+        self.batches_total = 0
+        self.errors_total = 0
+        self.restarts_total = 0
+        self._batch_sizes = deque(maxlen=1000)
+        self._latencies = deque(maxlen=1000)
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._slots = asyncio.Semaphore(self.workers)
+        self._pool = self._create_pool()
+        self._dispatcher = asyncio.create_task(self._dispatch())
+        self._start_warmup()
+
+    def _create_pool(self):
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.loader, self.runner, self.model_name),
+        )
+
+    def _start_warmup(self):
+        # 后台预热每个工作进程，不阻塞服务启动
+        loop = asyncio.get_running_loop()
+        self.warm = False
+        self.warmup_error = None
+        warmups = [loop.run_in_executor(self._pool, _warmup) for _ in range(self.workers)]
+        self._warmup = task = asyncio.create_task(self._await_warmup(warmups))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    def _restart_pool(self, broken):
+        # 工作进程异常退出（崩溃、被 OOM 杀掉）后进程池不能再用：换一个新池并重新预热。
+        # 多个批次同时发现同一个池坏了时只重建一次
+        if self._pool is not broken:
+            return
+        self.restarts_total += 1
+        broken.shutdown(wait=False, cancel_futures=True)
+        self._pool = self._create_pool()
+        self._start_warmup()
+
+    async def _await_warmup(self, warmups):
+        start = time.perf_counter()
+        try:
+            await asyncio.gather(*warmups)
+        except Exception as e:
+            self.errors_total += 1
+            self.warmup_error = str(e) or type(e).__name__
+            return
+        self.warmup_seconds = time.perf_counter() - start
+        self.warm = True
+
+    async def wait_warm(self):
+        # 等待后台预热结束；预热失败时抛出 RuntimeError
+        if self._warmup is None:
+            raise RuntimeError(f"{self.name} 推理服务未启动")
+        await asyncio.shield(self._warmup)
+        if self.warmup_error:
+            raise RuntimeError(self.warmup_error)
+
+    async def stop(self):
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+        if self._pool:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+        self._dispatcher = None
+        self._pool = None
+
+    async def submit(self, text, **params):
+        if self._queue is None:
+            raise RuntimeError(f"{self.name} 推理服务未启动")
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((text, params, future, time.perf_counter()))
+        except asyncio.QueueFull:
+            self.rejected_total += 1
+            raise InferenceBusy(f"{self.name} 推理队列已满")
+        self.requests_total += 1
+        return await future
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # 所有工作进程都忙时先不取请求，让队列里的请求攒成更大的批
+            await self._slots.acquire()
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            task = asyncio.create_task(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch):
+        loop = asyncio.get_running_loop()
+        try:
+            # 生成参数不同的请求不能放进同一次模型调用，按参数分组
+            groups = {}
+            for item in batch:
+                groups.setdefault(tuple(sorted(item[1].items())), []).append(item)
+            for key, items in groups.items():
+                items = [item for item in items if not item[2].cancelled()]
+                if not items:
+                    continue
+                self.batches_total += 1
+                self._batch_sizes.append(len(items))
+                started = time.perf_counter()
+                pool = self._pool
+                try:
+                    outputs = await loop.run_in_executor(
+                        pool, _run_batch, [item[0] for item in items], dict(key)
+                    )
+                except Exception as e:
+                    self.errors_total += 1
+                    for item in items:
+                        if not item[2].done():
+                            item[2].set_exception(e)
+                    if isinstance(e, BrokenProcessPool):
+                        # 只有正在执行的这一批失败，之后的请求进入新的进程池
+                        self._restart_pool(pool)
+                    continue
+                now = time.perf_counter()
+                metrics.INFERENCE_BATCH_TIME.observe(now - started, self.name)
+                for item, output in zip(items, outputs):
+                    self._latencies.append(now - item[3])
+                    metrics.INFERENCE_LATENCY.observe(now - item[3], self.name)
+                    if not item[2].done():
+                        item[2].set_result(output)
+        finally:
+            self._slots.release()
+
+    def metrics(self):
+        latencies = sorted(self._latencies)
+        sizes = list(self._batch_sizes)
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 2)
+
+        return {
+            "model": self.model_name,
+            "warm": self.warm,
+            "warmup_seconds": self.warmup_seconds,
+            "workers": self.workers,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "queue_capacity": self.max_queue_size,
+            "requests_total": self.requests_total,
+            "rejected_total": self.rejected_total,
+            "errors_total": self.errors_total,
+            "restarts_total": self.restarts_total,
+            "batches_total": self.batches_total,
+            "avg_batch_size": round(sum(sizes) / len(sizes), 2) if sizes else None,
+            "max_batch_size": self.max_batch_size,
+            "latency_ms": {"p50": percentile(0.5), "p95": percentile(0.95), "p99": percentile(0.99)},
+        }
+
+
+def create_summarizer_service():
+    return BatchingWorker(
+        "summarizer",
+        SUMMARIZER_MODEL,
+        load_summarizer,
+        run_summarizer,
+        workers=SUMMARIZER_WORKERS,
+        max_batch_size=SUMMARIZER_MAX_BATCH,
+        max_wait_ms=SUMMARIZER_MAX_WAIT_MS,
+        max_queue_size=SUMMARIZER_QUEUE_SIZE,
+    )
+
+
+def create_transcriber_service():
+    return BatchingWorker(
+        "transcriber",
+        ASR_MODEL,
+        load_transcriber,
+        run_transcriber,
+        workers=ASR_WORKERS,
+        max_batch_size=ASR_MAX_BATCH,
+        max_wait_ms=ASR_MAX_WAIT_MS,
+        max_queue_size=ASR_QUEUE_SIZE,
+    )
@@ -0,0 +1,115 @@
+# backend/keywords.py
+# 关键词提取（KeyBERT 的做法）：候选词来自 jieba 分词（单词和相邻两词组成的短语，中文不依赖空格切分），
+# 文档和候选词用与语义搜索共用的向量模型（vector_index.get_model）编码，按余弦相似度取前 top_n 个。
+# 多篇文档一起处理时，文档向量一次批量编码，所有文档的候选词去重后再一次批量编码。结果经 ai_cache 缓存。
+import os
+import re
+from collections import Counter
+import numpy as np
+import ai_cache
+import metrics
+import vector_index
+
+# 每篇文档最多取多少个候选词（按词频），限制编码量
+KEYWORD_MAX_CANDIDATES = int(os.getenv("KEYWORD_MAX_CANDIDATES", "64"))
+# 只从正文前这么多字中抽取候选词
+KEYWORD_MAX_CHARS = int(os.getenv("KEYWORD_MAX_CHARS", "5000"))
+# 一次编码的文档数上限，更大的批次分组处理
+KEYWORD_BATCH_SIZE = int(os.getenv("KEYWORD_BATCH_SIZE", "256"))
+# 批量接口单次请求的文档数上限
+KEYWORD_BATCH_MAX_ITEMS = int(os.getenv("KEYWORD_BATCH_MAX_ITEMS", "1000"))
+
+STOPWORDS = frozenset(
+    "的 了 和 是 在 我 有 也 就 都 而 及 与 着 或 又 很 还 被 把 让 对 从 到 这 那 之 其 "
+    "一个 一些 没有 我们 你们 他们 她们 它们 这个 那个 这些 那些 以及 因为 所以 但是 然后 如果 可以 进行 "
+    "the an of to and in for on with is are was were be been this that it its as at by from or not but "
+    "we you they he she our your their has have had do does did will would can could should".split()
+)
+_WORD = re.compile(r"^[\w一-鿿]+$")
+_CJK = re.compile(r"[一-鿿]")
+
+
+def _is_word(token: str) -> bool:
+    return len(token) >= 2 and token not in STOPWORDS and not token.isdigit() and bool(_WORD.match(token))
+
+
+def _join(left: str, right: str) -> str:
+    # 中文词直接相连，含英文时用空格分隔
+    return left + right if _CJK.search(left[-1]) and _CJK.search(right[0]) else f"{left} {right}"
+
+
+def candidates(content: str, max_candidates: int = KEYWORD_MAX_CANDIDATES) -> list:
+    # 按词频（相同时按首次出现的位置）取前 max_candidates 个单词和两词短语
+    import jieba
+    tokens = [tok.strip() for tok in jieba.cut(content[:KEYWORD_MAX_CHARS].lower())]
+    counts = Counter()
+    previous = None
+    for tok in tokens:
+        if not tok:
+            continue
+        if _is_word(tok):
+            counts[tok] += 1
+            if previous:
+                counts[_join(previous, tok)] += 1
+            previous = tok
+        else:
+            previous = None
+    return [word for word, _ in counts.most_common(max_candidates)]
+
+
+def extract_batch(contents: list, top_n: int) -> list:
+    # 返回每篇文档的 [(关键词, 相似度)]，按相似度从高到低
+    results = []
+    for start in range(0, len(contents), KEYWORD_BATCH_SIZE):
+        docs = contents[start:start + KEYWORD_BATCH_SIZE]
+        doc_candidates = [candidates(doc) for doc in docs]
+        vocabulary = {}
+        for words in doc_candidates:
+            for word in words:
+                vocabulary.setdefault(word, len(vocabulary))
+        if not vocabulary:
+            results.extend([] for _ in docs)
+            continue
+        with metrics.section("keywords"):
+            doc_vectors = vector_index.embed([doc[:vector_index.EMBED_MAX_CHARS] for doc in docs])
+            word_vectors = vector_index.embed(list(vocabulary))
+        for doc_vector, words in zip(doc_vectors, doc_candidates):
+            if not words:
+                results.append([])
+                continue
+            scores = word_vectors[[vocabulary[word] for word in words]] @ doc_vector
+            top = np.argsort(-scores, kind="stable")[:top_n]
+            results.append([(words[i], round(float(scores[i]), 4)) for i in top])
+    return results
+
+
+def warm_up():
+    # 加载共享的向量模型并跑一条输入，让首个关键词请求不承担加载开销
+    extract_batch(["关键词模型预热 warm up keyword model"], 1)
+
+
+def _cache_key(content: str, top_n: int) -> str:
+    return ai_cache.make_key("keywords", vector_index.EMBEDDING_MODEL, content, top_n=top_n)
+
+
+def extract_keyword_names(content: str, top_n: int, cache) -> list:
+    return extract_keyword_names_batch([content], top_n, cache)[0]
+
+
+def extract_keyword_names_batch(contents: list, top_n: int, cache) -> list:
+    # 相同内容、模型和参数的结果直接从缓存返回；未命中的文档合并成一批提取
+    results = [None] * len(contents)
+    pending = []
+    for i, content in enumerate(contents):
+        cached = cache.get(_cache_key(content, top_n))
+        if cached is not None:
+            results[i] = cached
+        else:
+            pending.append(i)
+    if pending:
+        extracted = extract_batch([contents[i] for i in pending], top_n)
+        for i, doc_keywords in zip(pending, extracted):
+            names = [word for word, _ in doc_keywords]
+            cache.set(_cache_key(contents[i], top_n), names)
+            results[i] = names
+    return results
@@ -0,0 +1,270 @@
+# backend/load_test.py
+# 并发压测：在临时目录的 SQLite 库上进程内启动应用，统计吞吐、延迟和失败数。
+#
+#   python load_test.py                     # 读写混合：笔记列表 + 更新笔记
+#   python load_test.py --compare           # 读写混合，分别以默认配置和调优配置各跑一次并对比
+#   python load_test.py --scenario login    # 登录洪峰期间普通读接口的延迟（先空载再加登录压力）
+#   python load_test.py --scenario revisions  # 同一笔记编辑 --edits 次后的历史版本存储量和还原延迟
+#   python load_test.py --scenario autosave   # 多人同时编辑的自动保存：逐次 PUT 与合并写入的 PATCH 对比
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+BASELINE_ENV = {"DB_SQLITE_TUNING": "0", "DB_ASYNC": "0", "DB_BUSY_TIMEOUT_MS": "5000"}
+TUNED_ENV = {"DB_SQLITE_TUNING": "1", "DB_ASYNC": "1", "DB_BUSY_TIMEOUT_MS": "5000"}
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * p))] * 1000, 2)
+
+
+def summarize(bucket, duration):
+    return {
+        "ok": bucket["ok"],
+        "failed": bucket["failed"],
+        "per_sec": round(bucket["ok"] / duration, 1),
+        "p50_ms": percentile(bucket["latencies"], 0.5),
+        "p99_ms": percentile(bucket["latencies"], 0.99),
+    }
+
+
+def new_bucket():
+    return {"ok": 0, "failed": 0, "latencies": []}
+
+
+async def timed(bucket, request, ok_statuses=(200,)):
+    start = time.perf_counter()
+    r = await request
+    bucket["latencies"].append(time.perf_counter() - start)
+    bucket["ok" if r.status_code in ok_statuses else "failed"] += 1
+    return r
+
+
+async def seed(client, notes):
+    await client.post("/register", json={"username": "load", "password": "load"})
+    r = await client.post("/login", json={"username": "load", "password": "load"})
+    client.headers["Authorization"] = f"Bearer {r.json()['access_token']}"
+    note_ids = []
+    for i in range(notes):
+        r = await client.post("/notes/", json={"title": f"笔记{i}", "content": "内容 " * 50, "username": "load"})
+        note_ids.append(r.json()["id"])
+    return note_ids
+
+
+async def read_write_scenario(client, args):
+    note_ids = await seed(client, args.notes)
+    stats = {"read": new_bucket(), "write": new_bucket()}
+    deadline = time.perf_counter() + args.duration
+
+    async def reader():
+        while time.perf_counter() < deadline:
+            await timed(stats["read"], client.get("/notes/load/list", params={"limit": 50}))
+
+    async def writer(worker):
+        i = 0
+        while time.perf_counter() < deadline:
+            note_id = note_ids[(worker * 7919 + i) % len(note_ids)]
+            i += 1
+            await timed(stats["write"], client.put(f"/notes/{note_id}", json={
+                "title": f"笔记{note_id}", "content": f"修改 {i} " * 50, "username": "load"
+            }))
+
+    await asyncio.gather(*[reader() for _ in range(args.readers)], *[writer(w) for w in range(args.writers)])
+    return {kind: summarize(bucket, args.duration) for kind, bucket in stats.items()}
+
+
+async def login_scenario(client, args):
+    # 第一阶段只有读请求；第二阶段同时有 args.logins 个并发登录循环，对比读接口 p99
+    await seed(client, args.notes)
+    report = {}
+    for phase, logins in (("idle", 0), ("login_storm", args.logins)):
+        reads, login_stats = new_bucket(), new_bucket()
+        login_stats["throttled"] = 0
+        deadline = time.perf_counter() + args.duration
+
+        async def reader():
+            while time.perf_counter() < deadline:
+                await timed(reads, client.get("/notes/load/list", params={"limit": 50}))
+
+        async def login_loop():
+            while time.perf_counter() < deadline:
+                r = await timed(login_stats, client.post(
+                    "/login", json={"username": "load", "password": "load"}
+                ))
+                # 429 表示密码计算队列已满被快速拒绝
+                if r.status_code == 429:
+                    login_stats["throttled"] += 1
+                    await asyncio.sleep(0.05)
+
+        await asyncio.gather(*[reader() for _ in range(args.readers)], *[login_loop() for _ in range(logins)])
+        report[phase] = {"read": summarize(reads, args.duration)}
+        if logins:
+            report[phase]["login"] = dict(summarize(login_stats, args.duration), throttled=login_stats["throttled"])
+    return report
+
+
+async def revisions_scenario(client, args):
+    # 约5KB、100段的笔记，每次在随机一段末尾追加几个字，模拟自动保存
+    from sqlalchemy import func
+    from models import SessionLocal, NoteRevision
+
+    await seed(client, 0)
+    rng = random.Random(0)
+    lines = [f"第{i}段：" + "记录一些内容。" * 6 for i in range(100)]
+    r = await client.post("/notes/", json={"title": "历史版本", "content": "\n".join(lines), "username": "load"})
+    note_id = r.json()["id"]
+    writes, reads = new_bucket(), new_bucket()
+    full_copy_bytes = 0
+    start = time.perf_counter()
+    for i in range(args.edits):
+        k = rng.randrange(len(lines))
+        lines[k] += f"修改{i}"
+        content = "\n".join(lines)
+        full_copy_bytes += len(content.encode("utf-8"))
+        await timed(writes, client.put(f"/notes/{note_id}", json={"title": "历史版本", "content": content, "username": "load"}))
+    write_seconds = time.perf_counter() - start
+
+    db = SessionLocal()
+    try:
+        kept, stored = db.query(func.count(NoteRevision.id), func.sum(func.length(NoteRevision.data))).filter(
+            NoteRevision.note_id == note_id
+        ).one()
+        revs = [rev for (rev,) in db.query(NoteRevision.rev).filter(NoteRevision.note_id == note_id).all()]
+    finally:
+        db.close()
+    start = time.perf_counter()
+    for rev in rng.sample(revs, min(len(revs), 100)):
+        await timed(reads, client.get(f"/notes/{note_id}/revisions/{rev}"))
+    return {
+        "edits": args.edits,
+        "revisions_kept": kept,
+        "stored_bytes": stored,
+        "full_copy_bytes": full_copy_bytes,
+        "note_bytes": len(content.encode("utf-8")),
+        "save": summarize(writes, write_seconds),
+        "reconstruct": summarize(reads, time.perf_counter() - start),
+    }
+
+
+async def autosave_scenario(client, args):
+    # --editors 个编辑器各编辑一篇约2KB的笔记，每隔 --interval 秒自动保存一次（追加几个字）；
+    # 先用 PUT 逐次写入，再用 PATCH 延迟合并写入，对比保存延迟和每秒写事务数，最后核对最终内容没有丢失
+    from sqlalchemy import event
+    import main
+    from models import SessionLocal, Note
+
+    commits = [0]
+    event.listen(main.engine, "commit", lambda conn: commits.__setitem__(0, commits[0] + 1))
+    await seed(client, 0)
+    report = {}
+    for mode in ("put", "patch"):
+        note_ids = []
+        for i in range(args.editors):
+            r = await client.post("/notes/", json={"title": f"编辑器{i}", "content": "草稿内容。" * 400, "username": "load"})
+            note_ids.append(r.json()["id"])
+        latest = {}
+        saves = new_bucket()
+        deadline = time.perf_counter() + args.duration
+
+        async def editor(note_id):
+            content = "草稿内容。" * 400
+            await asyncio.sleep(random.random() * args.interval)
+            while time.perf_counter() < deadline:
+                content += f"第{len(content)}字"
+                latest[note_id] = content
+                if mode == "put":
+                    await timed(saves, client.put(f"/notes/{note_id}", json={
+                        "title": f"编辑器{note_id}", "content": content, "username": "load"
+                    }))
+                else:
+                    await timed(saves, client.patch(f"/notes/{note_id}", json={"content": content}), ok_statuses=(202,))
+                await asyncio.sleep(args.interval)
+
+        commits[0] = 0
+        start = time.perf_counter()
+        await asyncio.gather(*[editor(note_id) for note_id in note_ids])
+        await asyncio.to_thread(main.autosave_writer.flush)
+        elapsed = time.perf_counter() - start
+        db = SessionLocal()
+        try:
+            stored = dict(db.query(Note.id, Note.content).filter(Note.id.in_(note_ids)).all())
+        finally:
+            db.close()
+        report[mode] = {
+            "save": summarize(saves, elapsed),
+            "write_tx_per_sec": round(commits[0] / elapsed, 1),
+            "lost": sum(1 for note_id, content in latest.items() if stored.get(note_id) != content),
+        }
+    return report
+
+
+async def run(args):
+    import httpx
+    import main
+
+    transport = httpx.ASGITransport(app=main.app, raise_app_exceptions=False)
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest") as client:
+            if args.scenario == "login":
+                stats = await login_scenario(client, args)
+            elif args.scenario == "revisions":
+                stats = await revisions_scenario(client, args)
+            elif args.scenario == "autosave":
+                stats = await autosave_scenario(client, args)
+            else:
+                stats = await read_write_scenario(client, args)
+    return dict({"config": {k: os.getenv(k) for k in TUNED_ENV}}, **stats)
+
+
+def run_in_subprocess(env_overrides, argv):
+    env = dict(os.environ, **env_overrides)
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--json", *argv],
+        env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="数据库读写并发压测")
+    parser.add_argument("--notes", type=int, default=500)
+    parser.add_argument("--readers", type=int, default=16)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--scenario", choices=["rw", "login", "revisions", "autosave"], default="rw")
+    parser.add_argument("--logins", type=int, default=64, help="login 场景下的并发登录数")
+    parser.add_argument("--edits", type=int, default=1000, help="revisions 场景下的编辑次数")
+    parser.add_argument("--editors", type=int, default=32, help="autosave 场景下同时编辑的笔记数")
+    parser.add_argument("--interval", type=float, default=0.2, help="autosave 场景下每个编辑器的保存间隔（秒）")
+    parser.add_argument("--compare", action="store_true", help="对比默认配置与调优配置")
+    parser.add_argument("--json", action="store_true", help="只输出一行JSON")
+    args = parser.parse_args()
+
+    if args.compare:
+        argv = ["--notes", str(args.notes), "--readers", str(args.readers),
+                "--writers", str(args.writers), "--duration", str(args.duration)]
+        for name, env in (("baseline", BASELINE_ENV), ("tuned", TUNED_ENV)):
+            report = run_in_subprocess(env, argv)
+            print(f"[{name}] " + json.dumps(report, ensure_ascii=False))
+        return
+
+    # 每次压测使用独立的临时数据库，不影响 test.db
+    workdir = tempfile.mkdtemp(prefix="ai-notes-load-")
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(workdir, 'load.db')}")
+    os.environ.setdefault("AI_CACHE_PATH", os.path.join(workdir, "ai_cache.db"))
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    report = asyncio.run(run(args))
+    print(json.dumps(report, ensure_ascii=False) if args.json else json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main_cli()
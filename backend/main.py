@@ -1,22 +1,107 @@
 # backend/main.py
-from fastapi import FastAPI, Depends, HTTPException, File, UploadFile, Query
+from fastapi import FastAPI, Depends, HTTPException, File, UploadFile, Query, Request, Header, Response
 from fastapi.middleware.cors import CORSMiddleware
-from models import User, Note, Tag, Folder, SessionLocal, init_db, Base, calculate_similarity
-from sqlalchemy.orm import Session
-from passlib.context import CryptContext
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
+from models import User, Note, Tag, Folder, AITagJob, SessionLocal, AsyncSessionLocal, async_engine, init_db, Base, engine, note_tags, calculate_similarity, similarity_tokens
+import search_index
+import folder_tree
+import inference
+import summarization
+import ai_cache
+import keywords
+import ai_tag_jobs
+import tag_service
+import vector_index
+import passwords
+import auth
+import note_io
+import transcription
+import sync_log
+import revisions
+import duplicates
+import note_counts
+import note_body
+import autosave
+import metrics
+import startup
+from sqlalchemy.orm import Session, joinedload, selectinload, undefer
 from pydantic import BaseModel
 from datetime import datetime
 from typing import List, Optional
-from sqlalchemy import or_
-import jieba
-from difflib import SequenceMatcher
+from contextlib import asynccontextmanager
+import json
+import os
+from sqlalchemy import or_, and_, func, update, case, type_coerce, String
+from sqlalchemy.exc import IntegrityError
+import asyncio
+import time
 # import librosa
 # import soundfile as sf
 # import numpy as np
 # from transformers import pipeline
 # import pytz
 
-app = FastAPI()
+summarizer_service = inference.create_summarizer_service()
+transcriber_service = inference.create_transcriber_service()
+result_cache = ai_cache.AICache()
+tag_job_manager = ai_tag_jobs.AITagJobManager(SessionLocal, result_cache)
+autosave_writer = autosave.AutosaveWriter(SessionLocal)
+profiler = metrics.create_profiler()
+capabilities = startup.Capabilities()
+capabilities.declare("core")
+capabilities.declare("jieba")
+capabilities.declare("summarizer", startup.SUMMARIZER_ENABLED)
+capabilities.declare("transcriber", startup.ASR_ENABLED)
+capabilities.declare("keywords", startup.KEYWORDS_ENABLED)
+capabilities.declare("embeddings", startup.EMBEDDINGS_ENABLED)
+
+def prepare_database():
+    init_db()
+    search_index.init_search_index(engine)
+    sync_log.backfill(engine)
+    note_counts.backfill(engine)
+
+async def start_service(service):
+    # 拉起进程池会同步创建子进程，放在后台任务中，不推迟开始服务的时间
+    await service.start()
+    await service.wait_warm()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 核心阶段：建表和索引，完成后即开始服务；模型进程池和其他能力在后台加载、预热
+    auth.warn_if_secret_missing()
+    await run_in_threadpool(prepare_database)
+    capabilities.set("core", startup.READY)
+    concurrent = []
+    if startup.SUMMARIZER_ENABLED:
+        concurrent.append(("summarizer", lambda: start_service(summarizer_service)))
+    if startup.ASR_ENABLED:
+        concurrent.append(("transcriber", lambda: start_service(transcriber_service)))
+    if startup.KEYWORDS_ENABLED:
+        tag_job_manager.start()
+    if profiler:
+        profiler.start()
+    sequential = [
+        ("jieba", lambda: run_in_threadpool(search_index.warm_up)),
+        ("keywords", lambda: run_in_threadpool(keywords.warm_up)),
+        ("embeddings", lambda: run_in_threadpool(vector_index.warm_up)),
+    ]
+    warmup = asyncio.create_task(startup.warm_up(capabilities, sequential, concurrent))
+    yield
+    warmup.cancel()
+    await asyncio.gather(warmup, return_exceptions=True)
+    if profiler:
+        profiler.stop()
+    # 先写完自动保存的待写改动
+    await run_in_threadpool(autosave_writer.shutdown)
+    tag_job_manager.shutdown()
+    await summarizer_service.stop()
+    await transcriber_service.stop()
+    password_hasher.shutdown()
+    result_cache.close()
+
+app = FastAPI(lifespan=lifespan)
 
 # CORS中间件
 app.add_middleware(
@@ -25,11 +110,28 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
+# 请求延迟、SQL 条数/耗时统计（/metrics），慢请求采样分析
+app.add_middleware(metrics.MetricsMiddleware, profiler=profiler)
+
+metrics.instrument_engine(engine)
+if async_engine is not None:
+    metrics.instrument_engine(async_engine.sync_engine)
 
-init_db()
+password_hasher = passwords.PasswordHasher()
+login_throttle = passwords.LoginThrottle()
+user_cache = auth.UserCache()
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+def require_capability(name: str, reject_warming: bool = True):
+    # 被配置关闭的功能返回 503；模型仍在预热时也返回 503 让客户端稍后重试，而不是挂住请求直到超时
+    # （后台任务类接口传 reject_warming=False，任务会等模型加载完成后再执行）
+    state = capabilities.state(name)
+    if state == startup.DISABLED:
+        raise HTTPException(status_code=503, detail=f"{startup.LABELS[name]}功能未在此实例上启用")
+    if reject_warming and state in (startup.PENDING, startup.WARMING):
+        raise HTTPException(status_code=503, detail=f"{startup.LABELS[name]}模型正在加载，请稍后重试",
+                            headers={"Retry-After": "5"})
 
 # 添加缺失的 get_db 函数
 def get_db():
@@ -39,6 +141,61 @@ def get_db():
     finally:
         db.close()
 
+async def run_db(fn, *args):
+    # 在异步接口中执行同步的查询函数 fn(db, *args)：
+    # 有异步引擎时跑在异步连接上（run_sync），否则放进线程池用同步会话执行
+    if AsyncSessionLocal is not None:
+        async with AsyncSessionLocal() as session:
+            return await session.run_sync(fn, *args)
+
+    def call():
+        db = SessionLocal()
+        try:
+            return fn(db, *args)
+        finally:
+            db.close()
+    return await run_in_threadpool(call)
+
+def query_user(db: Session, user_id: int):
+    row = db.query(User.id, User.username, User.hashed_password).filter(User.id == user_id).first()
+    return auth.CurrentUser(row.id, row.username, auth.password_version(row.hashed_password)) if row else None
+
+# 从 Authorization: Bearer <token> 解析当前用户；用户信息走缓存，命中时不查数据库
+async def get_current_user(authorization: Optional[str] = Header(None)) -> auth.CurrentUser:
+    claims = auth.verify_token(auth.bearer_token(authorization) or "")
+    if not claims:
+        raise HTTPException(status_code=401, detail="未登录或登录已过期", headers={"WWW-Authenticate": "Bearer"})
+    user = user_cache.get(claims["uid"])
+    if user is None:
+        user = await run_db(query_user, claims["uid"])
+        if user is None:
+            raise HTTPException(status_code=401, detail="用户不存在", headers={"WWW-Authenticate": "Bearer"})
+        user_cache.set(user)
+    # 修改密码后签发的旧令牌作废
+    if claims.get("pwv") != user.password_version:
+        raise HTTPException(status_code=401, detail="未登录或登录已过期", headers={"WWW-Authenticate": "Bearer"})
+    return user
+
+# 路径或查询参数中的 username 必须与令牌中的用户一致
+async def get_request_user(username: str, current_user: auth.CurrentUser = Depends(get_current_user)) -> auth.CurrentUser:
+    if username != current_user.username:
+        raise HTTPException(status_code=403, detail="无权访问其他用户的数据")
+    return current_user
+
+def check_body_user(username: Optional[str], current_user: auth.CurrentUser):
+    if username and username != current_user.username:
+        raise HTTPException(status_code=403, detail="无权访问其他用户的数据")
+
+# 列表接口的 ETag：用户数据版本（最大同步游标）和请求参数都没变时直接返回 304
+def check_etag(db: Session, request: Request, response: Response, user_id: int) -> Optional[Response]:
+    version = sync_log.current_version(db, user_id)
+    etag = sync_log.make_etag(user_id, version, request.url.path, request.url.query)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if sync_log.etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
 # 移除全局import和全局模型加载
 # import librosa
 # import soundfile as sf
@@ -70,12 +227,24 @@ class NoteUpdate(BaseModel):
     username: str
     folder_id: Optional[int] = None  # 修正
 
+class NotePatch(BaseModel):
+    # 只传需要修改的字段；folder_id 显式传 null 表示移出文件夹
+    title: Optional[str] = None
+    content: Optional[str] = None
+    folder_id: Optional[int] = None
+    username: Optional[str] = None
+
 class ContentRequest(BaseModel):
     content: str
     top_n: int = 5
     max_length: int = 150
     min_length: int = 30
 
+class KeywordBatchRequest(BaseModel):
+    contents: List[str] = []
+    note_ids: List[int] = []
+    top_n: int = 5
+
 class TagCreate(BaseModel):
     name: str
     color: str = "#409eff"
@@ -102,38 +271,95 @@ class NoteWithTags(BaseModel):
     class Config:
         from_attributes = True
 
+class AITagJobCreate(BaseModel):
+    top_n: int = 5
+
+class BatchTagRequest(BaseModel):
+    note_ids: List[int]
+    tag_names: List[str]
+    replace: bool = False
+
 class ChangePasswordRequest(BaseModel):
     username: str
     old_password: str
     new_password: str
 
+def query_password_hash(db: Session, username: str):
+    row = db.query(User.hashed_password).filter(User.username == username).first()
+    return row[0] if row else None
+
+def query_login(db: Session, username: str):
+    return db.query(User.id, User.hashed_password).filter(User.username == username).first()
+
+def query_user_id(db: Session, username: str):
+    row = db.query(User.id).filter(User.username == username).first()
+    return row[0] if row else None
+
+def save_password_hash(db: Session, username: str, hashed_password: str):
+    db.query(User).filter(User.username == username).update({User.hashed_password: hashed_password})
+    db.commit()
+
+def insert_user(db: Session, username: str, hashed_password: str) -> bool:
+    db.add(User(username=username, hashed_password=hashed_password))
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return False
+    return True
+
+def client_ip(request: Request) -> str:
+    return request.client.host if request.client else "unknown"
+
+async def hash_or_429(coro):
+    # 密码计算队列已满时快速失败，而不是无限排队
+    try:
+        return await coro
+    except passwords.HashingBusy:
+        raise HTTPException(status_code=429, detail="服务繁忙，请稍后重试", headers={"Retry-After": "1"})
+
+def check_login_throttle(username: str, ip: str):
+    wait = login_throttle.retry_after(username, ip)
+    if wait:
+        raise HTTPException(status_code=429, detail="尝试次数过多，请稍后再试", headers={"Retry-After": str(wait)})
+
 # 用户注册
 @app.post("/register")
-def register(user: UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.username == user.username).first()
-    if db_user:
+async def register(user: UserCreate):
+    if await run_db(query_password_hash, user.username) is not None:
+        raise HTTPException(status_code=400, detail="用户名已存在")
+    hashed_password = await hash_or_429(password_hasher.hash(user.password))
+    if not await run_db(insert_user, user.username, hashed_password):
         raise HTTPException(status_code=400, detail="用户名已存在")
-    hashed_password = pwd_context.hash(user.password)
-    new_user = User(username=user.username, hashed_password=hashed_password)
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
     return {"message": "注册成功"}
 
-# 用户登录
+# 用户登录（bcrypt在进程池中校验；失败过多按用户名/IP限流；哈希参数变化时透明重新哈希），返回访问令牌
 @app.post("/login")
-def login(user: UserLogin, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.username == user.username).first()
-    if not db_user or not pwd_context.verify(user.password, db_user.hashed_password):
+async def login(user: UserLogin, request: Request):
+    ip = client_ip(request)
+    check_login_throttle(user.username, ip)
+    row = await run_db(query_login, user.username)
+    verified, new_hash = False, None
+    if row and row.hashed_password:
+        verified, new_hash = await hash_or_429(password_hasher.verify_and_update(user.password, row.hashed_password))
+    if not verified:
+        login_throttle.record_failure(user.username, ip)
         raise HTTPException(status_code=400, detail="用户名或密码错误")
-    return {"message": "登录成功"}
+    login_throttle.record_success(user.username)
+    if new_hash:
+        await run_db(save_password_hash, user.username, new_hash)
+    current_user = auth.CurrentUser(row.id, user.username, auth.password_version(new_hash or row.hashed_password))
+    user_cache.set(current_user)
+    return {
+        "message": "登录成功",
+        "access_token": auth.create_token(current_user),
+        "token_type": "bearer",
+    }
 
 # 创建笔记
 @app.post("/notes/")
-def create_note(note: NoteCreate, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == note.username).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="用户不存在")
+def create_note(note: NoteCreate, user: auth.CurrentUser = Depends(get_current_user), db: Session = Depends(get_db)):
+    check_body_user(note.username, user)
     
     # 检查文件夹是否存在
     folder_id = note.folder_id
@@ -149,8 +375,14 @@ def create_note(note: NoteCreate, db: Session = Depends(get_db)):
         folder_id=folder_id
     )
     db.add(db_note)
+    search_index.index_note(db, db_note)
+    duplicates.index_note(db, db_note)
+    revisions.record(db, db_note)
+    note_counts.add_notes(db, user.id, [folder_id])
+    sync_log.touch(db, user.id, sync_log.NOTE, [db_note.id])
     db.commit()
     db.refresh(db_note)
+    vector_index.mark_dirty(user.id, db_note.id)
     
     # 获取文件夹名称
     folder_name = None
@@ -161,7 +393,8 @@ def create_note(note: NoteCreate, db: Session = Depends(get_db)):
     return {
         "id": db_note.id,
         "title": db_note.title,
-        "content": db_note.content,
+        # 正文不随 refresh 重新加载，直接返回请求中的内容
+        "content": note.content,
         "updated_at": db_note.updated_at,
         "folder_id": folder_id,
         "folder_name": folder_name,
@@ -169,52 +402,145 @@ def create_note(note: NoteCreate, db: Session = Depends(get_db)):
     }
 
 # 获取笔记
+def note_to_dict(note: Note) -> dict:
+    return {
+        "id": note.id,
+        "title": note.title,
+        "content": note.content,
+        "updated_at": note.updated_at,
+        "folder_id": note.folder_id,
+        "folder_name": note.folder.name if note.folder else None,
+        "tags": [tag.name for tag in note.tags]
+    }
+
+def query_notes(db: Session, user_id: int):
+    # 文件夹用JOIN、标签用一次IN查询批量加载，避免每条笔记各查一次
+    notes = db.query(Note).options(
+        undefer(Note.content),
+        joinedload(Note.folder),
+        selectinload(Note.tags)
+    ).filter(Note.user_id == user_id).all()
+    return [note_to_dict(note) for note in notes]
+
 @app.get("/notes/{username}")
-def get_notes(username: str, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == username).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="用户不存在")
-    notes = db.query(Note).filter(Note.user_id == user.id).all()
-    result = []
-    for note in notes:
-        # 获取文件夹信息
-        folder_name = None
-        if note.folder_id:
-            folder = db.query(Folder).filter(Folder.id == note.folder_id).first()
-            folder_name = folder.name if folder else None
-        
-        note_data = {
-            "id": note.id,
-            "title": note.title,
-            "content": note.content,
-            "updated_at": note.updated_at,
-            "folder_id": note.folder_id,
-            "folder_name": folder_name,
-            "tags": [tag.name for tag in note.tags] if note.tags else []
+async def get_notes(request: Request, response: Response, user: auth.CurrentUser = Depends(get_request_user)):
+    not_modified = await run_db(check_etag, request, response, user.id)
+    if not_modified:
+        return not_modified
+    return await run_db(query_notes, user.id)
+
+SNIPPET_LENGTH = 120
+
+def encode_cursor(updated_at: datetime, note_id: int) -> str:
+    return f"{updated_at.isoformat()}_{note_id}"
+
+def decode_cursor(cursor: str):
+    try:
+        updated_at, note_id = cursor.rsplit("_", 1)
+        return datetime.fromisoformat(updated_at), int(note_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+
+def load_tag_names(db: Session, note_ids: List[int]) -> dict:
+    # 一次查询取出一批笔记的全部标签名：{note_id: [tag_name, ...]}
+    tag_map = {note_id: [] for note_id in note_ids}
+    if not note_ids:
+        return tag_map
+    rows = db.query(note_tags.c.note_id, Tag.name).join(
+        Tag, Tag.id == note_tags.c.tag_id
+    ).filter(note_tags.c.note_id.in_(note_ids)).all()
+    for note_id, tag_name in rows:
+        tag_map[note_id].append(tag_name)
+    return tag_map
+
+# 分页获取笔记列表（按 (updated_at, id) 倒序的游标分页；fields=summary 时只返回摘要片段）
+def query_note_page(db: Session, user_id: int, cursor: Optional[str], limit: int, fields: str, folder_id: Optional[int]):
+    if fields == "full":
+        body_column = Note.content.label("content")
+    else:
+        # 原文直接在SQL中截取；压缩存储的正文（BLOB）原样取出，只解压开头一段
+        body_column = type_coerce(case(
+            (func.typeof(Note.content) == "blob", Note.content),
+            else_=func.substr(Note.content, 1, SNIPPET_LENGTH),
+        ), String).label("snippet")
+    
+    query = db.query(
+        Note.id, Note.title, body_column, Note.updated_at, Note.folder_id, Folder.name.label("folder_name")
+    ).outerjoin(Folder, Folder.id == Note.folder_id).filter(Note.user_id == user_id)
+    if folder_id is not None:
+        query = query.filter(Note.folder_id == folder_id)
+    if cursor:
+        cursor_updated_at, cursor_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            Note.updated_at < cursor_updated_at,
+            and_(Note.updated_at == cursor_updated_at, Note.id < cursor_id)
+        ))
+    # 多取一条用来判断是否还有下一页
+    rows = query.order_by(Note.updated_at.desc(), Note.id.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    
+    tag_map = load_tag_names(db, [row.id for row in rows])
+    items = []
+    for row in rows:
+        item = {
+            "id": row.id,
+            "title": row.title,
+            "updated_at": row.updated_at,
+            "folder_id": row.folder_id,
+            "folder_name": row.folder_name,
+            "tags": tag_map[row.id]
         }
-        result.append(note_data)
-    return result
+        if fields == "full":
+            item["content"] = row.content
+        else:
+            item["snippet"] = note_body.snippet(row.snippet, SNIPPET_LENGTH)
+        items.append(item)
+    
+    next_cursor = encode_cursor(rows[-1].updated_at, rows[-1].id) if has_more else None
+    return {"items": items, "next_cursor": next_cursor, "has_more": has_more}
+
+@app.get("/notes/{username}/list")
+async def list_notes(
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    fields: str = Query("summary", pattern="^(summary|full)$"),
+    folder_id: Optional[int] = None,
+    user: auth.CurrentUser = Depends(get_request_user),
+):
+    not_modified = await run_db(check_etag, request, response, user.id)
+    if not_modified:
+        return not_modified
+    return await run_db(query_note_page, user.id, cursor, limit, fields, folder_id)
 
 # 删除笔记
 @app.delete("/notes/{note_id}")
-def delete_note(note_id: int, username: str, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == username).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="用户不存在")
+def delete_note(note_id: int, user: auth.CurrentUser = Depends(get_request_user), db: Session = Depends(get_db)):
+    # 丢弃尚未写入的自动保存改动，并等进行中的写入完成后再读取笔记
+    autosave_writer.settle(note_id, user.id)
     note = db.query(Note).filter(Note.id == note_id, Note.user_id == user.id).first()
     if not note:
         raise HTTPException(status_code=404, detail="笔记不存在或无权限删除")
+    search_index.remove_note(db, note.id)
+    vector_index.remove_note(db, user.id, note.id)
+    duplicates.remove_note(db, note.id)
+    note_counts.remove_note(db, user.id, note.id, note.folder_id)
+    sync_log.touch(db, user.id, sync_log.NOTE, [note.id], deleted=True)
+    revisions.remove_note(db, note.id)
     db.delete(note)
     db.commit()
     return {"message": "笔记已删除"}
 
 # 更新笔记
 @app.put("/notes/{note_id}")
-def update_note(note_id: int, note: NoteUpdate, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == note.username).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="用户不存在")
-    db_note = db.query(Note).filter(Note.id == note_id, Note.user_id == user.id).first()
+def update_note(note_id: int, note: NoteUpdate, user: auth.CurrentUser = Depends(get_current_user), db: Session = Depends(get_db)):
+    check_body_user(note.username, user)
+    # 这次写入取代尚未写入的自动保存改动；等进行中的写入完成后再读取笔记
+    autosave_writer.settle(note_id, user.id)
+    # 旧正文要用来生成历史版本，随笔记一起查出
+    db_note = db.query(Note).options(undefer(Note.content)).filter(Note.id == note_id, Note.user_id == user.id).first()
     if not db_note:
         raise HTTPException(status_code=404, detail="笔记不存在或无权限编辑")
     
@@ -225,179 +551,621 @@ def update_note(note_id: int, note: NoteUpdate, db: Session = Depends(get_db)):
         if not folder:
             raise HTTPException(status_code=404, detail="文件夹不存在")
     
+    previous_title, previous_content = db_note.title, db_note.content
+    note_counts.move_note(db, user.id, db_note.folder_id, folder_id)
     db_note.title = note.title
     db_note.content = note.content
     db_note.folder_id = folder_id
     db_note.updated_at = datetime.utcnow()
+    search_index.index_note(db, db_note)
+    duplicates.index_note(db, db_note)
+    revision = revisions.record(db, db_note, previous_title, previous_content)
+    sync_log.touch(db, user.id, sync_log.NOTE, [db_note.id])
     db.commit()
     db.refresh(db_note)
-    return {"message": "更新成功", "updated_at": db_note.updated_at}
+    vector_index.mark_dirty(user.id, db_note.id)
+    return {"message": "更新成功", "updated_at": db_note.updated_at, "revision": revision}
+
+# 部分更新笔记（自动保存）：只传变化的字段，改动合并后延迟批量写入，返回 202；
+# wait=true 时立即写入后再返回（如关闭编辑器前）
+@app.patch("/notes/{note_id}")
+def patch_note(note_id: int, note: NotePatch, response: Response, wait: bool = False,
+               user: auth.CurrentUser = Depends(get_current_user), db: Session = Depends(get_db)):
+    check_body_user(note.username, user)
+    changes = note.model_dump(exclude_unset=True, include=set(autosave.FIELDS))
+    if not changes:
+        raise HTTPException(status_code=400, detail="没有需要更新的字段")
+    if "title" in changes and changes["title"] is None or "content" in changes and changes["content"] is None:
+        raise HTTPException(status_code=400, detail="标题和正文不能为 null")
+    # 已有待写改动的笔记校验过归属，连续的自动保存不再查库
+    if autosave_writer.pending_owner(note_id) != user.id:
+        if not db.query(Note.id).filter(Note.id == note_id, Note.user_id == user.id).first():
+            raise HTTPException(status_code=404, detail="笔记不存在或无权限编辑")
+    if changes.get("folder_id"):
+        if not db.query(Folder.id).filter(Folder.id == changes["folder_id"], Folder.user_id == user.id).first():
+            raise HTTPException(status_code=404, detail="文件夹不存在")
+    entry = autosave_writer.submit(user.id, note_id, changes)
+    if not wait:
+        response.status_code = 202
+        return {"message": "已接收，稍后写入", "pending": True, "updated_at": entry.updated_at}
+    if not autosave_writer.save_now(entry):
+        if entry.error == autosave.SUPERSEDED:
+            raise HTTPException(status_code=409, detail=entry.error)
+        raise HTTPException(status_code=503, detail="保存失败，改动将稍后重试", headers={"Retry-After": "1"})
+    return {"message": "更新成功", "pending": False, "updated_at": entry.updated_at, "revision": entry.revision}
+
+# 笔记历史版本列表（新的在前；before 为上一页最后一个版本号）
+@app.get("/notes/{note_id}/revisions")
+def list_note_revisions(
+    note_id: int,
+    limit: int = Query(50, ge=1, le=200),
+    before: Optional[int] = None,
+    user: auth.CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    if not db.query(Note.id).filter(Note.id == note_id, Note.user_id == user.id).first():
+        raise HTTPException(status_code=404, detail="笔记不存在")
+    return revisions.list_revisions(db, note_id, limit, before)
 
-# AI摘要
+# 获取笔记的某个历史版本（由最近的快照依次应用差量还原）
+@app.get("/notes/{note_id}/revisions/{rev}")
+def get_note_revision(note_id: int, rev: int, user: auth.CurrentUser = Depends(get_current_user), db: Session = Depends(get_db)):
+    if not db.query(Note.id).filter(Note.id == note_id, Note.user_id == user.id).first():
+        raise HTTPException(status_code=404, detail="笔记不存在")
+    try:
+        return revisions.get_revision(db, note_id, rev)
+    except revisions.RevisionNotFound:
+        raise HTTPException(status_code=404, detail="该版本不存在或已被合并")
+
+# 与某篇笔记近似重复的笔记（MinHash 估计的正文相似度，由 LSH 分段索引查出候选）
+@app.get("/notes/{note_id}/similar")
+def get_similar_notes(
+    note_id: int,
+    threshold: float = Query(0.5, ge=0, le=1),
+    limit: int = Query(10, ge=1, le=100),
+    user: auth.CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    if not db.query(Note.id).filter(Note.id == note_id, Note.user_id == user.id).first():
+        raise HTTPException(status_code=404, detail="笔记不存在")
+    found = duplicates.similar_notes(db, user.id, note_id, threshold, limit)
+    notes = {note.id: note for note in db.query(Note.id, Note.title, Note.updated_at).filter(
+        Note.id.in_([similar_id for similar_id, _ in found])
+    )} if found else {}
+    return [
+        {"id": similar_id, "title": notes[similar_id].title, "updated_at": notes[similar_id].updated_at, "similarity": sim}
+        for similar_id, sim in found if similar_id in notes
+    ]
+
+# 用户笔记库中的近似重复笔记分组（导入、复制粘贴后常见）；每组第一篇为最早的笔记
+@app.get("/users/{username}/duplicates")
+def list_duplicate_notes(
+    request: Request,
+    response: Response,
+    threshold: float = Query(0.8, ge=0, le=1),
+    limit: int = Query(100, ge=1, le=1000),
+    user: auth.CurrentUser = Depends(get_request_user),
+    db: Session = Depends(get_db),
+):
+    # 全库按桶分组的代价与笔记数成正比，笔记没有变化时直接返回 304
+    not_modified = check_etag(db, request, response, user.id)
+    if not_modified:
+        return not_modified
+    groups = duplicates.duplicate_groups(db, user.id, threshold)
+    shown = groups[:limit]
+    notes = {note.id: note for note in db.query(Note.id, Note.title, Note.updated_at, Note.folder_id).filter(
+        Note.id.in_([note_id for group in shown for note_id, _ in group])
+    )} if shown else {}
+    return {
+        "total": len(groups),
+        "groups": [
+            [
+                {"id": note_id, "title": notes[note_id].title, "folder_id": notes[note_id].folder_id,
+                 "updated_at": notes[note_id].updated_at, "similarity": sim}
+                for note_id, sim in group if note_id in notes
+            ]
+            for group in shown
+        ],
+    }
+
+# AI摘要（长文按句子分段并行摘要后再合并，由常驻模型进程池推理）
 @app.post("/summarize/")
-def summarize_note(req: ContentRequest):
-    # 延迟导入和加载summarizer
-    from transformers import pipeline
-    global summarizer
-    if 'summarizer' not in globals() or summarizer is None:
-        summarizer = pipeline("summarization", model="facebook/bart-large-cnn")
+async def summarize_note(req: ContentRequest):
     content = req.content
-    max_length = req.max_length
-    min_length = req.min_length
-    # facebook/bart-large-cnn最大输入token约1024，保险起见按1000字符截断
     if not content or len(content) < 20:
         return {"summary": "内容太短，无需摘要"}
-    if len(content) > 1000:
-        content = content[:1000]
-    summary = summarizer(content, max_length=max_length, min_length=min_length, do_sample=False)[0]['summary_text']
+    require_capability("summarizer")
+    params = {"max_length": req.max_length, "min_length": req.min_length}
+    cache_key = ai_cache.make_key("summary", summarizer_service.model_name, content, **params)
+    cached = await result_cache.aget(cache_key)
+    if cached is not None:
+        return {"summary": cached}
+    try:
+        summary = await summarization.summarize(summarizer_service, content, params)
+    except inference.InferenceBusy:
+        raise HTTPException(status_code=503, detail="摘要服务繁忙，请稍后重试")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"摘要生成失败: {str(e)}")
+    await result_cache.aset(cache_key, summary)
     return {"summary": summary}
 
+# AI摘要（流式）：以 Server-Sent Events 逐段推送分段摘要，最后推送完整摘要
+@app.post("/summarize/stream")
+async def summarize_note_stream(req: ContentRequest):
+    require_capability("summarizer")
+    content = req.content
+    params = {"max_length": req.max_length, "min_length": req.min_length}
+
+    def sse(event, data):
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    async def event_stream():
+        if not content or len(content) < 20:
+            yield sse("summary", {"summary": "内容太短，无需摘要"})
+            return
+        cache_key = ai_cache.make_key("summary", summarizer_service.model_name, content, **params)
+        cached = await result_cache.aget(cache_key)
+        if cached is not None:
+            yield sse("summary", {"summary": cached})
+            return
+        try:
+            async for event, data in summarization.summarize_events(summarizer_service, content, params):
+                if event == "summary":
+                    await result_cache.aset(cache_key, data["summary"])
+                yield sse(event, data)
+        except inference.InferenceBusy:
+            yield sse("error", {"detail": "摘要服务繁忙，请稍后重试"})
+        except Exception as e:
+            yield sse("error", {"detail": f"摘要生成失败: {str(e)}"})
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+def folder_exists(db: Session, user_id: int, folder_id: int) -> bool:
+    return db.query(Folder.id).filter(Folder.id == folder_id, Folder.user_id == user_id).first() is not None
+
+def insert_transcribed_note(db: Session, user_id: int, title: str, content: str, folder_id: Optional[int]):
+    # 文件夹在上传前校验过，但可能在转写期间被删除
+    if folder_id is not None and not folder_exists(db, user_id, folder_id):
+        raise HTTPException(status_code=404, detail="文件夹不存在")
+    note = Note(title=title, content=content, user_id=user_id, folder_id=folder_id)
+    db.add(note)
+    db.flush()
+    search_index.index_note(db, note)
+    duplicates.index_note(db, note)
+    revisions.record(db, note)
+    note_counts.add_notes(db, user_id, [folder_id])
+    sync_log.touch(db, user_id, sync_log.NOTE, [note.id])
+    db.commit()
+    vector_index.mark_dirty(user_id, note.id)
+    return note.id
+
+# 语音转写（流式）：音频分块落盘后按固定窗口解码、重采样，由常驻ASR进程池并行识别，
+# 以 Server-Sent Events 按顺序推送分段结果和完整文本；create_note=true 时用转写结果新建笔记
+@app.post("/notes/transcribe")
+async def transcribe_audio(
+    file: UploadFile = File(...),
+    create_note: bool = False,
+    title: Optional[str] = None,
+    folder_id: Optional[int] = None,
+    user: auth.CurrentUser = Depends(get_current_user),
+):
+    require_capability("transcriber")
+    if create_note and folder_id is not None and not await run_db(folder_exists, user.id, folder_id):
+        raise HTTPException(status_code=404, detail="文件夹不存在")
+    suffix = os.path.splitext(file.filename or "")[1]
+    try:
+        path = await transcription.save_upload(file, suffix)
+    except transcription.UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    def sse(event, data):
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    async def event_stream():
+        try:
+            async for event, data in transcription.transcribe_events(transcriber_service, path):
+                if event == "transcript" and create_note and data["text"]:
+                    note_title = title or os.path.splitext(file.filename or "")[0] or "语音转写"
+                    data["note_id"] = await run_db(insert_transcribed_note, user.id, note_title, data["text"], folder_id)
+                yield sse(event, data)
+        except transcription.AudioFormatError as e:
+            yield sse("error", {"detail": str(e)})
+        except HTTPException as e:
+            yield sse("error", {"detail": e.detail})
+        except inference.InferenceBusy:
+            yield sse("error", {"detail": "语音识别服务繁忙，请稍后重试"})
+        except Exception as e:
+            yield sse("error", {"detail": f"语音转写失败: {str(e)}"})
+
+    # 临时文件由响应在结束时删除（含客户端提前断开）
+    return transcription.UploadStreamingResponse(event_stream(), path, media_type="text/event-stream")
+
+# 推理服务指标：队列深度、批大小、延迟
+@app.get("/inference/metrics")
+def inference_metrics():
+    return {
+        "summarizer": summarizer_service.metrics(),
+        "transcriber": transcriber_service.metrics(),
+        "ai_cache": result_cache.stats(),
+    }
+
+# Prometheus 指标：路由延迟、每请求 SQL 条数/耗时、热点代码段和模型推理耗时、推理队列与缓存状态
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    services = [(name, service.metrics()) for name, service in (("summarizer", summarizer_service), ("transcriber", transcriber_service))]
+    cache = result_cache.stats()
+    extra = metrics.sample_lines(
+        "ai_notes_inference_queue_depth", "Requests waiting in the inference queue.",
+        [((name,), m["queue_depth"]) for name, m in services], ("service",),
+    )
+    extra += metrics.sample_lines(
+        "ai_notes_inference_warm", "Whether the model workers finished warming up.",
+        [((name,), int(m["warm"])) for name, m in services], ("service",),
+    )
+    extra += metrics.sample_lines(
+        "ai_notes_inference_rejected_total", "Inference requests rejected because the queue was full.",
+        [((name,), m["rejected_total"]) for name, m in services], ("service",), kind="counter",
+    )
+    extra += metrics.sample_lines(
+        "ai_notes_ai_cache_lookups_total", "AI result cache lookups by outcome.",
+        [(("memory_hit",), cache["memory_hits"]), (("disk_hit",), cache["disk_hits"]), (("miss",), cache["misses"])],
+        ("result",), kind="counter",
+    )
+    saves = autosave_writer.stats()
+    extra += metrics.sample_lines(
+        "ai_notes_autosave_pending", "Notes with autosaved changes not yet written.", [((), saves["pending"])],
+    )
+    extra += metrics.sample_lines(
+        "ai_notes_autosave_events_total", "Autosave patches received, notes written and write transactions.",
+        [(("patch",), saves["patches_total"]), (("note_written",), saves["notes_written_total"]),
+         (("transaction",), saves["transactions_total"]), (("failed_transaction",), saves["failures_total"]),
+         (("dropped",), saves["dropped_total"])],
+        ("event",), kind="counter",
+    )
+    return PlainTextResponse(metrics.render(extra), media_type="text/plain; version=0.0.4")
+
 # 关键词提取
 @app.post("/extract_keywords/")
 def extract_keywords(req: ContentRequest):
-    # 延迟导入和加载KeyBERT
-    global kw_model
-    if 'kw_model' not in globals() or kw_model is None:
-        from keybert import KeyBERT
-        kw_model = KeyBERT()
     content = req.content
     top_n = req.top_n
     if not content or len(content) < 10:
         return {"keywords": []}
-    keywords = kw_model.extract_keywords(content, top_n=top_n)
-    return {"keywords": [kw[0] for kw in keywords]}
+    require_capability("keywords")
+    return {"keywords": keywords.extract_keyword_names(content, top_n, result_cache)}
 
-# 智能搜索
-@app.get("/search/{username}")
-def search_notes(username: str, query: str, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == username).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="用户不存在")
+# 批量关键词提取：contents 为文本列表，note_ids 为当前用户的笔记ID；全部文档合并成批量编码
+@app.post("/extract_keywords/batch")
+def extract_keywords_batch(req: KeywordBatchRequest, user: auth.CurrentUser = Depends(get_current_user), db: Session = Depends(get_db)):
+    if len(req.contents) + len(req.note_ids) > keywords.KEYWORD_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"一次最多提取 {keywords.KEYWORD_BATCH_MAX_ITEMS} 篇文档")
+    require_capability("keywords")
+    note_ids = list(dict.fromkeys(req.note_ids))
+    contents = dict(db.query(Note.id, Note.content).filter(Note.id.in_(note_ids), Note.user_id == user.id).all()) if note_ids else {}
+    missing = [note_id for note_id in note_ids if note_id not in contents]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"笔记不存在: {missing}")
     
-    notes = db.query(Note).filter(
-        Note.user_id == user.id,
-        or_(
-            Note.title.contains(query),
-            Note.content.contains(query)
-        )
-    ).all()
+    texts = [content or "" for content in req.contents] + [contents[note_id] or "" for note_id in note_ids]
+    # 与单篇接口一致，太短的文档不提取
+    long_enough = [i for i, text in enumerate(texts) if len(text) >= 10]
+    extracted = keywords.extract_keyword_names_batch([texts[i] for i in long_enough], req.top_n, result_cache)
+    results = [[] for _ in texts]
+    for i, names in zip(long_enough, extracted):
+        results[i] = names
+    return {
+        "contents": results[:len(req.contents)],
+        "notes": [{"note_id": note_id, "keywords": names} for note_id, names in zip(note_ids, results[len(req.contents):])],
+    }
+
+# 智能搜索（FTS5倒排索引 + BM25排序，分页返回）
+@app.get("/search/{username}")
+def search_notes(
+    query: str,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    user: auth.CurrentUser = Depends(get_request_user),
+    db: Session = Depends(get_db),
+):
+    hits, total = search_index.search(db, user.id, query, limit=limit, offset=offset)
+    hit_ids = [note_id for note_id, _ in hits]
+    notes = {note.id: note for note in db.query(Note).options(undefer(Note.content)).filter(Note.id.in_(hit_ids)).all()} if hits else {}
+    # 相似度用写入时保存的分词结果计算，只对本页命中的笔记打分
+    tokens = search_index.note_tokens(db, hit_ids) if hits else {}
+    query_tokens = similarity_tokens(query)
     
     results = []
-    for note in notes:
-        title_score = calculate_similarity(query, note.title) * 2
-        content_score = calculate_similarity(query, note.content)
-        total_score = title_score + content_score
-        
+    for note_id, score in hits:
+        note = notes.get(note_id)
+        if not note:
+            continue
+        title_tokens, content_tokens = tokens.get(note_id, (None, None))
+        with metrics.section("similarity"):
+            similarity = (
+                calculate_similarity(query, note.title, title_tokens, query_tokens) * 2
+                + calculate_similarity(query, note.content, content_tokens, query_tokens)
+            )
         results.append({
             "id": note.id,
             "title": note.title,
             "content": note.content,
-            "score": total_score,
+            "score": score,
+            "similarity": similarity,
             "updated_at": note.updated_at
         })
     
-    results.sort(key=lambda x: x["score"], reverse=True)
-    return {"results": results, "query": query, "count": len(results)}
+    return {"results": results, "query": query, "count": len(results), "total": total, "offset": offset, "limit": limit}
+
+# 语义搜索：向量余弦相似度 top-k，alpha<1 时与BM25词法分混合排序
+@app.get("/search/{username}/semantic")
+def semantic_search_notes(
+    query: str,
+    limit: int = Query(20, ge=1, le=100),
+    alpha: float = Query(1.0, ge=0.0, le=1.0),
+    user: auth.CurrentUser = Depends(get_request_user),
+    db: Session = Depends(get_db),
+):
+    if not query.strip():
+        return {"results": [], "query": query, "count": 0}
+    require_capability("embeddings")
+    
+    try:
+        ids, sims = vector_index.similarities(db, user.id, query)
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"语义搜索失败: {str(e)}")
+    lexical = {}
+    if alpha < 1:
+        hits, _ = search_index.search(db, user.id, query, limit=limit * 5)
+        best = max((score for _, score in hits), default=0)
+        if best > 0:
+            lexical = {note_id: score / best for note_id, score in hits}
+    scores = vector_index.blend(ids, sims, lexical, alpha)
+    top = vector_index.top_k(scores, limit)
+    ranked = [(int(ids[i]), float(scores[i]), float(sims[i])) for i in top]
+    
+    notes = {note.id: note for note in db.query(Note).options(undefer(Note.content)).filter(
+        Note.id.in_([note_id for note_id, _, _ in ranked])
+    ).all()} if ranked else {}
+    results = []
+    for note_id, score, semantic_score in ranked:
+        note = notes.get(note_id)
+        if not note:
+            continue
+        results.append({
+            "id": note.id,
+            "title": note.title,
+            "content": note.content,
+            "score": score,
+            "semantic_score": semantic_score,
+            "lexical_score": lexical.get(note_id, 0.0),
+            "updated_at": note.updated_at
+        })
+    # pending：尚未算出嵌入、暂不参与语义排序的笔记数（后台补算中）
+    return {"results": results, "query": query, "count": len(results), "pending": vector_index.pending_count(user.id)}
 
 # 创建标签
 @app.post("/tags/")
-def create_tag(tag: TagCreate, username: str, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == username).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="用户不存在")
-    
+def create_tag(tag: TagCreate, user: auth.CurrentUser = Depends(get_request_user), db: Session = Depends(get_db)):
     existing_tag = db.query(Tag).filter(Tag.name == tag.name, Tag.user_id == user.id).first()
     if existing_tag:
         return existing_tag
     
     new_tag = Tag(name=tag.name, color=tag.color, user_id=user.id)
     db.add(new_tag)
+    db.flush()
+    sync_log.touch(db, user.id, sync_log.TAG, [new_tag.id])
     db.commit()
     db.refresh(new_tag)
     return new_tag
 
 # 为笔记添加标签
 @app.post("/notes/{note_id}/tags")
-def add_tags_to_note(note_id: int, tag_names: List[str], username: str, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == username).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="用户不存在")
-    
+def add_tags_to_note(note_id: int, tag_names: List[str], user: auth.CurrentUser = Depends(get_request_user), db: Session = Depends(get_db)):
     note = db.query(Note).filter(Note.id == note_id, Note.user_id == user.id).first()
     if not note:
         raise HTTPException(status_code=404, detail="笔记不存在")
     
-    tags = []
-    for tag_name in tag_names:
-        tag = db.query(Tag).filter(Tag.name == tag_name, Tag.user_id == user.id).first()
-        if not tag:
-            tag = Tag(name=tag_name, user_id=user.id)
-            db.add(tag)
-            db.commit()
-            db.refresh(tag)
-        tags.append(tag)
+    # 一次查询+批量插入完成标签写入，已关联的标签自动跳过
+    assigned = tag_service.assign_tags(db, user.id, {note.id: tag_names})[note.id]
+    db.commit()
+    dropped = tag_service.dropped_names(tag_names, assigned)
+    return {"message": "部分标签未能添加" if dropped else "标签添加成功", "tags": assigned, "dropped": dropped}
+
+# 批量为多条笔记添加标签
+@app.post("/notes/tags/batch")
+def add_tags_to_notes(req: BatchTagRequest, user: auth.CurrentUser = Depends(get_request_user), db: Session = Depends(get_db)):
+    note_ids = list(dict.fromkeys(req.note_ids))
+    owned = {note_id for (note_id,) in db.query(Note.id).filter(Note.id.in_(note_ids), Note.user_id == user.id).all()}
+    missing = [note_id for note_id in note_ids if note_id not in owned]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"笔记不存在: {missing}")
     
-    note.tags.extend(tags)
+    assigned = tag_service.assign_tags(
+        db, user.id, {note_id: req.tag_names for note_id in note_ids}, replace=req.replace
+    )
     db.commit()
-    return {"message": "标签添加成功"}
+    tags = assigned[note_ids[0]] if note_ids else []
+    dropped = tag_service.dropped_names(req.tag_names, tags)
+    return {"message": "部分标签未能添加" if dropped else "标签添加成功", "count": len(note_ids), "tags": tags, "dropped": dropped}
 
 # 获取用户所有标签
 @app.get("/tags/{username}")
-def get_user_tags(username: str, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == username).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="用户不存在")
-    
+def get_user_tags(request: Request, response: Response, user: auth.CurrentUser = Depends(get_request_user), db: Session = Depends(get_db)):
+    not_modified = check_etag(db, request, response, user.id)
+    if not_modified:
+        return not_modified
     tags = db.query(Tag).filter(Tag.user_id == user.id).all()
     return tags
 
+# 各标签下的笔记数（由统计表直接读出）
+@app.get("/tags/{username}/counts")
+def get_tag_counts(request: Request, response: Response, user: auth.CurrentUser = Depends(get_request_user), db: Session = Depends(get_db)):
+    not_modified = check_etag(db, request, response, user.id)
+    if not_modified:
+        return not_modified
+    counts = note_counts.counts(db, user.id, note_counts.TAG)
+    tags = db.query(Tag.id, Tag.name, Tag.color).filter(Tag.user_id == user.id).order_by(Tag.id).all()
+    return [{"id": tag.id, "name": tag.name, "color": tag.color, "note_count": counts.get(tag.id, 0)} for tag in tags]
+
 # 删除/融合原有关键词提取、自动标签API，统一为AI标签API
 @app.post("/notes/{note_id}/ai_tags")
-def generate_ai_tags(note_id: int, db: Session = Depends(get_db)):
-    note = db.query(Note).filter(Note.id == note_id).first()
+def generate_ai_tags(note_id: int, user: auth.CurrentUser = Depends(get_current_user), db: Session = Depends(get_db)):
+    note = db.query(Note).filter(Note.id == note_id, Note.user_id == user.id).first()
     if not note:
         raise HTTPException(status_code=404, detail="笔记不存在")
-    user = db.query(User).filter(User.id == note.user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="用户不存在")
+    require_capability("keywords")
     try:
-        from keybert import KeyBERT
-        global kw_model
-        if 'kw_model' not in globals() or kw_model is None:
-            kw_model = KeyBERT()
-        keywords = kw_model.extract_keywords(note.content, top_n=5)
-        tag_names = [kw[0] for kw in keywords]
-        # 清空现有标签，避免重复
-        note.tags.clear()
-        tags = []
-        for tag_name in tag_names:
-            tag = db.query(Tag).filter(Tag.name == tag_name, Tag.user_id == user.id).first()
-            if not tag:
-                tag = Tag(name=tag_name, user_id=user.id)
-                db.add(tag)
-                db.commit()
-                db.refresh(tag)
-            tags.append(tag)
-        note.tags.extend(tags)
+        tag_names = keywords.extract_keyword_names(note.content, 5, result_cache)
+        # 替换现有标签，标签写入在同一个事务中批量完成
+        assigned = tag_service.assign_tags(db, user.id, {note.id: tag_names}, replace=True)[note.id]
         db.commit()
-        return {"tags": tag_names}
+        return {"tags": assigned, "dropped": tag_service.dropped_names(tag_names, assigned)}
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"AI标签生成失败: {str(e)}")
 
+# ========== 批量AI标签任务API ==========
+
+# 创建批量AI标签任务（后台按批处理该用户全部笔记）
+@app.post("/users/{username}/ai_tags/jobs")
+def create_ai_tag_job(req: Optional[AITagJobCreate] = None, user: auth.CurrentUser = Depends(get_request_user), db: Session = Depends(get_db)):
+    require_capability("keywords", reject_warming=False)
+    running = db.query(AITagJob).filter(
+        AITagJob.user_id == user.id, AITagJob.status.in_(ai_tag_jobs.ACTIVE_STATUSES)
+    ).first()
+    if running:
+        raise HTTPException(status_code=409, detail="已有进行中的AI标签任务")
+    job = tag_job_manager.submit(db, user.id, top_n=req.top_n if req else 5)
+    return ai_tag_jobs.job_to_dict(job)
+
+# 获取用户的批量AI标签任务列表
+@app.get("/users/{username}/ai_tags/jobs")
+def list_ai_tag_jobs(user: auth.CurrentUser = Depends(get_request_user), db: Session = Depends(get_db)):
+    jobs = db.query(AITagJob).filter(AITagJob.user_id == user.id).order_by(AITagJob.id.desc()).all()
+    return [ai_tag_jobs.job_to_dict(job) for job in jobs]
+
+# 查询任务进度
+@app.get("/users/{username}/ai_tags/jobs/{job_id}")
+def get_ai_tag_job(job_id: int, user: auth.CurrentUser = Depends(get_request_user), db: Session = Depends(get_db)):
+    job = db.query(AITagJob).filter(AITagJob.id == job_id, AITagJob.user_id == user.id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return ai_tag_jobs.job_to_dict(job)
+
+# 取消任务
+@app.post("/users/{username}/ai_tags/jobs/{job_id}/cancel")
+def cancel_ai_tag_job(job_id: int, user: auth.CurrentUser = Depends(get_request_user), db: Session = Depends(get_db)):
+    job = db.query(AITagJob).filter(AITagJob.id == job_id, AITagJob.user_id == user.id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    job = tag_job_manager.cancel(db, job)
+    return ai_tag_jobs.job_to_dict(job)
+
+# ========== 增量同步API ==========
+
+def folder_to_dict(folder: Folder) -> dict:
+    return {
+        "id": folder.id,
+        "name": folder.name,
+        "color": folder.color,
+        "parent_id": folder.parent_id,
+        "created_at": folder.created_at,
+    }
+
+def query_sync(db: Session, user_id: int, since: int, limit: int):
+    changes, has_more = sync_log.changes_since(db, user_id, since, limit)
+    changed = {entity: [] for entity in sync_log.ENTITIES}
+    deleted = {entity: [] for entity in sync_log.ENTITIES}
+    for change in changes:
+        (deleted if change.deleted else changed)[change.entity].append(change.entity_id)
+    
+    notes = db.query(Note).options(undefer(Note.content), joinedload(Note.folder), selectinload(Note.tags)).filter(
+        Note.id.in_(changed[sync_log.NOTE]), Note.user_id == user_id
+    ).all() if changed[sync_log.NOTE] else []
+    tags = db.query(Tag).filter(Tag.id.in_(changed[sync_log.TAG]), Tag.user_id == user_id).all() if changed[sync_log.TAG] else []
+    folders = db.query(Folder).filter(
+        Folder.id.in_(changed[sync_log.FOLDER]), Folder.user_id == user_id
+    ).all() if changed[sync_log.FOLDER] else []
+    # 记录为已修改但实际已不存在的实体按删除处理
+    for entity, rows in ((sync_log.NOTE, notes), (sync_log.TAG, tags), (sync_log.FOLDER, folders)):
+        found = {row.id for row in rows}
+        deleted[entity].extend(entity_id for entity_id in changed[entity] if entity_id not in found)
+    
+    return {
+        "cursor": changes[-1].seq if changes else since,
+        "has_more": has_more,
+        "notes": [note_to_dict(note) for note in notes],
+        "tags": [{"id": tag.id, "name": tag.name, "color": tag.color} for tag in tags],
+        "folders": [folder_to_dict(folder) for folder in folders],
+        "deleted": {entity + "s": ids for entity, ids in deleted.items()},
+    }
+
+# 增量同步：返回游标 since 之后新建、修改或删除的笔记、标签和文件夹（删除以ID列表给出）；
+# since=0 时返回全部。has_more 为 true 时用返回的 cursor 继续拉取
+@app.get("/sync/{username}")
+async def sync_changes(
+    since: int = Query(0, ge=0),
+    limit: int = Query(500, ge=1, le=1000),
+    user: auth.CurrentUser = Depends(get_request_user),
+):
+    return await run_db(query_sync, user.id, since, limit)
+
+# ========== 批量导入导出API ==========
+
+# 批量导入笔记：JSONL（每行一条）或 Markdown 压缩包，逐条解析、分批事务写入，文件夹按路径、标签按名称映射
+@app.post("/users/{username}/import")
+def import_notes(
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(None, pattern="^(jsonl|markdown)$"),
+    user: auth.CurrentUser = Depends(get_request_user),
+    db: Session = Depends(get_db),
+):
+    fmt = format or note_io.detect_format(file.filename)
+    try:
+        report = note_io.import_notes(db, user.id, file.file, fmt)
+    except note_io.ImportFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        folder_tree.invalidate(user.id)
+    return report
+
+# 导出全部笔记：按批读取并流式输出，内存占用与笔记数量无关
+@app.get("/users/{username}/export")
+def export_notes(
+    format: str = Query("jsonl", pattern="^(jsonl|markdown)$"),
+    user: auth.CurrentUser = Depends(get_request_user),
+):
+    if format == "markdown":
+        body, media_type, suffix = note_io.export_markdown_zip(SessionLocal, user.id), "application/zip", "zip"
+    else:
+        body, media_type, suffix = note_io.export_jsonl(SessionLocal, user.id), "application/x-ndjson", "jsonl"
+    return StreamingResponse(body, media_type=media_type, headers={
+        "Content-Disposition": f'attachment; filename="notes-{user.id}.{suffix}"'
+    })
+
 @app.get("/")
 def read_root():
     return {"message": "Hello, AI Notes App!"}
 
+# 存活检查：进程能响应即返回 200
+@app.get("/healthz")
+def healthz():
+    return {"status": "ok", "uptime_seconds": round(time.perf_counter() - capabilities.started, 1)}
+
+# 就绪检查：核心接口可用时返回 200；require 指定的能力（如 summarizer）未就绪时返回 503
+@app.get("/readyz")
+def readyz(response: Response, require: List[str] = Query([])):
+    ready = capabilities.ready("core") and all(capabilities.ready(name) for name in require)
+    if not ready:
+        response.status_code = 503
+    return {"ready": ready, "capabilities": capabilities.report()}
+
 # ========== 文件夹管理API ==========
 
 # 创建文件夹
 @app.post("/folders/")
-def create_folder(folder: FolderCreate, username: str, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == username).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="用户不存在")
-    
+def create_folder(folder: FolderCreate, user: auth.CurrentUser = Depends(get_request_user), db: Session = Depends(get_db)):
     # 检查父文件夹是否存在
     if folder.parent_id:
         parent_folder = db.query(Folder).filter(Folder.id == folder.parent_id, Folder.user_id == user.id).first()
@@ -411,50 +1179,51 @@ def create_folder(folder: FolderCreate, username: str, db: Session = Depends(get
         parent_id=folder.parent_id
     )
     db.add(new_folder)
+    db.flush()
+    sync_log.touch(db, user.id, sync_log.FOLDER, [new_folder.id])
     db.commit()
     db.refresh(new_folder)
+    folder_tree.invalidate(user.id)
     return new_folder
 
 # 获取用户所有文件夹
 @app.get("/folders/{username}")
-def get_folders(username: str, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == username).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="用户不存在")
-    
+def get_folders(request: Request, response: Response, user: auth.CurrentUser = Depends(get_request_user), db: Session = Depends(get_db)):
+    not_modified = check_etag(db, request, response, user.id)
+    if not_modified:
+        return not_modified
     folders = db.query(Folder).filter(Folder.user_id == user.id).all()
     return folders
 
 # 获取文件夹树结构
 @app.get("/folders/{username}/tree")
-def get_folder_tree(username: str, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == username).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="用户不存在")
-    
-    def build_tree(parent_id=None):
-        folders = db.query(Folder).filter(Folder.user_id == user.id, Folder.parent_id == parent_id).all()
-        tree = []
-        for folder in folders:
-            folder_data = {
-                "id": folder.id,
-                "name": folder.name,
-                "color": folder.color,
-                "created_at": folder.created_at,
-                "children": build_tree(folder.id)
-            }
-            tree.append(folder_data)
-        return tree
-    
-    return build_tree()
+def get_folder_tree(request: Request, response: Response, user: auth.CurrentUser = Depends(get_request_user), db: Session = Depends(get_db)):
+    not_modified = check_etag(db, request, response, user.id)
+    if not_modified:
+        return not_modified
+    # 一次查询拼装整棵树，结果按用户缓存，文件夹增删改时失效
+    return folder_tree.get_tree(db, user.id)
+
+# 各文件夹的笔记数：note_count 为直接包含的笔记数，total_count 含全部子孙文件夹
+@app.get("/folders/{username}/counts")
+def get_folder_counts(request: Request, response: Response, user: auth.CurrentUser = Depends(get_request_user), db: Session = Depends(get_db)):
+    not_modified = check_etag(db, request, response, user.id)
+    if not_modified:
+        return not_modified
+    direct = note_counts.counts(db, user.id, note_counts.FOLDER)
+    totals = folder_tree.subtree_totals(db, user.id, direct)
+    return {
+        "total": sum(direct.values()),
+        "unfiled": direct.get(note_counts.UNFILED, 0),
+        "folders": [
+            {"id": folder_id, "note_count": direct.get(folder_id, 0), "total_count": total}
+            for folder_id, total in totals.items()
+        ],
+    }
 
 # 更新文件夹
 @app.put("/folders/{folder_id}")
-def update_folder(folder_id: int, folder: FolderUpdate, username: str, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == username).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="用户不存在")
-    
+def update_folder(folder_id: int, folder: FolderUpdate, user: auth.CurrentUser = Depends(get_request_user), db: Session = Depends(get_db)):
     db_folder = db.query(Folder).filter(Folder.id == folder_id, Folder.user_id == user.id).first()
     if not db_folder:
         raise HTTPException(status_code=404, detail="文件夹不存在")
@@ -464,24 +1233,29 @@ def update_folder(folder_id: int, folder: FolderUpdate, username: str, db: Sessi
         parent_folder = db.query(Folder).filter(Folder.id == folder.parent_id, Folder.user_id == user.id).first()
         if not parent_folder:
             raise HTTPException(status_code=404, detail="父文件夹不存在")
-        # 防止循环引用
+        # 防止循环引用：不能设为自己或自己的子孙文件夹
         if folder.parent_id == folder_id:
             raise HTTPException(status_code=400, detail="不能将文件夹设为自己的父文件夹")
+        if folder_tree.would_create_cycle(db, user.id, folder_id, folder.parent_id):
+            raise HTTPException(status_code=400, detail="不能将文件夹移动到自己的子文件夹下")
     
+    if db_folder.name != folder.name:
+        # 笔记数据里带有文件夹名称，改名时这些笔记也要重新同步
+        sync_log.touch(db, user.id, sync_log.NOTE, [
+            note_id for (note_id,) in db.query(Note.id).filter(Note.folder_id == folder_id).all()
+        ])
     db_folder.name = folder.name
     db_folder.color = folder.color
     db_folder.parent_id = folder.parent_id
+    sync_log.touch(db, user.id, sync_log.FOLDER, [folder_id])
     db.commit()
     db.refresh(db_folder)
+    folder_tree.invalidate(user.id)
     return db_folder
 
 # 删除文件夹
 @app.delete("/folders/{folder_id}")
-def delete_folder(folder_id: int, username: str, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == username).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="用户不存在")
-    
+def delete_folder(folder_id: int, user: auth.CurrentUser = Depends(get_request_user), db: Session = Depends(get_db)):
     folder = db.query(Folder).filter(Folder.id == folder_id, Folder.user_id == user.id).first()
     if not folder:
         raise HTTPException(status_code=404, detail="文件夹不存在")
@@ -491,27 +1265,30 @@ def delete_folder(folder_id: int, username: str, db: Session = Depends(get_db)):
     if children:
         raise HTTPException(status_code=400, detail="请先删除子文件夹")
     
-    # 将文件夹中的笔记移到根目录
-    notes = db.query(Note).filter(Note.folder_id == folder_id).all()
-    for note in notes:
-        note.folder_id = None
+    # 将文件夹中的笔记移到根目录：一条 UPDATE 完成，RETURNING 取回受影响的笔记ID用于同步
+    moved = db.execute(
+        update(Note).where(Note.folder_id == folder_id, Note.user_id == user.id)
+        .values(folder_id=None).returning(Note.id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    note_counts.remove_folder(db, user.id, folder_id, len(moved))
+    sync_log.touch(db, user.id, sync_log.NOTE, moved)
+    sync_log.touch(db, user.id, sync_log.FOLDER, [folder_id], deleted=True)
     
     db.delete(folder)
     db.commit()
+    folder_tree.invalidate(user.id)
     return {"message": "文件夹已删除"}
 
 # 获取文件夹中的笔记
-@app.get("/folders/{folder_id}/notes")
-def get_folder_notes(folder_id: int, username: str, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == username).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="用户不存在")
-    
-    folder = db.query(Folder).filter(Folder.id == folder_id, Folder.user_id == user.id).first()
+def query_folder_notes(db: Session, folder_id: int, user_id: int):
+    folder = db.query(Folder).filter(Folder.id == folder_id, Folder.user_id == user_id).first()
     if not folder:
         raise HTTPException(status_code=404, detail="文件夹不存在")
     
-    notes = db.query(Note).filter(Note.folder_id == folder_id, Note.user_id == user.id).all()
+    notes = db.query(Note).options(undefer(Note.content), selectinload(Note.tags)).filter(
+        Note.folder_id == folder_id, Note.user_id == user_id
+    ).all()
     result = []
     for note in notes:
         note_data = {
@@ -521,19 +1298,36 @@ def get_folder_notes(folder_id: int, username: str, db: Session = Depends(get_db
             "updated_at": note.updated_at,
             "folder_id": note.folder_id,
             "folder_name": folder.name,
-            "tags": [tag.name for tag in note.tags] if note.tags else []
+            "tags": [tag.name for tag in note.tags]
         }
         result.append(note_data)
     return result
 
+@app.get("/folders/{folder_id}/notes")
+async def get_folder_notes(folder_id: int, request: Request, response: Response, user: auth.CurrentUser = Depends(get_request_user)):
+    not_modified = await run_db(check_etag, request, response, user.id)
+    if not_modified:
+        return not_modified
+    return await run_db(query_folder_notes, folder_id, user.id)
+
 @app.post("/change_password")
-def change_password(req: ChangePasswordRequest, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == req.username).first()
-    if not user or not pwd_context.verify(req.old_password, user.hashed_password):
+async def change_password(req: ChangePasswordRequest, request: Request):
+    ip = client_ip(request)
+    check_login_throttle(req.username, ip)
+    hashed_password = await run_db(query_password_hash, req.username)
+    verified = False
+    if hashed_password:
+        verified, _ = await hash_or_429(password_hasher.verify_and_update(req.old_password, hashed_password))
+    if not verified:
+        login_throttle.record_failure(req.username, ip)
         return {"msg": "旧密码错误", "msgType": "error"}
-    user.hashed_password = pwd_context.hash(req.new_password)
-    db.commit()
-    return {"msg": "密码修改成功", "msgType": "success"}
+    new_hash = await hash_or_429(password_hasher.hash(req.new_password))
+    await run_db(save_password_hash, req.username, new_hash)
+    # 旧令牌随密码版本变化失效（其他进程的用户缓存最多 USER_CACHE_TTL_SECONDS 后过期），返回新令牌供当前客户端继续使用
+    user_id = await run_db(query_user_id, req.username)
+    user_cache.invalidate(user_id)
+    current_user = auth.CurrentUser(user_id, req.username, auth.password_version(new_hash))
+    return {"msg": "密码修改成功", "msgType": "success", "access_token": auth.create_token(current_user)}
 
 def to_shanghai_time(dt: datetime):
     shanghai = pytz.timezone("Asia/Shanghai")
@@ -0,0 +1,313 @@
+# backend/metrics.py
+# 运行指标与慢请求采样分析，以 Prometheus 文本格式从 /metrics 导出：
+#   - 每个路由的请求数和延迟直方图（ASGI 中间件记录，路由取路径模板）
+#   - 每个请求的 SQL 条数和 SQL 耗时（SQLAlchemy 引擎事件），条数分布可以暴露 N+1 查询
+#   - 分词、相似度打分、关键词批量编码（共用向量模型）、模型推理等热点代码段的耗时（section() 计时）
+# PROFILE_SLOW_MS > 0 时启用采样分析：后台线程每 PROFILE_INTERVAL_MS 采一次请求所在线程的调用栈，
+# 耗时超过阈值的请求把折叠栈（flamegraph.pl / speedscope 可直接读取）写到 PROFILE_DIR。
+import bisect
+import contextvars
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from sqlalchemy import event
+from starlette.concurrency import run_in_threadpool
+
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+# 只保留最近的这些份分析文件
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "100"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+SECTION_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            lines.append(f"{self.name}{_labels(self.labels, label_values)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # 每组标签：[各桶计数..., +Inf 计数], 总和
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._series.items())
+        for label_values, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), label_values + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, label_values)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labels, label_values)} {cumulative}")
+        return lines
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _number(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def sample_lines(name, help_text, samples, labels=(), kind="gauge") -> list:
+    # samples: [(标签值元组, 数值)]；用于抓取时才从其他模块读取的值（队列深度、缓存命中数等）
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for label_values, value in samples:
+        if value is not None:
+            lines.append(f"{name}{_labels(labels, label_values)} {_number(value)}")
+    return lines
+
+
+HTTP_REQUESTS = Counter("ai_notes_http_requests_total", "HTTP requests by route and status.", ("method", "route", "status"))
+HTTP_LATENCY = Histogram("ai_notes_http_request_duration_seconds", "HTTP request latency.", ("method", "route"))
+DB_QUERIES = Histogram(
+    "ai_notes_db_queries_per_request", "SQL statements executed per request.", ("method", "route"), QUERY_COUNT_BUCKETS
+)
+DB_TIME = Histogram("ai_notes_db_time_per_request_seconds", "Time spent in SQL per request.", ("method", "route"))
+SECTION_TIME = Histogram(
+    "ai_notes_section_duration_seconds", "Time spent in instrumented hot sections.", ("section",), SECTION_BUCKETS
+)
+INFERENCE_BATCH_TIME = Histogram(
+    "ai_notes_inference_batch_duration_seconds", "Model call time per batch in the worker pool.", ("service",)
+)
+INFERENCE_LATENCY = Histogram(
+    "ai_notes_inference_request_duration_seconds", "Queue wait plus model time per inference request.", ("service",)
+)
+REGISTRY = [HTTP_REQUESTS, HTTP_LATENCY, DB_QUERIES, DB_TIME, SECTION_TIME, INFERENCE_BATCH_TIME, INFERENCE_LATENCY]
+
+
+def render(extra_lines=()) -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    lines.extend(extra_lines)
+    return "\n".join(lines) + "\n"
+
+
+# ---------- 请求级统计 ----------
+
+class RequestStats:
+    __slots__ = ("queries", "query_seconds", "samples")
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        # 采样分析时：折叠栈 -> 次数
+        self.samples = None
+
+
+_current = contextvars.ContextVar("request_stats", default=None)
+# 线程ID -> 最近在该线程上执行过 SQL 或计时代码段的请求，采样时据此归属调用栈
+_thread_owner = {}
+
+
+def _claim_thread(stats):
+    if stats.samples is not None:
+        _thread_owner[threading.get_ident()] = stats
+
+
+@contextmanager
+def section(name: str):
+    # 热点代码段计时：记入 ai_notes_section_duration_seconds
+    stats = _current.get()
+    if stats is not None:
+        _claim_thread(stats)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        SECTION_TIME.observe(time.perf_counter() - start, name)
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    if stats is not None:
+        _claim_thread(stats)
+        conn.info["metrics_start"] = time.perf_counter()
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    start = conn.info.pop("metrics_start", None)
+    if stats is not None and start is not None:
+        stats.queries += 1
+        stats.query_seconds += time.perf_counter() - start
+
+
+def instrument_engine(engine):
+    # 异步引擎传入其 sync_engine
+    event.listen(engine, "before_cursor_execute", _before_execute)
+    event.listen(engine, "after_cursor_execute", _after_execute)
+
+
+class MetricsMiddleware:
+    # 纯 ASGI 中间件：耗时计到响应体发送完毕，流式响应也能计入完整时长
+    def __init__(self, app, profiler=None):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats()
+        token = _current.set(stats)
+        if self.profiler is not None and self.profiler.running:
+            stats.samples = {}
+            _claim_thread(stats)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            _current.reset(token)
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            method = scope["method"]
+            HTTP_REQUESTS.inc(method, route, str(status))
+            HTTP_LATENCY.observe(elapsed, method, route)
+            DB_QUERIES.observe(stats.queries, method, route)
+            DB_TIME.observe(stats.query_seconds, method, route)
+            if stats.samples is not None:
+                for thread_id, owner in list(_thread_owner.items()):
+                    if owner is stats:
+                        _thread_owner.pop(thread_id, None)
+                if elapsed * 1000 >= PROFILE_SLOW_MS and stats.samples:
+                    # 换一个字典交给写文件的线程，采样线程手里的旧引用不会再改到它；写文件不占用事件循环
+                    stats.samples = dict(stats.samples)
+                    await run_in_threadpool(self.profiler.dump, method, route, elapsed, stats)
+
+
+# ---------- 采样分析 ----------
+
+# 栈顶是这些函数时线程在空闲等待（事件循环 select、线程池取任务），不计入样本
+_IDLE_FRAMES = {("selectors.py", "select"), ("threading.py", "wait"), ("queue.py", "get")}
+
+
+def _folded_stack(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler:
+    # 后台线程定期读取 sys._current_frames()，按线程归属把调用栈计入对应请求。
+    # 事件循环线程被多个并发的异步请求共享，并发时这部分样本只归给最近在其上执行 SQL/计时段的请求，是近似值。
+    def __init__(self, interval_ms: float = PROFILE_INTERVAL_MS, output_dir: str = PROFILE_DIR):
+        self.interval = interval_ms / 1000
+        self.output_dir = output_dir
+        self.running = False
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self.running:
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="metrics-profiler", daemon=True)
+        self.running = True
+        self._thread.start()
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            if not _thread_owner:
+                continue
+            frames = sys._current_frames()
+            for thread_id, stats in list(_thread_owner.items()):
+                frame = frames.get(thread_id)
+                if frame is None or (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in _IDLE_FRAMES:
+                    continue
+                stack = _folded_stack(frame)
+                samples = stats.samples
+                if samples is not None:
+                    samples[stack] = samples.get(stack, 0) + 1
+
+    def dump(self, method: str, route: str, elapsed: float, stats):
+        # 文件名：时间戳-方法-路由-耗时；内容每行 "栈;帧 次数"
+        safe_route = route.strip("/").replace("/", "_").replace("{", "").replace("}", "") or "root"
+        now = time.time()
+        name = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}-{int(now * 1000) % 1000:03d}-{method}-{safe_route}-{int(elapsed * 1000)}ms.folded"
+        path = os.path.join(self.output_dir, name)
+        with open(path, "w", encoding="utf-8") as out:
+            out.write(f"# {method} {route} {elapsed * 1000:.1f}ms queries={stats.queries} "
+                      f"sql={stats.query_seconds * 1000:.1f}ms interval={self.interval * 1000:g}ms\n")
+            for stack, count in sorted(stats.samples.items(), key=lambda item: -item[1]):
+                out.write(f"{stack} {count}\n")
+        self._prune()
+
+    def _prune(self):
+        files = sorted(f for f in os.listdir(self.output_dir) if f.endswith(".folded"))
+        for name in files[:-PROFILE_KEEP] if PROFILE_KEEP > 0 else []:
+            try:
+                os.unlink(os.path.join(self.output_dir, name))
+            except OSError:
+                pass
+
+
+def create_profiler():
+    return SamplingProfiler() if PROFILE_SLOW_MS > 0 else None
@@ -1,14 +1,24 @@
 # backend/models.py
-from sqlalchemy import Column, Integer, String, create_engine, ForeignKey, DateTime, Table
+from sqlalchemy import Column, Integer, String, create_engine, ForeignKey, DateTime, Table, Index, Float, LargeBinary, UniqueConstraint, event, text
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import sessionmaker, relationship, deferred
 from datetime import datetime
 from typing import List
 from pydantic import BaseModel
 from difflib import SequenceMatcher
-import jieba
+import os
+from note_body import CompressedText
 
-DATABASE_URL = "sqlite:///./test.db"
+# 数据库配置（均可通过环境变量覆盖）
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./test.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+# 设为 0 时不调整 SQLite 的日志模式和同步级别（用于对比压测）
+DB_SQLITE_TUNING = os.getenv("DB_SQLITE_TUNING", "1") == "1"
+# 设为 0 时不创建异步引擎，异步接口退回线程池中的同步会话
+DB_ASYNC = os.getenv("DB_ASYNC", "1") == "1"
 
 Base = declarative_base()
 
@@ -37,18 +47,24 @@ class Folder(Base):
 class Tag(Base):
     __tablename__ = "tags"
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String, unique=True, index=True)
+    name = Column(String, index=True)
     color = Column(String, default="#409eff")
     user_id = Column(Integer, ForeignKey("users.id"))
     
     user = relationship("User", back_populates="tags")
     notes = relationship("Note", secondary=note_tags, back_populates="tags")
+    
+    __table_args__ = (
+        # 标签名按用户唯一（唯一索引，已有数据库也能由 init_db 补建）
+        Index("uq_tags_user_name", "user_id", "name", unique=True),
+    )
 
 class Note(Base):
     __tablename__ = "notes"
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, index=True)
-    content = Column(String)
+    # 长正文压缩存储（见 note_body.py）；默认不随笔记加载，访问时再单独查询，需要正文的查询用 undefer(Note.content)
+    content = deferred(Column(CompressedText))
     user_id = Column(Integer, ForeignKey("users.id"))
     folder_id = Column(Integer, ForeignKey("folders.id"), nullable=True)  # 新增：文件夹ID
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -56,6 +72,12 @@ class Note(Base):
     user = relationship("User", back_populates="notes")
     folder = relationship("Folder", back_populates="notes")
     tags = relationship("Tag", secondary=note_tags, back_populates="notes")
+    
+    # 列表分页按 (user_id, updated_at, id) 走索引；文件夹笔记列表、删除文件夹按 folder_id 走索引
+    __table_args__ = (
+        Index("ix_notes_user_updated", "user_id", "updated_at", "id"),
+        Index("ix_notes_folder", "folder_id"),
+    )
 
 class User(Base):
     __tablename__ = "users"
@@ -67,40 +89,188 @@ class User(Base):
     tags = relationship("Tag", back_populates="user")
     folders = relationship("Folder", back_populates="user")
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+class AITagJob(Base):
+    __tablename__ = "ai_tag_jobs"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    status = Column(String, default="pending", index=True)  # pending/running/completed/cancelled/failed
+    top_n = Column(Integer, default=5)
+    total = Column(Integer, default=0)
+    processed = Column(Integer, default=0)
+    last_note_id = Column(Integer, default=0)  # 断点：已处理到的最大笔记ID
+    elapsed_seconds = Column(Float, default=0.0)
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class NoteEmbedding(Base):
+    __tablename__ = "note_embeddings"
+    note_id = Column(Integer, ForeignKey("notes.id"), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    model = Column(String)
+    vector = Column(LargeBinary)  # float32 向量的原始字节，已归一化
+
+class NoteMinHash(Base):
+    # 近似重复检测：正文 jieba 分词后按词组 shingle 计算的 MinHash 签名
+    __tablename__ = "note_minhash"
+    note_id = Column(Integer, ForeignKey("notes.id"), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    scheme = Column(String)  # 签名参数（shingle长度/排列数/分段数），参数变化后重新计算
+    signature = Column(LargeBinary)  # uint32 数组的原始字节
+
+class NoteLSHBand(Base):
+    # LSH 分段：签名每段哈希成一个桶，同一段落入同一桶的笔记互为候选
+    __tablename__ = "note_lsh_bands"
+    note_id = Column(Integer, ForeignKey("notes.id"), primary_key=True)
+    band = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    bucket = Column(Integer)
+
+    __table_args__ = (
+        # 含 note_id 的覆盖索引：按桶分组和查找候选都不需要回表
+        Index("ix_note_lsh_bands_bucket", "user_id", "band", "bucket", "note_id"),
+    )
+
+class NoteCount(Base):
+    # 每个文件夹/标签下的笔记数，随笔记、标签、文件夹的写入在同一事务中增减；entity_id=0 表示未归档的笔记
+    __tablename__ = "note_counts"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    entity = Column(String, primary_key=True)  # folder/tag
+    entity_id = Column(Integer, primary_key=True)
+    note_count = Column(Integer, default=0)
+
+class NoteRevision(Base):
+    # 笔记历史版本：每 REVISION_SNAPSHOT_INTERVAL 个版本存一次完整快照，其余存相对上一个版本的压缩差量
+    __tablename__ = "note_revisions"
+    id = Column(Integer, primary_key=True, index=True)
+    note_id = Column(Integer, ForeignKey("notes.id"))
+    user_id = Column(Integer, ForeignKey("users.id"))
+    rev = Column(Integer)
+    is_snapshot = Column(Integer, default=0)
+    title = Column(String)
+    data = Column(LargeBinary)  # zlib 压缩：快照为正文，差量为 JSON 编码的操作列表
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        UniqueConstraint("note_id", "rev"),
+    )
+
+class SyncChange(Base):
+    # 每个笔记/标签/文件夹一行，写入或删除时重新插入以获得新的 seq（同步游标）；deleted=1 为墓碑
+    __tablename__ = "sync_changes"
+    seq = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    entity = Column(String)  # note/tag/folder
+    entity_id = Column(Integer)
+    deleted = Column(Integer, default=0)
+    
+    __table_args__ = (
+        UniqueConstraint("entity", "entity_id"),
+        Index("ix_sync_changes_user_seq", "user_id", "seq"),
+        # seq 永不复用，保证游标单调递增
+        {"sqlite_autoincrement": True},
+    )
+
+# 全文索引（FTS5）、计数和同步日志等都用了 SQLite 专有的语法，不支持其他数据库
+if not DATABASE_URL.startswith("sqlite"):
+    raise RuntimeError(f"只支持 SQLite 数据库，DATABASE_URL 配置为: {DATABASE_URL.split(':', 1)[0]}")
+
+
+def _engine_options(url: str) -> dict:
+    options = {"connect_args": {"check_same_thread": False}}
+    if ":memory:" not in url:
+        options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+    return options
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL 模式下读不阻塞写、写不阻塞读；NORMAL 同步级别在 WAL 下仍保证崩溃一致性
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+    if DB_SQLITE_TUNING:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+
+engine = create_engine(DATABASE_URL, **_engine_options(DATABASE_URL))
+event.listen(engine, "connect", _set_sqlite_pragmas)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
+def _async_url(url: str):
+    if url.startswith("sqlite:///"):
+        return url.replace("sqlite:///", "sqlite+aiosqlite:///", 1)
+    return None
+
+
+# 可选的异步引擎：驱动（aiosqlite）未安装时为 None
+async_engine = None
+AsyncSessionLocal = None
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _async_url(DATABASE_URL)
+if ASYNC_DATABASE_URL and not ASYNC_DATABASE_URL.startswith("sqlite"):
+    raise RuntimeError(f"只支持 SQLite 数据库，ASYNC_DATABASE_URL 配置为: {ASYNC_DATABASE_URL.split(':', 1)[0]}")
+if DB_ASYNC and ASYNC_DATABASE_URL:
+    try:
+        from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+        async_engine = create_async_engine(ASYNC_DATABASE_URL, **_engine_options(ASYNC_DATABASE_URL))
+        event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+        AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    except ImportError:
+        async_engine = None
+        AsyncSessionLocal = None
+
+def _migrate_tag_name_index(conn):
+    # 旧库中 ix_tags_name 是全局唯一索引（不同用户不能有同名标签），删除后由 init_db 重建为普通索引
+    sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'index' AND name = 'ix_tags_name'")).scalar()
+    if sql and sql.upper().startswith("CREATE UNIQUE"):
+        conn.execute(text("DROP INDEX ix_tags_name"))
+
 def init_db():
     Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        _migrate_tag_name_index(conn)
+    # create_all 不会给已存在的表补建新索引，这里单独检查创建
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
 
-def calculate_similarity(query: str, text: str) -> float:
+# 模糊匹配只比较文本开头的这些字符，打分代价不随正文长度增长
+SIMILARITY_FUZZY_CHARS = 200
+
+def similarity_tokens(text: str) -> frozenset:
+    # jieba 分词结果加上按空白切分的词，统一小写
+    if not text:
+        return frozenset()
+    # 延迟导入：只做 CRUD 的进程不需要加载 jieba
+    import jieba
+    text_lower = text.lower()
+    words = {tok for tok in jieba.cut(text_lower) if tok.strip()}
+    words.update(text_lower.split())
+    return frozenset(words)
+
+def calculate_similarity(query: str, text: str, text_tokens=None, query_tokens=None) -> float:
+    # text_tokens/query_tokens 可传入预先算好的词集合（如 search_index.note_tokens 的结果），避免重复分词
     if not query or not text:
         return 0.0
     
     query_lower = query.lower()
-    text_lower = text.lower()
-    
-    if query_lower in text_lower:
+    # 子串检查看全文（单次线性扫描）；只有模糊比较限制在开头 SIMILARITY_FUZZY_CHARS 个字符
+    if query_lower in text.lower():
         return 1.0
+    head = text[:SIMILARITY_FUZZY_CHARS].lower()
     
-    similarity = SequenceMatcher(None, query_lower, text_lower).ratio()
+    if query_tokens is None:
+        query_tokens = similarity_tokens(query)
+    if text_tokens is None:
+        text_tokens = similarity_tokens(text)
     
-    query_words = set()
-    text_words = set()
-    
-    try:
-        query_words.update(jieba.cut(query))
-        text_words.update(jieba.cut(text))
-    except:
-        query_words.update(query_lower.split())
-        text_words.update(text_lower.split())
-    
-    query_words.update(query_lower.split())
-    text_words.update(text_lower.split())
-    
-    if query_words:
-        keyword_match = len(query_words & text_words) / len(query_words)
+    if query_tokens:
+        keyword_match = len(query_tokens & text_tokens) / len(query_tokens)
     else:
         keyword_match = 0
+    if keyword_match >= 1:
+        return 1.0
     
-    return max(similarity, keyword_match)
\ No newline at end of file
+    similarity = SequenceMatcher(None, query_lower, head).ratio()
+    return max(similarity, keyword_match)
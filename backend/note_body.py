@@ -0,0 +1,128 @@
+# backend/note_body.py
+# 笔记正文的压缩存储：超过 NOTE_COMPRESS_MIN_BYTES 的正文压缩后以 BLOB 存在 notes.content 中
+# （首字节标记压缩算法），短正文仍按原文存 TEXT；SQLite 的动态类型允许同一列混存两种值。
+# ORM 通过 CompressedText 类型透明地压缩/解压；直接写 SQL 读取该列的地方需调用 decode()。
+# 已有数据的迁移：python note_body.py 压缩库中已有的长正文（--vacuum 同时回收空间），--decompress 还原为原文。
+import argparse
+import os
+import sys
+import zlib
+from sqlalchemy import Text, text
+from sqlalchemy.types import TypeDecorator
+
+# 压缩算法：zlib（默认）或 zstd（需安装 zstandard，未安装时使用 zlib）
+NOTE_COMPRESSION = os.getenv("NOTE_COMPRESSION", "zlib")
+NOTE_COMPRESS_MIN_BYTES = int(os.getenv("NOTE_COMPRESS_MIN_BYTES", "2048"))
+NOTE_ZLIB_LEVEL = int(os.getenv("NOTE_ZLIB_LEVEL", "6"))
+MIGRATE_BATCH_SIZE = 500
+
+ZLIB = b"z"
+ZSTD = b"s"
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def _codec() -> bytes:
+    return ZSTD if NOTE_COMPRESSION == "zstd" and zstandard is not None else ZLIB
+
+
+def encode(content):
+    # 返回要写入数据库的值：短正文或压缩收益不足 1/10 时原样返回字符串
+    if content is None:
+        return None
+    raw = content.encode("utf-8")
+    if len(raw) < NOTE_COMPRESS_MIN_BYTES:
+        return content
+    codec = _codec()
+    if codec == ZSTD:
+        packed = codec + zstandard.ZstdCompressor().compress(raw)
+    else:
+        packed = codec + zlib.compress(raw, NOTE_ZLIB_LEVEL)
+    return packed if len(packed) < len(raw) * 0.9 else content
+
+
+def decode(value):
+    # 数据库中的值还原为正文；字符串原样返回
+    if value is None or isinstance(value, str):
+        return value
+    value = bytes(value)
+    if value[:1] == ZSTD:
+        if zstandard is None:
+            raise RuntimeError("读取 zstd 压缩的笔记需要安装 zstandard")
+        return zstandard.ZstdDecompressor().decompress(value[1:]).decode("utf-8")
+    return zlib.decompress(value[1:]).decode("utf-8")
+
+
+def snippet(value, length: int) -> str:
+    # 正文的前 length 个字；压缩的正文只解压开头一段，不必解压全文
+    if value is None or isinstance(value, str):
+        return (value or "")[:length]
+    value = bytes(value)
+    limit = length * 4
+    if value[:1] == ZSTD:
+        if zstandard is None:
+            raise RuntimeError("读取 zstd 压缩的笔记需要安装 zstandard")
+        head = zstandard.ZstdDecompressor().stream_reader(value[1:]).read(limit)
+    else:
+        head = zlib.decompressobj().decompress(value[1:], limit)
+    # 截断处可能落在多字节字符中间
+    return head.decode("utf-8", errors="ignore")[:length]
+
+
+class CompressedText(TypeDecorator):
+    impl = Text
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return encode(value)
+
+    def process_result_value(self, value, dialect):
+        return decode(value)
+
+
+def compress_existing(conn, decompress: bool = False) -> int:
+    # 按 ID 分批改写已有正文，返回改写的笔记数；直接写 SQL，不改动 updated_at
+    if decompress:
+        condition = "typeof(content) = 'blob'"
+    else:
+        condition = "typeof(content) = 'text' AND length(CAST(content AS BLOB)) >= :min_bytes"
+    changed, last_id = 0, 0
+    while True:
+        rows = conn.execute(text(
+            f"SELECT id, content FROM notes WHERE {condition} AND id > :last_id ORDER BY id LIMIT :limit"
+        ), {"min_bytes": NOTE_COMPRESS_MIN_BYTES, "last_id": last_id, "limit": MIGRATE_BATCH_SIZE}).all()
+        if not rows:
+            return changed
+        updates = []
+        for row in rows:
+            value = decode(row.content) if decompress else encode(row.content)
+            if value is not row.content:
+                updates.append({"id": row.id, "content": value})
+        if updates:
+            conn.execute(text("UPDATE notes SET content = :content WHERE id = :id"), updates)
+            conn.commit()
+        changed += len(updates)
+        last_id = rows[-1].id
+
+
+def main():
+    parser = argparse.ArgumentParser(description="压缩（或还原）已有笔记的正文")
+    parser.add_argument("--decompress", action="store_true", help="把压缩的正文还原为原文（回退到旧版本前使用）")
+    parser.add_argument("--vacuum", action="store_true", help="完成后执行 VACUUM 回收空间")
+    args = parser.parse_args()
+    from models import engine, init_db
+    init_db()
+    with engine.connect() as conn:
+        changed = compress_existing(conn, decompress=args.decompress)
+        print(f"{'还原' if args.decompress else '压缩'}了 {changed} 篇笔记")
+        if args.vacuum:
+            conn.execute(text("VACUUM"))
+            conn.commit()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
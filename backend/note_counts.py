@@ -0,0 +1,136 @@
+# backend/note_counts.py
+# 文件夹/标签的笔记数统计表：笔记新建、删除、移动文件夹，以及标签关联增删时，在调用方的事务中按增量更新计数，
+# 侧边栏的计数接口直接读这张表，不需要扫描笔记。文件夹的子树合计由直接计数沿文件夹树向上累加得到。
+# 计数出现偏差时可以校验并重建：python note_counts.py（只校验）/ python note_counts.py --fix（重建）。
+import argparse
+import sys
+from collections import Counter
+from sqlalchemy import text
+import sync_log
+
+FOLDER = sync_log.FOLDER
+TAG = sync_log.TAG
+# 未归档（folder_id 为空）的笔记记在文件夹 0 下
+UNFILED = 0
+
+_UPSERT = text(
+    "INSERT INTO note_counts (user_id, entity, entity_id, note_count) VALUES (:user_id, :entity, :entity_id, :delta) "
+    "ON CONFLICT (user_id, entity, entity_id) DO UPDATE SET note_count = note_count + excluded.note_count"
+)
+
+
+def adjust(db, user_id: int, entity: str, deltas):
+    # deltas: {entity_id: 增量}
+    rows = [{"user_id": user_id, "entity": entity, "entity_id": entity_id, "delta": delta}
+            for entity_id, delta in deltas.items() if delta]
+    if rows:
+        db.execute(_UPSERT, rows)
+
+
+def folder_key(folder_id) -> int:
+    return folder_id or UNFILED
+
+
+def add_notes(db, user_id: int, folder_ids):
+    # folder_ids：每篇新笔记的文件夹ID（可为 None）
+    adjust(db, user_id, FOLDER, Counter(folder_key(folder_id) for folder_id in folder_ids))
+
+
+def move_note(db, user_id: int, old_folder_id, new_folder_id):
+    old, new = folder_key(old_folder_id), folder_key(new_folder_id)
+    if old != new:
+        adjust(db, user_id, FOLDER, {old: -1, new: 1})
+
+
+def remove_note(db, user_id: int, note_id: int, folder_id):
+    # 在删除笔记之前调用：删掉它的标签关联并减去文件夹和各标签的计数
+    tag_ids = db.execute(
+        text("DELETE FROM note_tags WHERE note_id = :id RETURNING tag_id"), {"id": note_id}
+    ).scalars().all()
+    adjust(db, user_id, FOLDER, {folder_key(folder_id): -1})
+    adjust(db, user_id, TAG, {tag_id: -1 for tag_id in tag_ids})
+
+
+def remove_folder(db, user_id: int, folder_id: int, moved: int):
+    # 删除文件夹，其中 moved 篇笔记移到未归档
+    db.execute(text(
+        "DELETE FROM note_counts WHERE user_id = :user_id AND entity = :entity AND entity_id = :id"
+    ), {"user_id": user_id, "entity": FOLDER, "id": folder_id})
+    adjust(db, user_id, FOLDER, {UNFILED: moved})
+
+
+def counts(db, user_id: int, entity: str) -> dict:
+    return dict(db.execute(text(
+        "SELECT entity_id, note_count FROM note_counts WHERE user_id = :user_id AND entity = :entity"
+    ), {"user_id": user_id, "entity": entity}).all())
+
+
+def _actual(db, user_id=None) -> dict:
+    # 从笔记表和关联表重新统计：{(user_id, entity, entity_id): 笔记数}
+    where = "WHERE user_id = :user_id" if user_id is not None else ""
+    rows = db.execute(text(
+        f"SELECT user_id, COALESCE(folder_id, 0), count(*) FROM notes {where} GROUP BY 1, 2"
+    ), {"user_id": user_id}).all()
+    actual = {(uid, FOLDER, folder_id): n for uid, folder_id, n in rows}
+    where = "WHERE n.user_id = :user_id" if user_id is not None else ""
+    rows = db.execute(text(
+        f"SELECT n.user_id, nt.tag_id, count(*) FROM note_tags nt JOIN notes n ON n.id = nt.note_id {where} GROUP BY 1, 2"
+    ), {"user_id": user_id}).all()
+    actual.update({(uid, TAG, tag_id): n for uid, tag_id, n in rows})
+    return actual
+
+
+def check(db, user_id=None) -> list:
+    # 返回 [(user_id, entity, entity_id, 表中计数, 实际计数)]，计数为0的行与缺失视为一致
+    where = "WHERE user_id = :user_id" if user_id is not None else ""
+    stored = {(uid, entity, entity_id): n for uid, entity, entity_id, n in db.execute(text(
+        f"SELECT user_id, entity, entity_id, note_count FROM note_counts {where}"
+    ), {"user_id": user_id}).all()}
+    actual = _actual(db, user_id)
+    return [
+        (*key, stored.get(key, 0), actual.get(key, 0))
+        for key in sorted(set(stored) | set(actual))
+        if stored.get(key, 0) != actual.get(key, 0)
+    ]
+
+
+def rebuild(engine):
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM note_counts"))
+        rows = [{"user_id": uid, "entity": entity, "entity_id": entity_id, "delta": n}
+                for (uid, entity, entity_id), n in _actual(conn).items()]
+        if rows:
+            conn.execute(_UPSERT, rows)
+
+
+def backfill(engine):
+    # 统计表出现之前就已有笔记时，启动时全量统计一次
+    with engine.connect() as conn:
+        empty = conn.execute(text("SELECT 1 FROM note_counts LIMIT 1")).first() is None
+        has_notes = conn.execute(text("SELECT 1 FROM notes LIMIT 1")).first() is not None
+    if empty and has_notes:
+        rebuild(engine)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="校验（并可重建）文件夹/标签笔记数统计表")
+    parser.add_argument("--fix", action="store_true", help="发现偏差时全量重建")
+    args = parser.parse_args()
+    from models import engine, init_db
+    init_db()
+    with engine.connect() as conn:
+        mismatches = check(conn)
+    for user_id, entity, entity_id, stored, actual in mismatches:
+        print(f"user={user_id} {entity}={entity_id} 统计={stored} 实际={actual}")
+    if not mismatches:
+        print("计数一致")
+        return 0
+    if args.fix:
+        rebuild(engine)
+        print(f"已重建（{len(mismatches)} 项偏差）")
+        return 0
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,354 @@
+# backend/note_io.py
+# 笔记批量导入/导出。
+# 导入：JSONL（每行一条笔记）或 Markdown 压缩包，逐条解析，每 IMPORT_BATCH_SIZE 条一个事务批量写入，
+#       文件夹按路径、标签按名称映射，不存在的自动创建。
+# 导出：生成器按ID分批读取，边读边输出 JSONL 或 Markdown 压缩包，内存占用与笔记总量无关。
+import json
+import logging
+import os
+import posixpath
+import re
+import zipfile
+from datetime import datetime
+from sqlalchemy import select
+from models import Note, Folder, Tag, note_tags
+import duplicates
+import note_counts
+import revisions
+import search_index
+import sync_log
+import tag_service
+import vector_index
+
+logger = logging.getLogger(__name__)
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+# 压缩包中单个 Markdown 文件的大小上限（解压后），超过的跳过并记入报告
+IMPORT_MAX_MEMBER_MB = float(os.getenv("IMPORT_MAX_MEMBER_MB", "10"))
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "100"))
+# 导入报告里最多列出的错误条数
+MAX_REPORTED_ERRORS = 20
+MARKDOWN_SUFFIXES = (".md", ".markdown")
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+def _parse_datetime(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).replace(tzinfo=None)
+    except ValueError:
+        return None
+
+
+def _folder_path(value) -> tuple:
+    # "工作/项目A" 或 ["工作", "项目A"] -> ("工作", "项目A")
+    if not value:
+        return ()
+    parts = value if isinstance(value, list) else str(value).split("/")
+    return tuple(str(part).strip() for part in parts if str(part).strip())
+
+
+def _tag_names(value) -> list:
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(",")
+    return [str(name).strip() for name in value if str(name).strip()]
+
+
+def normalize_record(record) -> dict:
+    if not isinstance(record, dict):
+        raise ImportFormatError("每条记录必须是JSON对象")
+    title = str(record.get("title") or "").strip()
+    content = record.get("content") or ""
+    if not title and not content:
+        raise ImportFormatError("标题和内容不能同时为空")
+    return {
+        "title": title or "无标题",
+        "content": str(content),
+        "folder": _folder_path(record.get("folder")),
+        "tags": _tag_names(record.get("tags")),
+        "updated_at": _parse_datetime(record.get("updated_at")),
+    }
+
+
+def iter_jsonl(stream):
+    # 逐行读取，产出 (行号, 记录或异常)
+    for line_no, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_no, normalize_record(json.loads(line))
+        except (ValueError, ImportFormatError) as e:
+            yield line_no, e
+
+
+def parse_markdown(text: str, default_title: str) -> dict:
+    # 可选的头部元数据块：--- 与 --- 之间每行 "键: 值"，值可以是JSON
+    meta = {}
+    if text.startswith("---\n"):
+        end = text.find("\n---", 4)
+        if end != -1:
+            for line in text[4:end].splitlines():
+                key, sep, value = line.partition(":")
+                if not sep:
+                    continue
+                value = value.strip()
+                try:
+                    value = json.loads(value)
+                except ValueError:
+                    pass
+                meta[key.strip()] = value
+            text = text[end + 4:].lstrip("\n")
+    meta.setdefault("title", default_title)
+    meta["content"] = text
+    return meta
+
+
+def iter_markdown_zip(fileobj):
+    # 每个 .md 文件一条笔记，所在目录即文件夹路径，文件名（或元数据中的 title）即标题
+    try:
+        archive = zipfile.ZipFile(fileobj)
+    except zipfile.BadZipFile:
+        raise ImportFormatError("不是有效的zip文件")
+    max_bytes = int(IMPORT_MAX_MEMBER_MB * 1024 * 1024)
+    with archive:
+        for info in archive.infolist():
+            name = info.filename
+            if info.is_dir() or not name.lower().endswith(MARKDOWN_SUFFIXES) or "__MACOSX/" in name:
+                continue
+            # file_size 取自目录项；zipfile 读取时不会超出这个长度，所以先检查即可防止解压炸弹
+            if info.file_size > max_bytes:
+                yield name, ImportFormatError(f"文件超过 {IMPORT_MAX_MEMBER_MB:g}MB 上限")
+                continue
+            try:
+                text = archive.read(info).decode("utf-8-sig")
+                directory, filename = posixpath.split(name)
+                record = parse_markdown(text, posixpath.splitext(filename)[0])
+                record.setdefault("folder", directory)
+                yield name, normalize_record(record)
+            except (UnicodeDecodeError, ImportFormatError) as e:
+                yield name, e
+
+
+def folder_names(db, user_id: int) -> dict:
+    # folder_id -> 从根到该文件夹的名称元组
+    rows = db.query(Folder.id, Folder.name, Folder.parent_id).filter(Folder.user_id == user_id).all()
+    by_id = {row.id: row for row in rows}
+    names = {}
+    for row in rows:
+        path, current, seen = [], row, set()
+        while current is not None and current.id not in seen:
+            seen.add(current.id)
+            path.append(current.name)
+            current = by_id.get(current.parent_id)
+        names[row.id] = tuple(reversed(path))
+    return names
+
+
+class NoteImporter:
+    # 累积记录，满一批后在一个事务中写入笔记、全文索引和标签
+    def __init__(self, db, user_id: int, batch_size: int = IMPORT_BATCH_SIZE):
+        self.db = db
+        self.user_id = user_id
+        self.batch_size = batch_size
+        self.pending = []
+        self.folders = self._load_folders()
+        self.imported = 0
+        self.folders_created = 0
+        self.errors = []
+        self.failed = 0
+
+    def _load_folders(self) -> dict:
+        # 已有文件夹按 (名称, ...) 路径建立映射
+        paths = {}
+        for folder_id, names in folder_names(self.db, self.user_id).items():
+            paths.setdefault(names, folder_id)
+        return paths
+
+    def _folder_id(self, path: tuple):
+        if not path:
+            return None
+        folder_id = self.folders.get(path)
+        if folder_id is None:
+            folder = Folder(name=path[-1], user_id=self.user_id, parent_id=self._folder_id(path[:-1]))
+            self.db.add(folder)
+            self.db.flush()
+            folder_id = self.folders[path] = folder.id
+            sync_log.touch(self.db, self.user_id, sync_log.FOLDER, [folder_id])
+            self.folders_created += 1
+        return folder_id
+
+    def _fail(self, source, error):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"source": source, "error": str(error)})
+
+    def add(self, source, record):
+        if isinstance(record, Exception):
+            self._fail(source, record)
+            return
+        self.pending.append((source, record))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        records = [record for _, record in batch]
+        folders_created = self.folders_created
+        notes = []
+        try:
+            for record in records:
+                note = Note(
+                    title=record["title"],
+                    content=record["content"],
+                    user_id=self.user_id,
+                    folder_id=self._folder_id(record["folder"]),
+                )
+                if record["updated_at"]:
+                    note.updated_at = record["updated_at"]
+                notes.append(note)
+            self.db.add_all(notes)
+            self.db.flush()
+            note_ids = [note.id for note in notes]
+            search_index.index_new_notes(self.db, notes)
+            duplicates.index_new_notes(self.db, notes)
+            revisions.record_new_notes(self.db, notes)
+            note_counts.add_notes(self.db, self.user_id, [note.folder_id for note in notes])
+            sync_log.touch(self.db, self.user_id, sync_log.NOTE, note_ids)
+            tag_service.assign_tags(self.db, self.user_id, {
+                note_id: record["tags"] for note_id, record in zip(note_ids, records) if record["tags"]
+            })
+            self.db.commit()
+        except Exception as e:
+            # 整批回滚，批内每条记为失败，继续处理后面的批次
+            logger.exception("导入批次写入失败（%d 条）", len(batch))
+            self.db.rollback()
+            self.db.expunge_all()
+            self.folders = self._load_folders()
+            self.folders_created = folders_created
+            for source, _ in batch:
+                self._fail(source, f"写入失败: {e}")
+            return
+        for note_id in note_ids:
+            vector_index.mark_dirty(self.user_id, note_id)
+        self.imported += len(note_ids)
+        # 已提交的对象不再需要，避免会话随导入量增长
+        self.db.expunge_all()
+
+    def report(self) -> dict:
+        return {
+            "imported": self.imported,
+            "failed": self.failed,
+            "folders_created": self.folders_created,
+            "errors": self.errors,
+        }
+
+
+def import_notes(db, user_id: int, fileobj, fmt: str) -> dict:
+    importer = NoteImporter(db, user_id)
+    records = iter_markdown_zip(fileobj) if fmt == "markdown" else iter_jsonl(fileobj)
+    for source, record in records:
+        importer.add(source, record)
+    importer.flush()
+    return importer.report()
+
+
+def detect_format(filename: str) -> str:
+    return "markdown" if (filename or "").lower().endswith(".zip") else "jsonl"
+
+
+def iter_note_batches(session_factory, user_id: int, batch_size: int = EXPORT_BATCH_SIZE):
+    # 按ID键集分页逐批读取，每批附带文件夹路径和标签；使用独立会话，生成器结束时关闭
+    db = session_factory()
+    try:
+        folder_paths = {folder_id: "/".join(names) for folder_id, names in folder_names(db, user_id).items()}
+        last_id = 0
+        while True:
+            rows = db.execute(
+                select(Note.id, Note.title, Note.content, Note.folder_id, Note.updated_at)
+                .where(Note.user_id == user_id, Note.id > last_id)
+                .order_by(Note.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            tags = {}
+            for note_id, name in db.execute(
+                select(note_tags.c.note_id, Tag.name)
+                .join(Tag, Tag.id == note_tags.c.tag_id)
+                .where(note_tags.c.note_id.in_([row.id for row in rows]))
+            ).all():
+                tags.setdefault(note_id, []).append(name)
+            yield [{
+                "id": row.id,
+                "title": row.title,
+                "content": row.content or "",
+                "folder": folder_paths.get(row.folder_id, ""),
+                "tags": tags.get(row.id, []),
+                "updated_at": row.updated_at.isoformat() if row.updated_at else None,
+            } for row in rows]
+            db.expunge_all()
+    finally:
+        db.close()
+
+
+def export_jsonl(session_factory, user_id: int):
+    for batch in iter_note_batches(session_factory, user_id):
+        for record in batch:
+            yield (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+class _ChunkWriter:
+    # 只追加的文件对象：zipfile 写入的数据暂存在这里，由生成器取走后清空
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+_UNSAFE_FILENAME = re.compile(r'[\\/:*?"<>|\x00-\x1f]')
+
+
+def markdown_filename(record) -> str:
+    title = _UNSAFE_FILENAME.sub("_", record["title"]).strip(" .")[:80] or "无标题"
+    name = f"{record['id']}_{title}.md"
+    return f"{record['folder']}/{name}" if record["folder"] else name
+
+
+def render_markdown(record) -> str:
+    meta = "\n".join(f"{key}: {json.dumps(record[key], ensure_ascii=False)}" for key in ("title", "tags", "updated_at"))
+    return f"---\n{meta}\n---\n{record['content']}"
+
+
+def export_markdown_zip(session_factory, user_id: int):
+    # zipfile 对不可 seek 的输出会使用数据描述符，可以边压缩边输出
+    writer = _ChunkWriter()
+    with zipfile.ZipFile(writer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for batch in iter_note_batches(session_factory, user_id):
+            for record in batch:
+                archive.writestr(markdown_filename(record), render_markdown(record))
+                yield writer.drain()
+    yield writer.drain()
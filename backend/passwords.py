@@ -0,0 +1,137 @@
+# backend/passwords.py
+# 密码哈希：bcrypt 计算放到独立的进程池里，在途任务数有上限，超出时直接拒绝（调用方返回429），
+# 避免登录洪峰占满线程池拖慢其他接口。另含按用户名/IP 的登录失败限流。
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from passlib.context import CryptContext
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+PASSWORD_QUEUE_SIZE = int(os.getenv("PASSWORD_QUEUE_SIZE", "32"))
+
+LOGIN_WINDOW_SECONDS = int(os.getenv("LOGIN_WINDOW_SECONDS", "300"))
+LOGIN_MAX_FAILURES_PER_USER = int(os.getenv("LOGIN_MAX_FAILURES_PER_USER", "5"))
+LOGIN_MAX_FAILURES_PER_IP = int(os.getenv("LOGIN_MAX_FAILURES_PER_IP", "20"))
+
+# 轮数固定为 BCRYPT_ROUNDS：轮数不同的旧哈希在登录时会被判定为需要更新并重新计算
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+
+class HashingBusy(Exception):
+    # 在途哈希任务已满
+    pass
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify_and_update(password: str, hashed: str):
+    # 返回 (是否匹配, 需要替换的新哈希或None)
+    try:
+        return pwd_context.verify_and_update(password, hashed)
+    except (ValueError, TypeError):
+        return False, None
+
+
+class PasswordHasher:
+    def __init__(self, workers=PASSWORD_WORKERS, max_pending=PASSWORD_QUEUE_SIZE):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._pending = 0
+        self.rejected_total = 0
+
+    def _get_pool(self):
+        # 首次使用时才创建进程池
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                    )
+        return self._pool
+
+    async def _submit(self, fn, *args):
+        if self._pending >= self.max_pending:
+            self.rejected_total += 1
+            raise HashingBusy("密码计算队列已满")
+        self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._get_pool(), fn, *args)
+        finally:
+            self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(_hash, password)
+
+    async def verify_and_update(self, password: str, hashed: str):
+        return await self._submit(_verify_and_update, password, hashed)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+class LoginThrottle:
+    # 滑动窗口内的登录失败计数；超过阈值的用户名或IP在窗口期内直接拒绝，不再消耗bcrypt计算
+    def __init__(self, window=LOGIN_WINDOW_SECONDS, max_per_user=LOGIN_MAX_FAILURES_PER_USER,
+                 max_per_ip=LOGIN_MAX_FAILURES_PER_IP):
+        self.window = window
+        self.max_per_user = max_per_user
+        self.max_per_ip = max_per_ip
+        self._failures = defaultdict(deque)
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    def _count(self, key, now):
+        attempts = self._failures.get(key)
+        if not attempts:
+            return 0
+        while attempts and attempts[0] <= now - self.window:
+            attempts.popleft()
+        if not attempts:
+            del self._failures[key]
+            return 0
+        return len(attempts)
+
+    def retry_after(self, username: str, ip: str) -> int:
+        # 返回需要等待的秒数，0 表示允许尝试
+        now = time.monotonic()
+        with self._lock:
+            waits = []
+            for key, limit in ((("user", username), self.max_per_user), (("ip", ip), self.max_per_ip)):
+                if self._count(key, now) >= limit:
+                    waits.append(self._failures[key][0] + self.window - now)
+            return int(max(waits)) + 1 if waits else 0
+
+    def _sweep(self, now):
+        # 只出现一次的用户名/IP 不会再被 _count 清理，每个窗口整体清扫一次过期的键
+        for key in list(self._failures):
+            self._count(key, now)
+        self._last_sweep = now
+
+    def record_failure(self, username: str, ip: str):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_sweep >= self.window:
+                self._sweep(now)
+            self._failures[("user", username)].append(now)
+            self._failures[("ip", ip)].append(now)
+
+    def record_success(self, username: str):
+        with self._lock:
+            self._failures.pop(("user", username), None)
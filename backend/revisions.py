@@ -0,0 +1,209 @@
+# backend/revisions.py
+# 笔记历史版本：每次保存记录一个版本。每 REVISION_SNAPSHOT_INTERVAL 个版本存一次 zlib 压缩的完整快照，
+# 其余版本只存相对上一个保留版本的差量（复制旧文本区间 / 插入新文本的操作列表，JSON 后 zlib 压缩）。
+# 还原某个版本时从所在段的快照开始依次应用差量。
+# 超出最近 REVISION_KEEP_RECENT 个版本的旧段会被合并：段内只保留快照和每 REVISION_COMPACT_STRIDE 个版本中的一个，
+# 被删掉版本的差量并入下一个保留版本。
+import json
+import os
+import zlib
+from difflib import SequenceMatcher
+from sqlalchemy import select, delete, func
+from models import NoteRevision
+
+REVISION_SNAPSHOT_INTERVAL = int(os.getenv("REVISION_SNAPSHOT_INTERVAL", "50"))
+REVISION_KEEP_RECENT = int(os.getenv("REVISION_KEEP_RECENT", "200"))
+REVISION_COMPACT_STRIDE = int(os.getenv("REVISION_COMPACT_STRIDE", "10"))
+
+
+class RevisionNotFound(Exception):
+    pass
+
+
+def _common_prefix(a: str, b: str) -> int:
+    # 二分查找公共前缀长度，切片比较在C层完成
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _common_suffix(a: str, b: str, limit: int) -> int:
+    lo, hi = 0, limit
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[len(a) - mid:] == b[len(b) - mid:]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def make_delta(old: str, new: str) -> list:
+    # 返回操作列表：[start, end] 复制旧文本 old[start:end]，字符串为插入的新文本
+    prefix = _common_prefix(old, new)
+    suffix = _common_suffix(old, new, min(len(old), len(new)) - prefix)
+    old_mid, new_mid = old[prefix:len(old) - suffix], new[prefix:len(new) - suffix]
+    ops = [[0, prefix]] if prefix else []
+    if "\n" in old_mid and "\n" in new_mid:
+        # 中间部分跨多行时按行比较，保留未改动的行
+        old_lines, new_lines = old_mid.splitlines(keepends=True), new_mid.splitlines(keepends=True)
+        offsets = [prefix]
+        for line in old_lines:
+            offsets.append(offsets[-1] + len(line))
+        for tag, i1, i2, j1, j2 in SequenceMatcher(None, old_lines, new_lines, autojunk=False).get_opcodes():
+            if tag == "equal":
+                ops.append([offsets[i1], offsets[i2]])
+            elif j2 > j1:
+                ops.append("".join(new_lines[j1:j2]))
+    elif new_mid:
+        ops.append(new_mid)
+    if suffix:
+        ops.append([len(old) - suffix, len(old)])
+    return ops
+
+
+def apply_delta(old: str, ops: list) -> str:
+    return "".join(op if isinstance(op, str) else old[op[0]:op[1]] for op in ops)
+
+
+def _encode_text(content: str) -> bytes:
+    return zlib.compress((content or "").encode("utf-8"))
+
+
+def _encode_delta(ops: list) -> bytes:
+    return zlib.compress(json.dumps(ops, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+
+def _decode(row, previous: str) -> str:
+    raw = zlib.decompress(row.data).decode("utf-8")
+    return raw if row.is_snapshot else apply_delta(previous, json.loads(raw))
+
+
+def _latest(db, note_id: int):
+    return db.execute(
+        select(NoteRevision).where(NoteRevision.note_id == note_id).order_by(NoteRevision.rev.desc()).limit(1)
+    ).scalar()
+
+
+def _segment(db, note_id: int, rev: int) -> list:
+    # rev 所在段：从不晚于 rev 的最近快照到 rev 的全部保留版本
+    start = db.execute(
+        select(func.max(NoteRevision.rev)).where(
+            NoteRevision.note_id == note_id, NoteRevision.rev <= rev, NoteRevision.is_snapshot == 1
+        )
+    ).scalar()
+    if start is None:
+        return []
+    return db.execute(
+        select(NoteRevision).where(
+            NoteRevision.note_id == note_id, NoteRevision.rev >= start, NoteRevision.rev <= rev
+        ).order_by(NoteRevision.rev)
+    ).scalars().all()
+
+
+def _reconstruct(rows) -> str:
+    content = ""
+    for row in rows:
+        content = _decode(row, content)
+    return content
+
+
+def record(db, note, previous_title=None, previous_content=None):
+    # 在调用方的事务中为笔记当前内容追加一个版本；笔记还没有历史时先把修改前的内容记为第一个版本
+    latest = _latest(db, note.id)
+    if latest is None and previous_content is not None and (previous_title, previous_content) != (note.title, note.content):
+        db.add(NoteRevision(
+            note_id=note.id, user_id=note.user_id, rev=1, is_snapshot=1,
+            title=previous_title, data=_encode_text(previous_content),
+        ))
+        db.flush()
+        latest = _latest(db, note.id)
+    if latest is None:
+        rev, snapshot, base = 1, True, None
+    else:
+        base = _reconstruct(_segment(db, note.id, latest.rev))
+        if latest.title == note.title and base == (note.content or ""):
+            return latest.rev
+        rev = latest.rev + 1
+        snapshot = (rev - 1) % REVISION_SNAPSHOT_INTERVAL == 0
+    db.add(NoteRevision(
+        note_id=note.id, user_id=note.user_id, rev=rev, is_snapshot=int(snapshot), title=note.title,
+        data=_encode_text(note.content) if snapshot else _encode_delta(make_delta(base, note.content or "")),
+    ))
+    if snapshot and rev > REVISION_KEEP_RECENT + REVISION_SNAPSHOT_INTERVAL:
+        # 新段开始时，把刚移出保留窗口的那一段合并（段从快照版本开始，即 rev ≡ 1）
+        oldest_kept = rev - REVISION_KEEP_RECENT
+        compact_segment(db, note.id, ((oldest_kept - 1) // REVISION_SNAPSHOT_INTERVAL - 1) * REVISION_SNAPSHOT_INTERVAL + 1)
+    return rev
+
+
+def record_new_notes(db, notes):
+    # 批量新建的笔记（导入）没有历史，直接写入第一个版本的快照
+    db.add_all([
+        NoteRevision(note_id=note.id, user_id=note.user_id, rev=1, is_snapshot=1,
+                     title=note.title, data=_encode_text(note.content))
+        for note in notes
+    ])
+
+
+def compact_segment(db, note_id: int, start_rev: int):
+    # 段内只保留快照和 rev 为 REVISION_COMPACT_STRIDE 整数倍的版本，保留版本的差量改为相对上一个保留版本
+    rows = db.execute(
+        select(NoteRevision).where(
+            NoteRevision.note_id == note_id,
+            NoteRevision.rev >= start_rev,
+            NoteRevision.rev < start_rev + REVISION_SNAPSHOT_INTERVAL,
+        ).order_by(NoteRevision.rev)
+    ).scalars().all()
+    if not rows or not rows[0].is_snapshot:
+        return
+    content = kept_content = ""
+    removed = []
+    for row in rows:
+        content = _decode(row, content)
+        if row.is_snapshot or row.rev % REVISION_COMPACT_STRIDE == 0:
+            if not row.is_snapshot:
+                row.data = _encode_delta(make_delta(kept_content, content))
+            kept_content = content
+        else:
+            removed.append(row.id)
+    if removed:
+        db.execute(delete(NoteRevision).where(NoteRevision.id.in_(removed)))
+
+
+def list_revisions(db, note_id: int, limit: int = 50, before=None) -> list:
+    query = select(
+        NoteRevision.rev, NoteRevision.title, NoteRevision.is_snapshot, NoteRevision.created_at,
+        func.length(NoteRevision.data).label("size"),
+    ).where(NoteRevision.note_id == note_id)
+    if before is not None:
+        query = query.where(NoteRevision.rev < before)
+    rows = db.execute(query.order_by(NoteRevision.rev.desc()).limit(limit)).all()
+    return [{
+        "rev": row.rev,
+        "title": row.title,
+        "snapshot": bool(row.is_snapshot),
+        "size": row.size,
+        "created_at": row.created_at,
+    } for row in rows]
+
+
+def get_revision(db, note_id: int, rev: int) -> dict:
+    rows = _segment(db, note_id, rev)
+    if not rows or rows[-1].rev != rev:
+        raise RevisionNotFound(rev)
+    return {
+        "rev": rev,
+        "title": rows[-1].title,
+        "content": _reconstruct(rows),
+        "created_at": rows[-1].created_at,
+    }
+
+
+def remove_note(db, note_id: int):
+    db.execute(delete(NoteRevision).where(NoteRevision.note_id == note_id))
@@ -0,0 +1,199 @@
+# backend/search_index.py
+# 基于 SQLite FTS5 的全文倒排索引：笔记写入时用 jieba 分词后入索引，
+# 搜索时按 BM25 排序并分页，代价只与命中数相关，而不是与笔记总量相关。
+# 写入时还把相似度打分用的词集合（jieba 精确模式分词加空白切分，小写）存在不参与检索的列里（带LRU缓存），
+# 打分时不再对正文重新分词。
+import logging
+import os
+import threading
+from collections import OrderedDict
+from sqlalchemy import text
+import metrics
+import note_body
+from models import similarity_tokens
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = "notes_fts"
+FTS_COLUMNS = ("title", "content", "user_id", "title_terms", "content_terms")
+INSERT_SQL = (f"INSERT INTO {FTS_TABLE}(rowid, title, content, user_id, title_terms, content_terms) "
+              "VALUES (:id, :title, :content, :user_id, :title_terms, :content_terms)")
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "5000"))
+
+# 标题权重高于正文（与原先 title_score * 2 保持一致）
+TITLE_WEIGHT = 2.0
+CONTENT_WEIGHT = 1.0
+
+
+def tokenize(content: str) -> str:
+    # 搜索引擎模式分词，切出更细的词以提高召回；索引中以空格分隔
+    if not content:
+        return ""
+    import jieba
+    with metrics.section("jieba"):
+        return " ".join(tok for tok in jieba.cut_for_search(content) if tok.strip())
+
+
+def similarity_terms(content: str) -> str:
+    # 相似度打分用的词集合，以空格分隔存入索引（词本身不含空白）
+    if not content:
+        return ""
+    with metrics.section("jieba"):
+        return " ".join(similarity_tokens(content))
+
+
+def _row(note_id, title, content, user_id) -> dict:
+    return {
+        "id": note_id, "title": tokenize(title), "content": tokenize(content), "user_id": user_id,
+        "title_terms": similarity_terms(title), "content_terms": similarity_terms(content),
+    }
+
+
+def build_match_query(query: str) -> str:
+    # 把查询切成词后逐个加引号，避免用户输入被当成 FTS5 语法；词之间为 AND 关系
+    import jieba
+    tokens = []
+    for tok in jieba.cut(query):
+        tok = tok.strip().lower()
+        if tok and any(ch.isalnum() for ch in tok) and tok not in tokens:
+            tokens.append(tok)
+    return " ".join('"' + tok.replace('"', '""') + '"' for tok in tokens)
+
+
+def init_search_index(engine):
+    # 创建 FTS5 虚表；若索引为空而已有笔记，则从 notes 表回填。
+    # 旧版本的虚表没有打分词集合列，删掉后按新结构重建
+    with engine.begin() as conn:
+        columns = tuple(row[1] for row in conn.execute(text(f"PRAGMA table_info({FTS_TABLE})")))
+        if columns and columns != FTS_COLUMNS:
+            logger.warning("全文索引结构已变化，重建 %s", FTS_TABLE)
+            conn.execute(text(f"DROP TABLE {FTS_TABLE}"))
+        conn.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(title, content, user_id UNINDEXED, "
+            "title_terms UNINDEXED, content_terms UNINDEXED, tokenize='unicode61')"
+        ))
+        indexed = conn.execute(text(f"SELECT count(*) FROM {FTS_TABLE}")).scalar()
+        if indexed == 0:
+            rows = conn.execute(text("SELECT id, title, content, user_id FROM notes")).fetchall()
+            for row in rows:
+                _insert(conn, row.id, row.title, note_body.decode(row.content), row.user_id)
+
+
+def rebuild_search_index(engine):
+    # 清空后全量重建（分词规则变化后使用）
+    with engine.begin() as conn:
+        conn.execute(text(f"DELETE FROM {FTS_TABLE}"))
+    init_search_index(engine)
+
+
+def _insert(conn, note_id, title, content, user_id):
+    conn.execute(text(INSERT_SQL), _row(note_id, title, content, user_id))
+
+
+def index_note(db, note):
+    # 在调用方的事务中同步索引，随 db.commit() 一起提交
+    if note.id is None:
+        db.flush()
+    remove_note(db, note.id)
+    _insert(db, note.id, note.title, note.content, note.user_id)
+
+
+def index_new_notes(db, notes):
+    # 批量导入用：新笔记没有旧索引行，一条 executemany 写入
+    if notes:
+        db.execute(text(INSERT_SQL), [_row(note.id, note.title, note.content, note.user_id) for note in notes])
+
+
+def index_notes(db, notes):
+    # 批量重建已有笔记的索引：先全部分词再写入，分词期间不持有数据库写锁
+    rows = [_row(note.id, note.title, note.content, note.user_id) for note in notes]
+    if not rows:
+        return
+    db.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid IN (%s)" % ",".join(str(int(row["id"])) for row in rows)))
+    db.execute(text(INSERT_SQL), rows)
+    for row in rows:
+        token_cache.invalidate(row["id"])
+
+
+def remove_note(db, note_id: int):
+    db.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :id"), {"id": note_id})
+    token_cache.invalidate(note_id)
+
+
+class TokenCache:
+    # note_id -> (标题词集合, 正文词集合) 的LRU缓存
+    def __init__(self, max_entries=TOKEN_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, note_ids) -> dict:
+        found = {}
+        with self._lock:
+            for note_id in note_ids:
+                entry = self._entries.get(note_id)
+                if entry is not None:
+                    self._entries.move_to_end(note_id)
+                    found[note_id] = entry
+        return found
+
+    def set(self, note_id, tokens):
+        with self._lock:
+            self._entries[note_id] = tokens
+            self._entries.move_to_end(note_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, note_id):
+        with self._lock:
+            self._entries.pop(note_id, None)
+
+
+token_cache = TokenCache()
+
+
+def _token_set(terms: str) -> frozenset:
+    return frozenset(terms.split()) if terms else frozenset()
+
+
+def note_tokens(db, note_ids) -> dict:
+    # 返回 {note_id: (标题词集合, 正文词集合)}；未命中缓存的从索引中一次读出写入时保存的词集合
+    tokens = token_cache.get_many(note_ids)
+    missing = [int(note_id) for note_id in note_ids if note_id not in tokens]
+    if missing:
+        rows = db.execute(text(
+            f"SELECT rowid, title_terms, content_terms FROM {FTS_TABLE} WHERE rowid IN (%s)" % ",".join(map(str, missing))
+        )).fetchall()
+        for row in rows:
+            tokens[row.rowid] = (_token_set(row.title_terms), _token_set(row.content_terms))
+            token_cache.set(row.rowid, tokens[row.rowid])
+    return tokens
+
+
+def warm_up():
+    # 提前加载 jieba 词典，避免第一次搜索或写入时承担数秒的加载开销；
+    # jieba 在这里和各分词函数中才导入，不拖慢进程启动
+    import jieba
+    jieba.initialize()
+
+
+def search(db, user_id: int, query: str, limit: int = 20, offset: int = 0):
+    # 返回 (按相关度排序的 [(note_id, score)], 命中总数)；score 越大越相关
+    match = build_match_query(query)
+    if not match:
+        return [], 0
+    params = {"match": match, "user_id": user_id}
+    total = db.execute(
+        text(f"SELECT count(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match AND user_id = :user_id"),
+        params,
+    ).scalar()
+    rows = db.execute(
+        text(
+            f"SELECT rowid, bm25({FTS_TABLE}, {TITLE_WEIGHT}, {CONTENT_WEIGHT}) AS rank FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH :match AND user_id = :user_id "
+            "ORDER BY rank LIMIT :limit OFFSET :offset"
+        ),
+        {**params, "limit": limit, "offset": offset},
+    ).fetchall()
+    # bm25() 返回值越小越相关，取反后作为分数
+    return [(row.rowid, -row.rank) for row in rows], total
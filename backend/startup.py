@@ -0,0 +1,80 @@
+# backend/startup.py
+# 分阶段启动：核心阶段（建表、全文索引、同步索引补齐）完成后立即开始服务 CRUD 接口，
+# jieba 词典、摘要/语音模型进程池、向量模型（关键词提取共用）随后在后台预热，各项状态由 /readyz 报告。
+# AI_ENABLED=0 关闭全部 AI 模块（只提供 CRUD 的实例），也可以用单项开关分别关闭。
+import asyncio
+import os
+import time
+
+AI_ENABLED = os.getenv("AI_ENABLED", "1") == "1"
+SUMMARIZER_ENABLED = AI_ENABLED and os.getenv("SUMMARIZER_ENABLED", "1") == "1"
+ASR_ENABLED = AI_ENABLED and os.getenv("ASR_ENABLED", "1") == "1"
+KEYWORDS_ENABLED = AI_ENABLED and os.getenv("KEYWORDS_ENABLED", "1") == "1"
+EMBEDDINGS_ENABLED = AI_ENABLED and os.getenv("EMBEDDINGS_ENABLED", "1") == "1"
+
+PENDING = "pending"
+WARMING = "warming"
+READY = "ready"
+FAILED = "failed"
+DISABLED = "disabled"
+
+# 接口返回 503 时使用的功能名称
+LABELS = {
+    "summarizer": "摘要",
+    "transcriber": "语音转写",
+    "keywords": "关键词提取",
+    "embeddings": "语义搜索",
+}
+
+
+class Capabilities:
+    # 记录每项能力的状态和进入该状态时距启动的秒数
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._states = {}
+
+    def declare(self, name: str, enabled: bool = True):
+        self.set(name, PENDING if enabled else DISABLED)
+
+    def set(self, name: str, state: str, error=None):
+        entry = {"state": state, "seconds": round(time.perf_counter() - self.started, 3)}
+        if error:
+            entry["error"] = error
+        self._states[name] = entry
+
+    def state(self, name: str):
+        entry = self._states.get(name)
+        return entry["state"] if entry else None
+
+    def ready(self, name: str) -> bool:
+        return self.state(name) == READY
+
+    def report(self) -> dict:
+        return {name: dict(entry) for name, entry in self._states.items()}
+
+    async def warm(self, name: str, awaitable_factory):
+        # awaitable_factory() 返回要等待的协程；异常记为 failed，不影响其他能力
+        if self.state(name) == DISABLED:
+            return
+        self.set(name, WARMING)
+        try:
+            await awaitable_factory()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.set(name, FAILED, str(e) or type(e).__name__)
+            return
+        self.set(name, READY)
+
+
+async def warm_up(capabilities: Capabilities, sequential, concurrent):
+    # sequential：在主进程线程中加载的能力，依次进行，避免在小机器上互相争抢CPU；
+    # concurrent：在独立进程中预热的模型池，只需等待完成
+    tasks = [asyncio.create_task(capabilities.warm(name, factory)) for name, factory in concurrent]
+    try:
+        for name, factory in sequential:
+            await capabilities.warm(name, factory)
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
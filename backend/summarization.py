@@ -0,0 +1,122 @@
+# backend/summarization.py
+# 长文本分段摘要（map-reduce）：按句子边界把笔记切成长度受限的段落，
+# 各段并行送入摘要服务（由 inference.BatchingWorker 合批），再把段落摘要合并后做最终摘要。
+import asyncio
+import re
+from starlette.concurrency import run_in_threadpool
+
+# bart-large-cnn 最多约1024个token，按分词数留出余量
+MAX_CHUNK_TOKENS = 400
+# 单个请求同时在途的段落数，避免一篇长笔记占满推理队列
+MAX_PARALLEL_CHUNKS = 8
+# reduce 最多递归的层数，防止模型输出不收敛
+MAX_REDUCE_LEVELS = 4
+
+_SENTENCE_END = re.compile(r"(?<=[。！？!?；;…\n])|(?<=[.]\s)")
+
+
+def split_sentences(content: str) -> list:
+    return [s for s in _SENTENCE_END.split(content) if s.strip()]
+
+
+def count_tokens(sentence: str) -> int:
+    # jieba 对中文按词切分、对英文按单词切分，近似模型的token数
+    import jieba
+    return sum(1 for tok in jieba.cut(sentence) if tok.strip())
+
+
+def chunk_text(content: str, max_tokens: int = MAX_CHUNK_TOKENS) -> list:
+    chunks = []
+    current = []
+    current_tokens = 0
+    for sentence in split_sentences(content):
+        tokens = count_tokens(sentence)
+        if tokens > max_tokens:
+            # 超长的单句按词硬切
+            if current:
+                chunks.append("".join(current))
+                current, current_tokens = [], 0
+            import jieba
+            words = list(jieba.cut(sentence))
+            piece, piece_tokens = [], 0
+            for word in words:
+                piece.append(word)
+                if word.strip():
+                    piece_tokens += 1
+                if piece_tokens >= max_tokens:
+                    chunks.append("".join(piece))
+                    piece, piece_tokens = [], 0
+            if piece:
+                current, current_tokens = piece, piece_tokens
+            continue
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append("".join(current))
+            current, current_tokens = [], 0
+        current.append(sentence)
+        current_tokens += tokens
+    if current:
+        chunks.append("".join(current))
+    return chunks
+
+
+async def _map(service, chunks, params, on_partial=None):
+    limit = asyncio.Semaphore(MAX_PARALLEL_CHUNKS)
+
+    async def run(index, chunk):
+        async with limit:
+            return index, await service.submit(chunk, **params)
+
+    tasks = [asyncio.create_task(run(i, chunk)) for i, chunk in enumerate(chunks)]
+    summaries = [None] * len(chunks)
+    try:
+        for finished in asyncio.as_completed(tasks):
+            index, summary = await finished
+            summaries[index] = summary
+            if on_partial:
+                await on_partial(index, summary)
+    finally:
+        for task in tasks:
+            task.cancel()
+    return summaries
+
+
+async def summarize_events(service, content: str, params: dict, max_tokens: int = MAX_CHUNK_TOKENS):
+    # 异步生成器，依次产出 (事件名, 数据)：chunks -> partial* -> reduce* -> summary
+    # 分段要对全文做 jieba 分词，长文需要数秒，放到线程池中执行，不阻塞事件循环
+    chunks = await run_in_threadpool(chunk_text, content, max_tokens)
+    yield "chunks", {"total": len(chunks)}
+
+    queue = asyncio.Queue()
+
+    async def on_partial(index, summary):
+        await queue.put(("partial", {"index": index, "total": len(chunks), "summary": summary}))
+
+    mapper = asyncio.create_task(_map(service, chunks, params, on_partial))
+    try:
+        while not mapper.done() or not queue.empty():
+            getter = asyncio.create_task(queue.get())
+            done, _ = await asyncio.wait({getter, mapper}, return_when=asyncio.FIRST_COMPLETED)
+            if getter in done:
+                yield getter.result()
+            else:
+                getter.cancel()
+        summaries = mapper.result()
+    finally:
+        mapper.cancel()
+
+    # reduce：合并段落摘要，仍超长则继续分段摘要，直到只剩一段
+    level = 0
+    while len(summaries) > 1 and level < MAX_REDUCE_LEVELS:
+        level += 1
+        chunks = await run_in_threadpool(chunk_text, "\n".join(summaries), max_tokens)
+        yield "reduce", {"level": level, "total": len(chunks)}
+        summaries = await _map(service, chunks, params)
+    yield "summary", {"summary": "\n".join(summaries)}
+
+
+async def summarize(service, content: str, params: dict, max_tokens: int = MAX_CHUNK_TOKENS) -> str:
+    summary = ""
+    async for event, data in summarize_events(service, content, params, max_tokens):
+        if event == "summary":
+            summary = data["summary"]
+    return summary
@@ -0,0 +1,61 @@
+# backend/sync_log.py
+# 增量同步的变更索引：sync_changes 表里每个笔记/标签/文件夹保留一行，实体写入或删除时
+# 用 INSERT OR REPLACE 重新插入，拿到新的自增 seq。seq 全局单调递增，直接作为同步游标；
+# 删除的实体留下 deleted=1 的墓碑行。用户当前的最大 seq 同时作为列表接口 ETag 的版本号。
+# touch() 在调用方的事务中执行，随 db.commit() 一起提交。
+import hashlib
+from sqlalchemy import select, func, text
+from sqlalchemy.dialects.sqlite import insert
+from models import SyncChange
+
+NOTE = "note"
+TAG = "tag"
+FOLDER = "folder"
+ENTITIES = (NOTE, TAG, FOLDER)
+_TABLES = {NOTE: "notes", TAG: "tags", FOLDER: "folders"}
+
+
+def touch(db, user_id: int, entity: str, ids, deleted: bool = False):
+    rows = [{"user_id": user_id, "entity": entity, "entity_id": entity_id, "deleted": int(deleted)}
+            for entity_id in dict.fromkeys(ids)]
+    if rows:
+        db.execute(insert(SyncChange).prefix_with("OR REPLACE"), rows)
+
+
+def current_version(db, user_id: int) -> int:
+    return db.execute(select(func.max(SyncChange.seq)).where(SyncChange.user_id == user_id)).scalar() or 0
+
+
+def changes_since(db, user_id: int, since: int, limit: int):
+    # 返回 (按 seq 排序的变更行, 是否还有更多)
+    rows = db.execute(
+        select(SyncChange.seq, SyncChange.entity, SyncChange.entity_id, SyncChange.deleted)
+        .where(SyncChange.user_id == user_id, SyncChange.seq > since)
+        .order_by(SyncChange.seq)
+        .limit(limit + 1)
+    ).all()
+    return rows[:limit], len(rows) > limit
+
+
+def backfill(engine):
+    # 为变更索引出现之前就已存在的实体补上记录，使 since=0 的全量同步能覆盖它们
+    with engine.begin() as conn:
+        for entity, table in _TABLES.items():
+            conn.execute(text(
+                f"INSERT INTO sync_changes (user_id, entity, entity_id, deleted) "
+                f"SELECT t.user_id, :entity, t.id, 0 FROM {table} t "
+                f"WHERE NOT EXISTS (SELECT 1 FROM sync_changes s WHERE s.entity = :entity AND s.entity_id = t.id) "
+                f"ORDER BY t.id"
+            ), {"entity": entity})
+
+
+def make_etag(user_id: int, version: int, *parts) -> str:
+    # 同一用户、同一数据版本、同一请求参数得到相同的 ETag
+    digest = hashlib.sha1("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()[:16]
+    return f'W/"{user_id}-{version}-{digest}"'
+
+
+def etag_matches(if_none_match, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]
@@ -0,0 +1,72 @@
+# backend/tag_service.py
+# 基于集合的标签写入：一次 IN 查询找出已有标签，缺失的用一条 INSERT ... ON CONFLICT DO NOTHING 批量补齐，
+# 笔记-标签关联同样批量插入并跳过已存在的组合。所有操作都在调用方的事务中，由调用方统一提交。
+# 关联的增删用 RETURNING 取回实际变化的行，据此增减标签的笔记数（note_counts）。
+from collections import Counter
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.sqlite import insert
+from models import Tag, note_tags
+import note_counts
+import sync_log
+
+# 单条 INSERT 的最大行数，避免超过 SQLite 的绑定参数上限
+INSERT_CHUNK_SIZE = 1000
+
+
+def _clean(names) -> list:
+    # 去掉空白和重复，保留原有顺序
+    return list(dict.fromkeys(name.strip() for name in names if name and name.strip()))
+
+
+def dropped_names(names, assigned) -> list:
+    # 请求了但没有关联上的标签名，调用方原样返回给客户端
+    assigned = set(assigned)
+    return [name for name in _clean(names) if name not in assigned]
+
+
+def upsert_tags(db, user_id: int, names) -> dict:
+    # 返回 {标签名: 标签ID}；标签名按 (user_id, name) 唯一
+    names = _clean(names)
+    if not names:
+        return {}
+    tag_ids = dict(db.execute(
+        select(Tag.name, Tag.id).where(Tag.user_id == user_id, Tag.name.in_(names))
+    ).all())
+    missing = [name for name in names if name not in tag_ids]
+    for i in range(0, len(missing), INSERT_CHUNK_SIZE):
+        db.execute(
+            insert(Tag).values([{"name": name, "user_id": user_id, "color": "#409eff"} for name in missing[i:i + INSERT_CHUNK_SIZE]])
+            .on_conflict_do_nothing()
+        )
+    if missing:
+        created = dict(db.execute(
+            select(Tag.name, Tag.id).where(Tag.user_id == user_id, Tag.name.in_(missing))
+        ).all())
+        tag_ids.update(created)
+        sync_log.touch(db, user_id, sync_log.TAG, created.values())
+    return tag_ids
+
+
+def assign_tags(db, user_id: int, tags_by_note: dict, replace: bool = False) -> dict:
+    # tags_by_note: {note_id: [标签名, ...]}；replace=True 时先清空这些笔记原有的标签
+    # 返回 {note_id: [实际关联的标签名, ...]}
+    tag_ids = upsert_tags(db, user_id, [name for names in tags_by_note.values() for name in names])
+    delta = Counter()
+    if replace and tags_by_note:
+        delta.subtract(tag_id for (tag_id,) in db.execute(
+            delete(note_tags).where(note_tags.c.note_id.in_(list(tags_by_note))).returning(note_tags.c.tag_id)
+        ).all())
+    assigned = {}
+    rows = []
+    for note_id, names in tags_by_note.items():
+        assigned[note_id] = [name for name in _clean(names) if name in tag_ids]
+        rows.extend({"note_id": note_id, "tag_id": tag_ids[name]} for name in assigned[note_id])
+    for i in range(0, len(rows), INSERT_CHUNK_SIZE):
+        # 已存在而被跳过的组合不会出现在 RETURNING 结果中
+        delta.update(tag_id for (tag_id,) in db.execute(
+            insert(note_tags).values(rows[i:i + INSERT_CHUNK_SIZE]).on_conflict_do_nothing().returning(note_tags.c.tag_id)
+        ).all())
+    note_counts.adjust(db, user_id, note_counts.TAG, delta)
+    # 标签变化也算笔记的变更，增量同步时会重新下发这些笔记
+    sync_log.touch(db, user_id, sync_log.NOTE, tags_by_note)
+    return assigned
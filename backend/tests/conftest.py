@@ -0,0 +1,85 @@
+# backend/tests/conftest.py
+# 测试环境：临时数据库和缓存文件、替身模型（stub）。后端模块在导入时读取环境变量，必须先设置好再导入。
+# 运行：cd backend && python -m pytest -q
+import itertools
+import os
+import shutil
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+import pytest
+
+TEST_DIR = tempfile.mkdtemp(prefix="ai-notes-tests-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{TEST_DIR}/test.db",
+    "AI_CACHE_PATH": f"{TEST_DIR}/ai_cache.db",
+    "SUMMARIZER_MODEL": "stub",
+    "ASR_MODEL": "stub",
+    "EMBEDDING_MODEL": "stub",
+    "BCRYPT_ROUNDS": "4",
+    "AUTH_SECRET": "test-secret",
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_usernames = itertools.count(1)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(TEST_DIR, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def client():
+    # 整个测试会话共用一个应用实例（启动阶段建表、拉起替身模型进程池）
+    from fastapi.testclient import TestClient
+    import main
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def db(client):
+    from models import SessionLocal
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+def register(client, password="password123"):
+    # 注册一个新用户并登录，返回 name / id / headers
+    username = f"user{next(_usernames)}"
+    assert client.post("/register", json={"username": username, "password": password}).status_code == 200
+    r = client.post("/login", json={"username": username, "password": password})
+    assert r.status_code == 200
+    import auth
+    user_id = auth.verify_token(r.json()["access_token"])["uid"]
+    return SimpleNamespace(name=username, id=user_id, headers={"Authorization": f"Bearer {r.json()['access_token']}"})
+
+
+@pytest.fixture
+def user(client):
+    return register(client)
+
+
+def create_note(client, user, title, content, folder_id=None):
+    r = client.post("/notes/", json={"username": user.name, "title": title, "content": content, "folder_id": folder_id},
+                    headers=user.headers)
+    assert r.status_code == 200, r.text
+    return r.json()["id"]
+
+
+def create_folder(client, user, name, parent_id=None):
+    r = client.post("/folders/", params={"username": user.name}, json={"name": name, "parent_id": parent_id},
+                    headers=user.headers)
+    assert r.status_code == 200, r.text
+    return r.json()["id"]
+
+
+def wait_ready(client, *capabilities, timeout=60):
+    # 模型和索引在后台预热，用到它们的测试先等就绪
+    deadline = time.monotonic() + timeout
+    while client.get("/readyz", params={"require": list(capabilities)}).status_code != 200:
+        assert time.monotonic() < deadline, f"{capabilities} 未就绪"
+        time.sleep(0.1)
@@ -0,0 +1,70 @@
+import json
+
+import auth
+from conftest import create_note, register
+
+
+def _token(user):
+    return user.headers["Authorization"].split(" ", 1)[1]
+
+
+def _bearer(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _folders(client, user, headers):
+    return client.get(f"/folders/{user.name}", headers=headers).status_code
+
+
+def test_missing_malformed_and_forged_tokens_are_rejected(client, user):
+    other = register(client)
+    assert _folders(client, user, user.headers) == 200
+    assert _folders(client, user, {}) == 401
+    assert _folders(client, user, {"Authorization": "Basic dXNlcjpwYXNz"}) == 401
+    assert _folders(client, user, _bearer("not-a-token")) == 401
+    # 把别人的身份换进载荷，沿用自己令牌的签名
+    claims = auth.verify_token(_token(other))
+    payload = auth._b64encode(json.dumps(claims).encode("utf-8"))
+    assert _folders(client, other, _bearer(f"{payload}.{_token(user).split('.', 1)[1]}")) == 401
+    # 签名正确但已过期
+    expired = auth.create_token(auth.CurrentUser(claims["uid"], claims["sub"], claims["pwv"]), ttl=-1)
+    assert _folders(client, other, _bearer(expired)) == 401
+    r = client.get(f"/folders/{user.name}")
+    assert r.headers["WWW-Authenticate"] == "Bearer"
+
+
+def test_other_users_data_is_forbidden(client, user):
+    other = register(client)
+    # 路径、查询参数或请求体中的用户名与令牌不一致
+    assert _folders(client, other, user.headers) == 403
+    r = client.post("/folders/", params={"username": other.name}, json={"name": "x"}, headers=user.headers)
+    assert r.status_code == 403
+    r = client.post("/notes/", json={"username": other.name, "title": "t", "content": "c"}, headers=user.headers)
+    assert r.status_code == 403
+    # 按ID访问别人的笔记时按不存在处理
+    note_id = create_note(client, other, "t", "c")
+    assert client.get(f"/notes/{note_id}/revisions", headers=user.headers).status_code == 404
+    r = client.put(f"/notes/{note_id}", json={"username": user.name, "title": "改", "content": "改"}, headers=user.headers)
+    assert r.status_code == 404
+
+
+def test_change_password_revokes_old_tokens(client):
+    user = register(client, password="old-password")
+    second_session = client.post("/login", json={"username": user.name, "password": "old-password"}).json()
+    r = client.post("/change_password", json={"username": user.name, "old_password": "old-password",
+                                              "new_password": "new-password"})
+    assert r.json()["msgType"] == "success"
+    # 修改前签发的所有令牌都失效，响应中的新令牌可用
+    assert _folders(client, user, user.headers) == 401
+    assert _folders(client, user, _bearer(second_session["access_token"])) == 401
+    assert _folders(client, user, _bearer(r.json()["access_token"])) == 200
+    assert client.post("/login", json={"username": user.name, "password": "old-password"}).status_code != 200
+    r = client.post("/login", json={"username": user.name, "password": "new-password"})
+    assert _folders(client, user, _bearer(r.json()["access_token"])) == 200
+
+
+def test_wrong_old_password_keeps_tokens(client, user):
+    r = client.post("/change_password", json={"username": user.name, "old_password": "wrong",
+                                              "new_password": "new-password"})
+    assert r.json()["msgType"] == "error"
+    assert _folders(client, user, user.headers) == 200
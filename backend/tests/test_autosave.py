@@ -0,0 +1,88 @@
+import autosave
+from conftest import create_note
+from models import Note, SessionLocal
+
+
+def test_patches_coalesce_into_one_write(client, user, db):
+    note_id = create_note(client, user, "标题", "正文")
+    writer = autosave.AutosaveWriter(SessionLocal, window_ms=60000)
+    try:
+        for i in range(5):
+            entry = writer.submit(user.id, note_id, {"content": f"正文 {i}"})
+        writer.submit(user.id, note_id, {"title": "新标题"})
+        assert writer.save_now(entry)
+    finally:
+        writer.shutdown()
+    assert writer.transactions_total == 1
+    assert writer.notes_written_total == 1
+    assert entry.revision == 2
+    note = db.get(Note, note_id)
+    assert (note.title, note.content) == ("新标题", "正文 4")
+
+
+def test_settle_fails_the_superseded_waiter(client, user, db):
+    note_id = create_note(client, user, "标题", "正文")
+    writer = autosave.AutosaveWriter(SessionLocal, window_ms=60000)
+    try:
+        entry = writer.submit(user.id, note_id, {"content": "自动保存"})
+        # PUT 取代了尚未写入的改动：等待写入的一方得到错误而不是成功
+        writer.settle(note_id, user.id)
+        assert not writer.save_now(entry)
+        assert entry.error == autosave.SUPERSEDED
+        assert entry.revision is None
+    finally:
+        writer.shutdown()
+    assert writer.transactions_total == 0
+    assert db.get(Note, note_id).content == "正文"
+
+
+def test_settle_ignores_other_users(client, user):
+    note_id = create_note(client, user, "标题", "正文")
+    writer = autosave.AutosaveWriter(SessionLocal, window_ms=60000)
+    try:
+        entry = writer.submit(user.id, note_id, {"content": "自动保存"})
+        writer.settle(note_id, user.id + 1000)
+        assert writer.save_now(entry)
+    finally:
+        writer.shutdown()
+
+
+def test_patch_wait_returns_revision(client, user):
+    note_id = create_note(client, user, "标题", "正文")
+    r = client.patch(f"/notes/{note_id}", params={"wait": "true"}, json={"content": "改过的正文"}, headers=user.headers)
+    assert r.status_code == 200
+    assert r.json()["revision"] == 2
+    r = client.patch(f"/notes/{note_id}", json={"content": None}, headers=user.headers)
+    assert r.status_code == 400
+
+
+def test_one_bad_note_does_not_block_the_batch(client, user, db, monkeypatch):
+    good = create_note(client, user, "好", "正文")
+    bad = create_note(client, user, "坏", "正文")
+    writer = autosave.AutosaveWriter(SessionLocal, window_ms=60000, max_attempts=3)
+    write = writer._write
+
+    def failing_write(session, batch):
+        if bad in batch:
+            raise RuntimeError("坏数据")
+        return write(session, batch)
+
+    monkeypatch.setattr(writer, "_write", failing_write)
+    try:
+        good_entry = writer.submit(user.id, good, {"content": "保存成功"})
+        bad_entry = writer.submit(user.id, bad, {"content": "永远失败"})
+        writer.flush()
+        # 整批失败后逐篇重试：好的笔记写入，坏的放回待写表
+        assert good_entry.done.is_set() and not good_entry.error
+        assert not bad_entry.done.is_set()
+        assert writer.stats()["pending"] == 1
+        writer.flush()
+        writer.flush()
+        # 达到重试上限后丢弃，等待的一方得到错误
+        assert bad_entry.done.is_set() and bad_entry.error
+        assert writer.stats()["pending"] == 0
+        assert writer.dropped_total == 1
+    finally:
+        writer.shutdown()
+    assert db.get(Note, good).content == "保存成功"
+    assert db.get(Note, bad).content == "正文"
@@ -0,0 +1,58 @@
+import duplicates
+from conftest import create_note, register
+
+WORDS = [f"word{i}" for i in range(200)]
+BASE = " ".join(WORDS)
+# 改掉中间一个词：3词 shingle 中有3个不同，Jaccard 相似度 195/201 ≈ 0.97
+NEAR = " ".join(WORDS[:100] + ["changed"] + WORDS[101:])
+OTHER = " ".join(f"other{i}" for i in range(200))
+
+
+def _jaccard(a, b):
+    a, b = duplicates.shingles(a), duplicates.shingles(b)
+    return len(a & b) / len(a | b)
+
+
+def _estimate(a, b):
+    return float((duplicates.signature(a) == duplicates.signature(b)).mean())
+
+
+def test_minhash_estimates_jaccard():
+    half = " ".join(WORDS[:100] + [f"other{i}" for i in range(100)])
+    for text in (NEAR, half, OTHER):
+        assert abs(_estimate(BASE, text) - _jaccard(BASE, text)) < 0.15
+    assert duplicates.signature("，。！") is None
+
+
+def _groups(client, user, **params):
+    r = client.get(f"/users/{user.name}/duplicates", params=params, headers=user.headers)
+    assert r.status_code == 200, r.text
+    return [[(note["id"], note["similarity"]) for note in group] for group in r.json()["groups"]]
+
+
+def test_near_duplicates_are_grouped_above_threshold(client, user):
+    base = create_note(client, user, "原稿", BASE)
+    near = create_note(client, user, "副本", NEAR)
+    copy = create_note(client, user, "完全相同", BASE)
+    create_note(client, user, "无关", OTHER)
+
+    [group] = _groups(client, user, threshold=0.8)
+    assert [note_id for note_id, _ in group] == [base, near, copy]
+    assert group[0][1] == 1.0 and group[2][1] == 1.0 and 0.8 <= group[1][1] < 1.0
+    # 阈值高于副本的相似度时，只剩完全相同的两篇
+    assert [[note_id for note_id, _ in group] for group in _groups(client, user, threshold=1.0)] == [[base, copy]]
+
+    r = client.get(f"/notes/{near}/similar", params={"threshold": 0.8}, headers=user.headers)
+    assert [note["id"] for note in r.json()] == [base, copy]
+    r = client.get(f"/notes/{near}/similar", params={"threshold": 1.0}, headers=user.headers)
+    assert r.json() == []
+
+
+def test_deleted_and_other_users_notes_are_not_grouped(client, user):
+    other = register(client)
+    base = create_note(client, user, "原稿", BASE)
+    near = create_note(client, user, "副本", NEAR)
+    create_note(client, other, "别人的副本", BASE)
+    assert [[note_id for note_id, _ in group] for group in _groups(client, user)] == [[base, near]]
+    assert client.delete(f"/notes/{near}", params={"username": user.name}, headers=user.headers).status_code == 200
+    assert _groups(client, user) == []
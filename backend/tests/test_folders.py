@@ -0,0 +1,60 @@
+import folder_tree
+from conftest import create_folder
+
+
+def _tree(client, user):
+    r = client.get(f"/folders/{user.name}/tree", headers=user.headers)
+    assert r.status_code == 200
+    return r.json()
+
+
+def _shape(nodes):
+    return {node["name"]: _shape(node["children"]) for node in nodes}
+
+
+def _move(client, user, folder_id, name, parent_id):
+    return client.put(f"/folders/{folder_id}", params={"username": user.name},
+                      json={"name": name, "parent_id": parent_id}, headers=user.headers)
+
+
+def test_moving_a_folder_under_itself_is_rejected(client, user):
+    a = create_folder(client, user, "a")
+    b = create_folder(client, user, "b", a)
+    c = create_folder(client, user, "c", b)
+    assert _move(client, user, a, "a", a).status_code == 400
+    assert _move(client, user, a, "a", c).status_code == 400
+    assert _shape(_tree(client, user)) == {"a": {"b": {"c": {}}}}
+    # 移到祖先下面不构成环
+    assert _move(client, user, c, "c", a).status_code == 200
+    assert _shape(_tree(client, user)) == {"a": {"b": {}, "c": {}}}
+    # 环检测用的是移动后的结构：b 移到 c 下之后，c 再移到 b 下就会成环
+    assert _move(client, user, b, "b", c).status_code == 200
+    assert _move(client, user, c, "c", b).status_code == 400
+
+
+def test_tree_cache_is_invalidated_on_every_change(client, user):
+    assert _tree(client, user) == []
+    a = create_folder(client, user, "a")
+    assert _shape(_tree(client, user)) == {"a": {}}
+    b = create_folder(client, user, "b", a)
+    assert _shape(_tree(client, user)) == {"a": {"b": {}}}
+    assert _move(client, user, b, "改名", None).status_code == 200
+    assert _shape(_tree(client, user)) == {"a": {}, "改名": {}}
+    assert client.delete(f"/folders/{b}", params={"username": user.name}, headers=user.headers).status_code == 200
+    assert _shape(_tree(client, user)) == {"a": {}}
+
+
+def test_tree_loaded_across_an_invalidation_is_not_cached(client, user, db, monkeypatch):
+    create_folder(client, user, "a")
+    folder_tree.invalidate(user.id)
+    load = folder_tree._load
+
+    def racing_load(db, user_id):
+        # 加载期间另一个请求修改了文件夹
+        tree = load(db, user_id)
+        folder_tree.invalidate(user_id)
+        return tree
+
+    monkeypatch.setattr(folder_tree, "_load", racing_load)
+    assert [node["name"] for node in folder_tree.get_tree(db, user.id)] == ["a"]
+    assert user.id not in folder_tree._cache
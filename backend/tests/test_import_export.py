@@ -0,0 +1,123 @@
+import io
+import json
+import zipfile
+
+import note_io
+from conftest import register
+
+RECORDS = [
+    {"title": "项目计划", "content": "第一阶段\n第二阶段\n", "folder": "工作/项目A", "tags": ["计划", "工作"],
+     "updated_at": "2024-03-01T08:30:00"},
+    {"title": "读书笔记", "content": "---不是元数据\n正文里有 \"引号\" 和 emoji 🙂", "folder": "生活",
+     "tags": [], "updated_at": "2024-03-02T10:00:00"},
+    {"title": "根目录", "content": "没有文件夹", "folder": "", "tags": ["杂项"], "updated_at": "2024-03-03T12:00:00"},
+]
+
+
+def _import(client, user, filename, data):
+    r = client.post(f"/users/{user.name}/import", files={"file": (filename, data)}, headers=user.headers)
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def _export(client, user, fmt="jsonl"):
+    r = client.get(f"/users/{user.name}/export", params={"format": fmt}, headers=user.headers)
+    assert r.status_code == 200
+    return r.content
+
+
+def _comparable(jsonl: bytes):
+    records = [json.loads(line) for line in jsonl.decode("utf-8").splitlines()]
+    return sorted(
+        (record["title"], record["content"], record["folder"], sorted(record["tags"]), record["updated_at"])
+        for record in records
+    )
+
+
+def _jsonl(records):
+    return "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records).encode("utf-8")
+
+
+def test_jsonl_round_trip(client):
+    user = register(client)
+    records = RECORDS
+    report = _import(client, user, "notes.jsonl", _jsonl(records))
+    assert (report["imported"], report["failed"], report["folders_created"]) == (3, 0, 3)
+    exported = _export(client, user)
+    assert _comparable(exported) == _comparable(_jsonl(records))
+    # 导入的笔记也有第一个历史版本
+    for record in map(json.loads, exported.decode("utf-8").splitlines()):
+        r = client.get(f"/notes/{record['id']}/revisions", headers=user.headers)
+        assert [revision["rev"] for revision in r.json()] == [1]
+
+    # 导出的文件可以原样导入另一个账号
+    copy = register(client)
+    _import(client, copy, "backup.jsonl", exported)
+    assert _comparable(_export(client, copy)) == _comparable(exported)
+
+
+def test_markdown_round_trip(client):
+    user = register(client)
+    records = RECORDS
+    _import(client, user, "notes.jsonl", _jsonl(records))
+    archive = _export(client, user, "markdown")
+    with zipfile.ZipFile(io.BytesIO(archive)) as zf:
+        parsed = {name: note_io.parse_markdown(zf.read(name).decode("utf-8"), "") for name in zf.namelist()}
+    assert any(name.startswith("工作/项目A/") for name in parsed)
+    assert sorted(sorted(meta["tags"]) for meta in parsed.values()) == sorted(sorted(r["tags"]) for r in records)
+
+    copy = register(client)
+    report = _import(client, copy, "notes.zip", archive)
+    assert report["imported"] == 3
+    assert _comparable(_export(client, copy)) == _comparable(_jsonl(records))
+
+
+def test_bad_lines_are_reported_not_fatal(client):
+    user = register(client)
+    data = _jsonl(RECORDS[:1]) + b"{not json}\n" + _jsonl([{"title": "", "content": ""}])
+    report = _import(client, user, "notes.jsonl", data)
+    assert (report["imported"], report["failed"]) == (1, 2)
+    assert [error["source"] for error in report["errors"]] == [2, 3]
+
+
+def test_invalid_zip_is_rejected(client):
+    user = register(client)
+    r = client.post(f"/users/{user.name}/import", files={"file": ("notes.zip", b"not a zip")}, headers=user.headers)
+    assert r.status_code == 400
+
+
+def test_failed_batch_is_reported_and_import_continues(client, db, monkeypatch):
+    user = register(client)
+    add_notes = note_io.note_counts.add_notes
+    calls = []
+
+    def failing_add_notes(*args):
+        calls.append(args)
+        if len(calls) == 1:
+            raise RuntimeError("写入出错")
+        return add_notes(*args)
+
+    monkeypatch.setattr(note_io.note_counts, "add_notes", failing_add_notes)
+    importer = note_io.NoteImporter(db, user.id, batch_size=2)
+    for line_no, record in note_io.iter_jsonl(io.StringIO(_jsonl(RECORDS).decode("utf-8"))):
+        importer.add(line_no, record)
+    importer.flush()
+    report = importer.report()
+    # 第一批（两条）回滚并记入报告，第二批照常写入
+    assert (report["imported"], report["failed"]) == (1, 2)
+    assert [error["source"] for error in report["errors"]] == [1, 2]
+    assert report["folders_created"] == 0
+    exported = [json.loads(line) for line in _export(client, user).decode("utf-8").splitlines()]
+    assert [record["title"] for record in exported] == ["根目录"]
+
+
+def test_oversized_markdown_member_is_skipped(client, monkeypatch):
+    user = register(client)
+    monkeypatch.setattr(note_io, "IMPORT_MAX_MEMBER_MB", 0.001)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("小.md", "正文")
+        zf.writestr("大.md", "很长的正文" * 1000)
+    report = _import(client, user, "notes.zip", buffer.getvalue())
+    assert (report["imported"], report["failed"]) == (1, 1)
+    assert report["errors"][0]["source"] == "大.md"
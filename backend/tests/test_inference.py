@@ -0,0 +1,110 @@
+import asyncio
+import os
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+import inference
+
+
+def failing_runner(model, texts, params):
+    if texts == ["warm up"]:
+        return [""]
+    raise ValueError("模型出错")
+
+
+def crashing_runner(model, texts, params):
+    # 模拟工作进程崩溃（段错误、被 OOM 杀掉）
+    if "崩溃" in texts:
+        os._exit(1)
+    return inference.run_summarizer(model, texts, params)
+
+
+def _worker(runner=inference.run_summarizer, **kwargs):
+    options = dict(workers=1, max_batch_size=4, max_wait_ms=50, max_queue_size=64)
+    options.update(kwargs)
+    return inference.BatchingWorker("test", "stub", inference.load_summarizer, runner, **options)
+
+
+def _run(worker, body):
+    async def main():
+        await worker.start()
+        try:
+            await worker.wait_warm()
+            return await body()
+        finally:
+            await worker.stop()
+    return asyncio.run(main())
+
+
+def test_concurrent_requests_are_batched_in_order():
+    worker = _worker()
+    texts = [f"第{i}篇。" + "很长的一句话。" * 20 for i in range(8)]
+
+    async def body():
+        return await asyncio.gather(*(worker.submit(text, max_length=10, min_length=5) for text in texts))
+
+    outputs = _run(worker, body)
+    # 每个请求拿到的是自己那条输入的结果
+    assert [output.split("。")[0] for output in outputs] == [f"第{i}篇" for i in range(8)]
+    stats = worker.metrics()
+    assert stats["requests_total"] == 8
+    assert stats["batches_total"] == 2
+    assert stats["avg_batch_size"] == 4
+
+
+def test_different_params_run_in_separate_model_calls():
+    worker = _worker()
+
+    async def body():
+        return await asyncio.gather(
+            worker.submit("一些文字。" * 10, max_length=5),
+            worker.submit("一些文字。" * 10, max_length=20),
+        )
+
+    short, long = _run(worker, body)
+    assert len(short) < len(long)
+    assert worker.batches_total == 2
+
+
+def test_full_queue_rejects_with_busy():
+    worker = _worker(max_queue_size=2)
+
+    async def body():
+        return await asyncio.gather(*(worker.submit(f"文本{i}" * 20) for i in range(5)), return_exceptions=True)
+
+    results = _run(worker, body)
+    busy = [result for result in results if isinstance(result, inference.InferenceBusy)]
+    assert len(busy) == 3
+    assert worker.rejected_total == 3
+
+
+def test_model_errors_reach_every_caller():
+    worker = _worker(runner=failing_runner)
+
+    async def body():
+        return await asyncio.gather(*(worker.submit(f"文本{i}") for i in range(3)), return_exceptions=True)
+
+    results = _run(worker, body)
+    assert all(isinstance(result, ValueError) for result in results)
+    assert worker.errors_total >= 1
+
+
+def test_crashed_worker_pool_is_rebuilt():
+    worker = _worker(runner=crashing_runner, max_wait_ms=0)
+
+    async def body():
+        with pytest.raises(BrokenProcessPool):
+            await worker.submit("崩溃")
+        # 崩溃只让正在执行的这一批失败，进程池重建并重新预热后照常服务
+        await worker.wait_warm()
+        return await worker.submit("正常的文本", max_length=4)
+
+    assert _run(worker, body) == "正常的文"
+    assert worker.restarts_total == 1
+    assert worker.warm
+
+
+def test_submit_before_start_fails():
+    with pytest.raises(RuntimeError):
+        asyncio.run(_worker().submit("文本"))
@@ -0,0 +1,39 @@
+import threading
+
+import anyio
+
+import metrics
+
+
+def test_slow_request_profile_is_written_off_the_event_loop(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "PROFILE_SLOW_MS", 0)
+    profiler = metrics.SamplingProfiler(output_dir=str(tmp_path))
+    profiler.running = True  # 不启动采样线程，样本由下面的应用直接写入
+    dump_threads = []
+    dump = profiler.dump
+
+    def recording_dump(*args):
+        dump_threads.append(threading.get_ident())
+        dump(*args)
+
+    monkeypatch.setattr(profiler, "dump", recording_dump)
+
+    async def app(scope, receive, send):
+        metrics._current.get().samples["handler (main.py:1)"] = 3
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        pass
+
+    async def request():
+        await metrics.MetricsMiddleware(app, profiler)({"type": "http", "method": "GET", "path": "/"}, receive, send)
+        return threading.get_ident()
+
+    loop_thread = anyio.run(request)
+    assert dump_threads and dump_threads[0] != loop_thread
+    [folded] = tmp_path.glob("*.folded")
+    assert folded.read_text(encoding="utf-8").splitlines()[1] == "handler (main.py:1) 3"
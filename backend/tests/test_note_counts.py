@@ -0,0 +1,65 @@
+import note_counts
+from conftest import create_folder, create_note
+
+
+def _ok(response):
+    assert response.status_code == 200, response.text
+
+
+def _check(db, user):
+    # 每次核对前结束上一个读事务，看到最新提交的数据
+    db.rollback()
+    return note_counts.check(db, user.id)
+
+
+def _folder_counts(client, user):
+    r = client.get(f"/folders/{user.name}/counts", headers=user.headers)
+    _ok(r)
+    body = r.json()
+    return {folder["id"]: (folder["note_count"], folder["total_count"]) for folder in body["folders"]}, body["unfiled"]
+
+
+def _tag_counts(client, user):
+    r = client.get(f"/tags/{user.name}/counts", headers=user.headers)
+    _ok(r)
+    return {tag["name"]: tag["note_count"] for tag in r.json()}
+
+
+def test_counts_follow_create_move_tag_and_delete(client, user, db):
+    parent = create_folder(client, user, "工作")
+    child = create_folder(client, user, "项目", parent)
+    a = create_note(client, user, "a", "正文", child)
+    b = create_note(client, user, "b", "正文", parent)
+    c = create_note(client, user, "c", "正文")
+    assert _folder_counts(client, user) == ({parent: (1, 2), child: (1, 1)}, 1)
+    assert _check(db, user) == []
+
+    # PUT 和自动保存 PATCH 两条路径移动笔记
+    _ok(client.put(f"/notes/{c}", json={"username": user.name, "title": "c", "content": "正文", "folder_id": child},
+                   headers=user.headers))
+    _ok(client.patch(f"/notes/{a}", params={"wait": "true"}, json={"folder_id": None}, headers=user.headers))
+    assert _folder_counts(client, user) == ({parent: (1, 2), child: (1, 1)}, 1)
+    assert _check(db, user) == []
+
+    _ok(client.post(f"/notes/{a}/tags", params={"username": user.name}, json=["计数", "其他"], headers=user.headers))
+    _ok(client.post("/notes/tags/batch", params={"username": user.name},
+                    json={"note_ids": [a, b], "tag_names": ["计数"]}, headers=user.headers))
+    assert _tag_counts(client, user) == {"计数": 2, "其他": 1}
+    assert _check(db, user) == []
+
+    _ok(client.delete(f"/notes/{a}", params={"username": user.name}, headers=user.headers))
+    assert _tag_counts(client, user) == {"计数": 1, "其他": 0}
+    # 删除文件夹时其中的笔记移到根目录
+    _ok(client.delete(f"/folders/{child}", params={"username": user.name}, headers=user.headers))
+    assert _folder_counts(client, user) == ({parent: (1, 1)}, 1)
+    assert _check(db, user) == []
+
+
+def test_check_reports_drift(client, user, db):
+    create_note(client, user, "a", "正文")
+    note_counts.adjust(db, user.id, note_counts.FOLDER, {note_counts.UNFILED: 5})
+    db.commit()
+    assert _check(db, user) == [(user.id, note_counts.FOLDER, note_counts.UNFILED, 6, 1)]
+    note_counts.adjust(db, user.id, note_counts.FOLDER, {note_counts.UNFILED: -5})
+    db.commit()
+    assert _check(db, user) == []
@@ -0,0 +1,26 @@
+import time
+
+import passwords
+
+
+def test_throttle_blocks_after_limit_and_success_resets():
+    throttle = passwords.LoginThrottle(window=60, max_per_user=2, max_per_ip=10)
+    throttle.record_failure("alice", "1.1.1.1")
+    assert throttle.retry_after("alice", "1.1.1.1") == 0
+    throttle.record_failure("alice", "1.1.1.1")
+    assert 0 < throttle.retry_after("alice", "1.1.1.1") <= 61
+    # 换一个IP也不行：按用户名计数
+    assert throttle.retry_after("alice", "2.2.2.2") > 0
+    throttle.record_success("alice")
+    assert throttle.retry_after("alice", "1.1.1.1") == 0
+
+
+def test_expired_keys_are_swept():
+    throttle = passwords.LoginThrottle(window=0.05)
+    for i in range(100):
+        throttle.record_failure(f"user{i}", f"10.0.0.{i}")
+    assert len(throttle._failures) == 200
+    time.sleep(0.06)
+    # 之后不再出现的用户名/IP 在下一次记录失败时被清扫掉
+    throttle.record_failure("late", "10.0.1.1")
+    assert set(throttle._failures) == {("user", "late"), ("ip", "10.0.1.1")}
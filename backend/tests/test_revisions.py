@@ -0,0 +1,60 @@
+import random
+
+import revisions
+from conftest import create_note, register
+
+
+def _edits(count, seed=0):
+    # 多行正文的一串编辑：改行、插入行、删除行、追加段落
+    rng = random.Random(seed)
+    lines = [f"第{i}行 line {i}\n" for i in range(20)]
+    for step in range(count):
+        action = rng.random()
+        i = rng.randrange(len(lines))
+        if action < 0.5:
+            lines[i] = f"修改{step} edited {rng.random():.6f}\n"
+        elif action < 0.75:
+            lines.insert(i, f"插入{step}\n")
+        elif len(lines) > 5:
+            del lines[i]
+        else:
+            lines.append(f"追加{step}\n" * 3)
+        yield "".join(lines)
+
+
+def test_delta_round_trip():
+    for old, new in [("", "abc"), ("abc", ""), ("a\nb\nc\n", "a\nx\nc\nd\n"), ("同一行中文", "同一行的中文")]:
+        assert revisions.apply_delta(old, revisions.make_delta(old, new)) == new
+
+
+def test_every_kept_revision_rebuilds_after_compaction(client, user, monkeypatch):
+    monkeypatch.setattr(revisions, "REVISION_SNAPSHOT_INTERVAL", 5)
+    monkeypatch.setattr(revisions, "REVISION_KEEP_RECENT", 10)
+    monkeypatch.setattr(revisions, "REVISION_COMPACT_STRIDE", 2)
+    note_id = create_note(client, user, "标题", "初始正文\n")
+    originals = {1: "初始正文\n"}
+    for content in _edits(60):
+        r = client.put(f"/notes/{note_id}", json={"username": user.name, "title": "标题", "content": content},
+                       headers=user.headers)
+        assert r.status_code == 200
+        originals[r.json()["revision"]] = content
+
+    kept = [row["rev"] for row in client.get(f"/notes/{note_id}/revisions", params={"limit": 200},
+                                             headers=user.headers).json()]
+    # 旧段已合并：最近的版本全部保留，更早的只剩快照和步长整数倍的版本
+    assert len(kept) < len(originals)
+    assert set(range(max(kept) - 9, max(kept) + 1)) <= set(kept)
+    for rev in kept:
+        r = client.get(f"/notes/{note_id}/revisions/{rev}", headers=user.headers)
+        assert r.status_code == 200
+        assert r.json()["content"] == originals[rev], rev
+    dropped = min(set(originals) - set(kept))
+    assert client.get(f"/notes/{note_id}/revisions/{dropped}", headers=user.headers).status_code == 404
+
+
+def test_revisions_are_private(client, user):
+    note_id = create_note(client, user, "私有", "正文")
+    other = register(client)
+    assert client.get(f"/notes/{note_id}/revisions", headers=other.headers).status_code == 404
+    assert client.get(f"/notes/{note_id}/revisions/1", headers=other.headers).status_code == 404
+    assert client.get(f"/notes/{note_id}/revisions/1").status_code == 401
@@ -0,0 +1,87 @@
+import search_index
+from conftest import create_note, register
+
+
+def _search(client, user, query, **params):
+    r = client.get(f"/search/{user.name}", params={"query": query, **params}, headers=user.headers)
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def test_bm25_ranks_title_and_frequency(client, user):
+    # BM25 的平均长度按整个索引统计，其他测试的笔记也计入；标题命中的笔记正文也提到一次，排序不受其影响
+    in_title = create_note(client, user, "机器学习入门", "机器学习的基础概念。")
+    frequent = create_note(client, user, "周末笔记", "机器学习很有趣，机器学习的应用很多，机器学习需要数据。")
+    once = create_note(client, user, "杂记", "今天读了一篇很长的文章，顺带提到了机器学习，其余都是别的内容" + "，别的内容" * 30)
+    create_note(client, user, "无关", "今天天气很好。")
+    ids = [result["id"] for result in _search(client, user, "机器学习")["results"]]
+    assert ids == [in_title, frequent, once]
+
+
+def test_search_requires_every_term(client, user):
+    both = create_note(client, user, "Python 异步", "asyncio 事件循环")
+    create_note(client, user, "Python 基础", "列表和字典")
+    assert [result["id"] for result in _search(client, user, "python asyncio")["results"]] == [both]
+
+
+def test_pagination_and_total(client, user):
+    for i in range(5):
+        create_note(client, user, f"分页 {i}", "分页测试" * (i + 1))
+    first = _search(client, user, "分页测试", limit=2)
+    second = _search(client, user, "分页测试", limit=2, offset=2)
+    assert first["total"] == second["total"] == 5
+    ids = [result["id"] for result in first["results"] + second["results"]]
+    assert len(set(ids)) == 4
+    scores = [result["score"] for result in first["results"] + second["results"]]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_index_follows_updates_and_deletes(client, user):
+    note_id = create_note(client, user, "旧标题", "原来的正文")
+    client.put(f"/notes/{note_id}", json={"username": user.name, "title": "新标题", "content": "改写后的正文 量子"},
+               headers=user.headers)
+    assert _search(client, user, "原来")["total"] == 0
+    assert [result["id"] for result in _search(client, user, "量子")["results"]] == [note_id]
+    client.delete(f"/notes/{note_id}", params={"username": user.name}, headers=user.headers)
+    assert _search(client, user, "量子")["total"] == 0
+
+
+def test_results_are_per_user(client, user):
+    create_note(client, user, "秘密", "只有我能搜到的内容")
+    other = register(client)
+    assert _search(client, other, "秘密")["total"] == 0
+
+
+def test_query_syntax_is_escaped(client, user):
+    create_note(client, user, "引号", 'say "hello" OR NOT world*')
+    assert _search(client, user, 'hello" OR NOT (')["total"] == 1
+    assert search_index.build_match_query("  ！？  ") == ""
+    assert _search(client, user, "！？")["results"] == []
+
+
+def test_similarity_uses_stored_terms_and_full_text(client, user, db):
+    # 空白切分的词（c++）保存在索引里，查询词齐全时相似度为满分，不需要原文中连续出现
+    tokens = create_note(client, user, "杂项", "教程：这里是一些 c++ 代码")
+    # 查询原文出现在正文很靠后的位置，子串检查看全文
+    deep = create_note(client, user, "长文", "前言，" * 200 + "量子纠缠实验记录")
+    assert "c++" in search_index.note_tokens(db, [tokens])[tokens][1]
+    [result] = _search(client, user, "c++ 教程")["results"]
+    assert result["similarity"] == 1.0
+    [result] = _search(client, user, "量子纠缠实验记录")["results"]
+    assert result["id"] == deep and result["similarity"] >= 1.0
+
+
+def test_old_index_schema_is_rebuilt(tmp_path):
+    from sqlalchemy import create_engine, text
+    engine = create_engine(f"sqlite:///{tmp_path}/old.db")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE notes (id INTEGER PRIMARY KEY, title TEXT, content TEXT, user_id INTEGER)"))
+        conn.execute(text("INSERT INTO notes VALUES (1, '旧笔记', 'C++ 教程', 1)"))
+        conn.execute(text(f"CREATE VIRTUAL TABLE {search_index.FTS_TABLE} "
+                          "USING fts5(title, content, user_id UNINDEXED, tokenize='unicode61')"))
+        conn.execute(text(f"INSERT INTO {search_index.FTS_TABLE}(rowid, title, content, user_id) VALUES (1, '旧', '旧', 1)"))
+    search_index.init_search_index(engine)
+    with engine.connect() as conn:
+        row = conn.execute(text(f"SELECT title_terms, content_terms FROM {search_index.FTS_TABLE} WHERE rowid = 1")).one()
+    engine.dispose()
+    assert set(row.content_terms.split()) >= {"c++", "教程"}
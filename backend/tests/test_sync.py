@@ -0,0 +1,68 @@
+from conftest import create_folder, create_note, register
+
+
+def _sync(client, user, since=0, **params):
+    r = client.get(f"/sync/{user.name}", params={"since": since, **params}, headers=user.headers)
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def test_full_then_incremental_sync(client, user):
+    folder_id = create_folder(client, user, "同步")
+    first = create_note(client, user, "一", "正文一", folder_id)
+    second = create_note(client, user, "二", "正文二")
+    full = _sync(client, user)
+    assert {note["id"] for note in full["notes"]} == {first, second}
+    assert [folder["id"] for folder in full["folders"]] == [folder_id]
+    assert not full["has_more"]
+    cursor = full["cursor"]
+    assert _sync(client, user, cursor)["notes"] == []
+
+    client.put(f"/notes/{second}", json={"username": user.name, "title": "二", "content": "改过"}, headers=user.headers)
+    changed = _sync(client, user, cursor)
+    assert [note["id"] for note in changed["notes"]] == [second]
+    assert changed["notes"][0]["content"] == "改过"
+    assert changed["cursor"] > cursor
+
+
+def test_deletes_leave_tombstones(client, user):
+    note_id = create_note(client, user, "将被删除", "正文")
+    cursor = _sync(client, user)["cursor"]
+    client.delete(f"/notes/{note_id}", params={"username": user.name}, headers=user.headers)
+    changes = _sync(client, user, cursor)
+    assert changes["notes"] == []
+    assert changes["deleted"]["notes"] == [note_id]
+    # 从头同步时墓碑同样返回，客户端据此删除本地副本
+    assert note_id in _sync(client, user)["deleted"]["notes"]
+
+
+def test_paging_with_cursor_covers_everything_once(client, user):
+    created = {create_note(client, user, f"笔记{i}", f"正文{i}") for i in range(7)}
+    seen, cursor, pages = [], 0, 0
+    while True:
+        page = _sync(client, user, cursor, limit=3)
+        seen.extend(note["id"] for note in page["notes"])
+        cursor = page["cursor"]
+        pages += 1
+        if not page["has_more"]:
+            break
+    assert pages == 3
+    assert sorted(seen) == sorted(created)
+
+
+def test_sync_is_per_user(client, user):
+    create_note(client, user, "我的", "正文")
+    other = register(client)
+    assert _sync(client, other)["notes"] == []
+
+
+def test_list_etag_changes_with_sync_version(client, user):
+    create_note(client, user, "缓存", "正文")
+    url = f"/notes/{user.name}/list"
+    r = client.get(url, headers=user.headers)
+    etag = r.headers["etag"]
+    assert client.get(url, headers={**user.headers, "If-None-Match": etag}).status_code == 304
+    create_note(client, user, "新笔记", "正文")
+    r = client.get(url, headers={**user.headers, "If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.headers["etag"] != etag
@@ -0,0 +1,61 @@
+import note_counts
+import tag_service
+from conftest import create_note, register
+from models import Tag, engine
+
+
+def _tag(client, user, note_id, names):
+    r = client.post(f"/notes/{note_id}/tags", params={"username": user.name}, json=names, headers=user.headers)
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def _note_tags(client, user):
+    r = client.get(f"/notes/{user.name}", headers=user.headers)
+    return {note["id"]: sorted(note["tags"]) for note in r.json()}
+
+
+def test_duplicate_names_in_one_call(client, user, db):
+    note_id = create_note(client, user, "标题", "正文")
+    result = _tag(client, user, note_id, ["重复", " 重复 ", "重复", "", "另一个"])
+    assert (result["tags"], result["dropped"]) == (["重复", "另一个"], [])
+    assert db.query(Tag).filter(Tag.user_id == user.id, Tag.name == "重复").count() == 1
+    assert _note_tags(client, user)[note_id] == ["另一个", "重复"]
+
+
+def test_retagging_is_idempotent(client, user):
+    note_id = create_note(client, user, "标题", "正文")
+    _tag(client, user, note_id, ["幂等"])
+    _tag(client, user, note_id, ["幂等"])
+    counts = client.get(f"/tags/{user.name}/counts", headers=user.headers).json()
+    assert [(tag["name"], tag["note_count"]) for tag in counts] == [("幂等", 1)]
+    with engine.connect() as conn:
+        assert note_counts.check(conn) == []
+
+
+def test_same_name_for_different_users(client):
+    alice, bob = register(client), register(client)
+    alice_note = create_note(client, alice, "a", "正文")
+    bob_note = create_note(client, bob, "b", "正文")
+    _tag(client, alice, alice_note, ["x"])
+    result = _tag(client, bob, bob_note, ["x"])
+    assert (result["message"], result["tags"], result["dropped"]) == ("标签添加成功", ["x"], [])
+    assert _note_tags(client, bob)[bob_note] == ["x"]
+    assert _note_tags(client, alice)[alice_note] == ["x"]
+    # 各用户的标签互相独立
+    alice_tags = client.get(f"/tags/{alice.name}", headers=alice.headers).json()
+    bob_tags = client.get(f"/tags/{bob.name}", headers=bob.headers).json()
+    assert alice_tags[0]["id"] != bob_tags[0]["id"]
+
+
+def test_create_tag_endpoint_allows_same_name_per_user(client):
+    alice, bob = register(client), register(client)
+    first = client.post("/tags/", params={"username": alice.name}, json={"name": "共享名"}, headers=alice.headers)
+    second = client.post("/tags/", params={"username": bob.name}, json={"name": "共享名"}, headers=bob.headers)
+    again = client.post("/tags/", params={"username": bob.name}, json={"name": "共享名"}, headers=bob.headers)
+    assert first.status_code == second.status_code == 200
+    assert first.json()["id"] != second.json()["id"] == again.json()["id"]
+
+
+def test_dropped_names():
+    assert tag_service.dropped_names([" a ", "b", "b", ""], ["a"]) == ["b"]
@@ -0,0 +1,100 @@
+import glob
+import io
+import json
+import os
+import tempfile
+import wave
+
+import numpy as np
+import pytest
+
+import transcription
+from conftest import create_folder, register, wait_ready
+from models import Note
+
+
+def _wav(seconds, sample_rate=8000):
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    samples = (np.sin(2 * np.pi * 440 * t) * 0.5 * 32767).astype("<i2")
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(sample_rate)
+        out.writeframes(samples.tobytes())
+    return buffer.getvalue()
+
+
+def _events(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        event, data = block.split("\n", 1)
+        events.append((event[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+
+def _uploads():
+    return set(glob.glob(os.path.join(tempfile.gettempdir(), "ai-notes-asr-*")))
+
+
+@pytest.fixture
+def transcriber(client):
+    wait_ready(client, "transcriber")
+
+
+def test_transcribe_streams_windows_and_creates_note(client, user, db, transcriber):
+    before = _uploads()
+    folder_id = create_folder(client, user, "录音")
+    r = client.post("/notes/transcribe", params={"create_note": "true", "folder_id": folder_id},
+                    files={"file": ("会议.wav", _wav(2 * transcription.ASR_WINDOW_SECONDS + 5), "audio/wav")}, headers=user.headers)
+    assert r.status_code == 200
+    events = _events(r.text)
+    partials = [data for event, data in events if event == "partial"]
+    assert [p["index"] for p in partials] == [0, 1, 2]
+    assert partials[-1]["end"] == 2 * transcription.ASR_WINDOW_SECONDS + 5
+    event, transcript = events[-1]
+    assert event == "transcript" and transcript["segments"] == 3
+    note = db.get(Note, transcript["note_id"])
+    assert (note.title, note.folder_id, note.content) == ("会议", folder_id, transcript["text"])
+    revision = client.get(f"/notes/{note.id}/revisions/1", headers=user.headers).json()
+    assert revision["content"] == transcript["text"]
+    assert _uploads() == before
+
+
+def test_transcribe_rejects_foreign_folder(client, user, transcriber):
+    other = register(client)
+    folder_id = create_folder(client, other, "别人的")
+    before = _uploads()
+    r = client.post("/notes/transcribe", params={"create_note": "true", "folder_id": folder_id},
+                    files={"file": ("a.wav", _wav(1), "audio/wav")}, headers=user.headers)
+    assert r.status_code == 404
+    assert _uploads() == before
+
+
+def test_transcribe_bad_audio_reports_error_and_cleans_up(client, user, transcriber):
+    before = _uploads()
+    r = client.post("/notes/transcribe", files={"file": ("a.wav", b"not audio", "audio/wav")}, headers=user.headers)
+    assert r.status_code == 200
+    assert _events(r.text)[-1][0] == "error"
+    assert _uploads() == before
+
+
+def test_upload_removed_when_stream_never_starts(tmp_path):
+    import asyncio
+    path = tmp_path / "upload.wav"
+    path.write_bytes(b"x")
+
+    async def stream():
+        yield "never"
+
+    async def disconnected_send(message):
+        raise OSError("client went away")
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    response = transcription.UploadStreamingResponse(stream(), str(path))
+    scope = {"type": "http", "asgi": {"spec_version": "2.4"}}
+    with pytest.raises(Exception):
+        asyncio.run(response(scope, receive, disconnected_send))
+    assert not path.exists()
@@ -0,0 +1,17 @@
+import numpy as np
+
+import vector_index
+
+
+def test_removed_rows_are_reused():
+    vectors = vector_index.UserVectors(2)
+    vectors.upsert([1, 2, 3], np.eye(3, 2, dtype=np.float32))
+    vectors.remove(2)
+    vectors.remove(2)
+    ids, _ = vectors.scores(np.array([1, 0], dtype=np.float32))
+    assert sorted(ids) == [1, 3]
+    # 新笔记填进删除留下的空行，矩阵不随增删反复增长
+    vectors.upsert([4], np.array([[0, 1]], dtype=np.float32))
+    assert vectors.size == 3 and not vectors.free
+    ids, sims = vectors.scores(np.array([0, 1], dtype=np.float32))
+    assert dict(zip(ids.tolist(), sims.tolist())) == {1: 0.0, 4: 1.0, 3: 0.0}
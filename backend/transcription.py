@@ -0,0 +1,167 @@
+# backend/transcription.py
+# 语音转写：上传的音频先分块写入临时文件，再按固定时长的窗口逐段解码、转单声道并重采样到模型采样率，
+# 各窗口交给常驻的 ASR 进程池并行识别，按顺序流式返回分段结果。
+# 同一时刻只有有限个窗口在内存中，长录音的内存占用与时长无关。
+import asyncio
+import os
+import tempfile
+import wave
+import numpy as np
+from starlette.responses import StreamingResponse
+
+ASR_SAMPLE_RATE = 16000
+ASR_WINDOW_SECONDS = float(os.getenv("ASR_WINDOW_SECONDS", "30"))
+# 同时在途（已解码、等待或正在识别）的窗口数上限
+ASR_MAX_INFLIGHT = int(os.getenv("ASR_MAX_INFLIGHT", "4"))
+ASR_MAX_UPLOAD_MB = int(os.getenv("ASR_MAX_UPLOAD_MB", "2048"))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+try:
+    import soundfile
+except ImportError:
+    # 未安装 soundfile 时只支持 WAV
+    soundfile = None
+
+
+class AudioFormatError(ValueError):
+    pass
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+async def save_upload(upload, suffix: str = "") -> str:
+    # 分块写入临时文件，不把整个文件读进内存；返回路径，调用方负责删除
+    limit = ASR_MAX_UPLOAD_MB * 1024 * 1024
+    fd, path = tempfile.mkstemp(prefix="ai-notes-asr-", suffix=suffix)
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > limit:
+                    raise UploadTooLarge(f"音频文件超过 {ASR_MAX_UPLOAD_MB}MB")
+                out.write(chunk)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path
+
+
+def discard_upload(path: str):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+class UploadStreamingResponse(StreamingResponse):
+    # 流式返回转写结果，响应结束后删除上传的临时文件：正常结束、出错和客户端断开
+    # （包括生成器还没开始执行就断开）都会删除
+    def __init__(self, content, upload_path: str, **kwargs):
+        super().__init__(content, **kwargs)
+        self.upload_path = upload_path
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            discard_upload(self.upload_path)
+
+
+def resample(samples: np.ndarray, orig_sr: int, target_sr: int = ASR_SAMPLE_RATE) -> np.ndarray:
+    if orig_sr == target_sr or len(samples) == 0:
+        return samples.astype(np.float32, copy=False)
+    try:
+        import librosa
+        return librosa.resample(samples, orig_sr=orig_sr, target_sr=target_sr).astype(np.float32, copy=False)
+    except ImportError:
+        # 没有 librosa 时用线性插值
+        count = int(round(len(samples) * target_sr / orig_sr))
+        positions = np.arange(count, dtype=np.float64) * orig_sr / target_sr
+        return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+
+def _to_mono(block: np.ndarray) -> np.ndarray:
+    return block.mean(axis=1) if block.ndim > 1 else block
+
+
+def _wav_blocks(path: str, frames_per_block):
+    try:
+        reader = wave.open(path, "rb")
+    except (wave.Error, EOFError):
+        raise AudioFormatError("无法解析音频文件（未安装 soundfile 时仅支持 WAV）")
+    with reader:
+        width, channels, sr = reader.getsampwidth(), reader.getnchannels(), reader.getframerate()
+        if width not in (1, 2, 4):
+            raise AudioFormatError("不支持的WAV采样位宽")
+        while True:
+            raw = reader.readframes(frames_per_block(sr))
+            if not raw:
+                break
+            if width == 1:
+                block = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128) / 128
+            else:
+                dtype = np.int16 if width == 2 else np.int32
+                block = np.frombuffer(raw, dtype=dtype).astype(np.float32) / np.iinfo(dtype).max
+            yield block.reshape(-1, channels), sr
+
+
+def _soundfile_blocks(path: str, frames_per_block):
+    try:
+        info = soundfile.info(path)
+    except RuntimeError:
+        raise AudioFormatError("无法解析音频文件")
+    for block in soundfile.blocks(path, blocksize=frames_per_block(info.samplerate), dtype="float32", always_2d=True):
+        yield block, info.samplerate
+
+
+def iter_windows(path: str, window_seconds: float = ASR_WINDOW_SECONDS):
+    # 逐个产出 (起始秒, 单声道 16kHz float32 窗口)，每次只解码一个窗口
+    def frames_per_block(sr):
+        return max(1, int(sr * window_seconds))
+
+    blocks = _soundfile_blocks(path, frames_per_block) if soundfile else _wav_blocks(path, frames_per_block)
+    offset = 0.0
+    for block, sr in blocks:
+        yield offset, resample(_to_mono(block), sr)
+        offset += len(block) / sr
+
+
+async def transcribe_events(service, path: str, window_seconds: float = ASR_WINDOW_SECONDS,
+                            max_inflight: int = ASR_MAX_INFLIGHT):
+    # 异步生成 (事件名, 数据)：每个窗口识别完成后按顺序产出 partial，最后产出完整的 transcript
+    loop = asyncio.get_running_loop()
+    windows = iter_windows(path, window_seconds)
+    inflight = []
+    texts = []
+    index = 0
+    exhausted = False
+    try:
+        while True:
+            # 解码在线程池中进行，识别并行提交，在途窗口数不超过上限
+            while not exhausted and len(inflight) < max_inflight:
+                item = await loop.run_in_executor(None, next, windows, None)
+                if item is None:
+                    exhausted = True
+                    break
+                start, samples = item
+                end = start + len(samples) / ASR_SAMPLE_RATE
+                task = asyncio.ensure_future(service.submit(samples, sampling_rate=ASR_SAMPLE_RATE))
+                inflight.append((start, end, task))
+            if not inflight:
+                break
+            start, end, task = inflight.pop(0)
+            text = (await task).strip()
+            texts.append(text)
+            yield "partial", {"index": index, "start": round(start, 2), "end": round(end, 2), "text": text}
+            index += 1
+    finally:
+        for _, _, task in inflight:
+            task.cancel()
+        windows.close()
+    yield "transcript", {"text": "\n".join(t for t in texts if t), "segments": index}
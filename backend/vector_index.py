@@ -0,0 +1,293 @@
+# backend/vector_index.py
+# 语义向量检索：笔记嵌入以 float32 BLOB 存在 note_embeddings 表，
+# 查询时按用户加载成一个归一化矩阵常驻内存，用一次矩阵乘法算出全部余弦相似度再取 top-k。
+# 笔记写入时只标记待更新，下次查询时批量补算嵌入并原地更新矩阵，不需要重建。
+# 每次查询最多同步补算 EMBED_MAX_PER_QUERY 篇，其余由后台线程补算（如首次查询时整个笔记库都没有嵌入）。
+import os
+import threading
+import zlib
+import numpy as np
+from sqlalchemy import select, delete, text
+from sqlalchemy.dialects.sqlite import insert
+from models import NoteEmbedding, SessionLocal
+import metrics
+import note_body
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "paraphrase-multilingual-MiniLM-L12-v2")
+EMBED_BATCH_SIZE = 64
+# 送入模型的正文长度上限（模型本身也只看前几百个token）
+EMBED_MAX_CHARS = 2000
+STUB_DIM = 256
+EMBED_MAX_PER_QUERY = int(os.getenv("EMBED_MAX_PER_QUERY", "256"))
+
+_model = None
+_model_lock = threading.Lock()
+# 模型实例由语义搜索和关键词提取共用；推理串行执行，避免多个线程同时推理互相争抢CPU
+_encode_lock = threading.Lock()
+
+
+class StubEmbedder:
+    # 测试用的替身模型：把分词结果哈希到固定维度的词袋向量
+    def encode(self, texts, batch_size=EMBED_BATCH_SIZE, **kwargs):
+        import jieba
+        vectors = np.zeros((len(texts), STUB_DIM), dtype=np.float32)
+        for i, content in enumerate(texts):
+            for tok in jieba.cut(content.lower()):
+                if tok.strip():
+                    vectors[i, zlib.crc32(tok.encode("utf-8")) % STUB_DIM] += 1.0
+        return vectors
+
+
+def get_model():
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                if EMBEDDING_MODEL == "stub":
+                    _model = StubEmbedder()
+                else:
+                    from sentence_transformers import SentenceTransformer
+                    _model = SentenceTransformer(EMBEDDING_MODEL)
+    return _model
+
+
+def warm_up():
+    embed(["warm up"])
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def embed(texts: list) -> np.ndarray:
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+    model = get_model()
+    with _encode_lock, metrics.section("embedding"):
+        return normalize(model.encode(texts, batch_size=EMBED_BATCH_SIZE))
+
+
+def note_text(title, content) -> str:
+    return f"{title or ''}\n{(content or '')[:EMBED_MAX_CHARS]}"
+
+
+class UserVectors:
+    # 单个用户的向量矩阵：按容量倍增追加，删除留空行并记入空闲列表，新笔记优先填空行，更新原地覆盖
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.matrix = np.zeros((16, dim), dtype=np.float32)
+        self.ids = np.full(16, -1, dtype=np.int64)
+        self.size = 0
+        self.pos = {}
+        self.free = []
+        self.pending = set()
+        self.lock = threading.Lock()
+
+    def upsert(self, note_ids, vectors):
+        for note_id, vector in zip(note_ids, vectors):
+            row = self.pos.get(note_id)
+            if row is None and self.free:
+                row = self.free.pop()
+                self.pos[note_id] = row
+                self.ids[row] = note_id
+            elif row is None:
+                if self.size == len(self.ids):
+                    self.matrix = np.vstack([self.matrix, np.zeros_like(self.matrix)])
+                    self.ids = np.concatenate([self.ids, np.full(len(self.ids), -1, dtype=np.int64)])
+                row = self.size
+                self.size += 1
+                self.pos[note_id] = row
+                self.ids[row] = note_id
+            self.matrix[row] = vector
+
+    def remove(self, note_id):
+        row = self.pos.pop(note_id, None)
+        if row is not None:
+            self.matrix[row] = 0
+            self.ids[row] = -1
+            self.free.append(row)
+
+    def scores(self, query_vector):
+        # 返回 (note_ids, 余弦相似度)，已删除的空行被排除
+        ids = self.ids[:self.size]
+        sims = self.matrix[:self.size] @ query_vector
+        valid = ids >= 0
+        return ids[valid], sims[valid]
+
+
+_users = {}
+_users_lock = threading.Lock()
+
+
+def _decode(blob) -> np.ndarray:
+    return np.frombuffer(blob, dtype=np.float32)
+
+
+def _load_user(db, user_id: int) -> UserVectors:
+    rows = db.execute(
+        select(NoteEmbedding.note_id, NoteEmbedding.vector).where(
+            NoteEmbedding.user_id == user_id, NoteEmbedding.model == EMBEDDING_MODEL
+        )
+    ).all()
+    dim = len(_decode(rows[0].vector)) if rows else None
+    if dim is None:
+        dim = embed(["probe"]).shape[1]
+    vectors = UserVectors(dim)
+    if rows:
+        vectors.upsert([row.note_id for row in rows], np.stack([_decode(row.vector) for row in rows]))
+    # 没有当前模型嵌入的笔记全部标记为待计算
+    missing = db.execute(text(
+        "SELECT n.id FROM notes n LEFT JOIN note_embeddings e ON e.note_id = n.id AND e.model = :model "
+        "WHERE n.user_id = :user_id AND e.note_id IS NULL"
+    ), {"model": EMBEDDING_MODEL, "user_id": user_id}).scalars().all()
+    vectors.pending.update(missing)
+    return vectors
+
+
+def _get_user(db, user_id: int) -> UserVectors:
+    with _users_lock:
+        vectors = _users.get(user_id)
+    if vectors is None:
+        vectors = _load_user(db, user_id)
+        with _users_lock:
+            vectors = _users.setdefault(user_id, vectors)
+    return vectors
+
+
+def mark_dirty(user_id: int, note_id: int):
+    # 笔记新建或修改后调用；只有已加载到内存的用户需要记录，未加载的会在加载时发现缺失
+    with _users_lock:
+        vectors = _users.get(user_id)
+    if vectors is not None:
+        with vectors.lock:
+            vectors.pending.add(note_id)
+
+
+def remove_note(db, user_id: int, note_id: int):
+    db.execute(delete(NoteEmbedding).where(NoteEmbedding.note_id == note_id))
+    with _users_lock:
+        vectors = _users.get(user_id)
+    if vectors is not None:
+        with vectors.lock:
+            vectors.pending.discard(note_id)
+            vectors.remove(note_id)
+
+
+def _refresh_pending(db, user_id: int, vectors: UserVectors, limit=None):
+    # 批量补算最多 limit 篇待更新笔记（新笔记优先）的嵌入，每批写回数据库后提交并原地更新内存矩阵；
+    # 出错时尚未提交的笔记放回待更新集合，下次再算
+    with vectors.lock:
+        pending = sorted(vectors.pending, reverse=True)[:limit]
+        vectors.pending.difference_update(pending)
+    committed = 0
+    try:
+        for committed in range(0, len(pending), EMBED_BATCH_SIZE):
+            _refresh_batch(db, user_id, vectors, pending[committed:committed + EMBED_BATCH_SIZE])
+            db.commit()
+        committed = len(pending)
+    except Exception:
+        db.rollback()
+        with vectors.lock:
+            vectors.pending.update(pending[committed:])
+        raise
+
+
+def _refresh_batch(db, user_id: int, vectors: UserVectors, batch):
+    rows = db.execute(text(
+        "SELECT id, title, content FROM notes WHERE user_id = :user_id AND id IN (%s)"
+        % ",".join(str(int(note_id)) for note_id in batch)
+    ), {"user_id": user_id}).all()
+    found = {row.id for row in rows}
+    if rows:
+        matrix = embed([note_text(row.title, note_body.decode(row.content)) for row in rows])
+        db.execute(
+            insert(NoteEmbedding).values([
+                {"note_id": row.id, "user_id": user_id, "model": EMBEDDING_MODEL, "vector": vector.tobytes()}
+                for row, vector in zip(rows, matrix)
+            ]).on_conflict_do_update(
+                index_elements=["note_id"],
+                set_={"model": EMBEDDING_MODEL, "vector": insert(NoteEmbedding).excluded.vector},
+            )
+        )
+        with vectors.lock:
+            vectors.upsert([row.id for row in rows], matrix)
+    with vectors.lock:
+        for note_id in batch:
+            if note_id not in found:
+                vectors.remove(note_id)
+
+
+_refreshing = set()
+
+
+def _refresh_in_background(user_id: int, vectors: UserVectors):
+    # 每个用户最多一个后台补算线程
+    with _users_lock:
+        if user_id in _refreshing:
+            return
+        _refreshing.add(user_id)
+    threading.Thread(target=_background_refresh, args=(user_id, vectors), name="embedding-refresh", daemon=True).start()
+
+
+def _background_refresh(user_id: int, vectors: UserVectors):
+    db = SessionLocal()
+    try:
+        while vectors.pending:
+            _refresh_pending(db, user_id, vectors, EMBED_MAX_PER_QUERY)
+    except Exception:
+        # 失败的笔记已放回待更新集合，下次查询时重试
+        pass
+    finally:
+        db.close()
+        with _users_lock:
+            _refreshing.discard(user_id)
+
+
+def similarities(db, user_id: int, query: str):
+    # 返回 (note_ids, 余弦相似度) 两个等长数组；尚未算出嵌入的笔记（见 pending_count）不在其中
+    vectors = _get_user(db, user_id)
+    if vectors.pending:
+        _refresh_pending(db, user_id, vectors, EMBED_MAX_PER_QUERY)
+        if vectors.pending:
+            _refresh_in_background(user_id, vectors)
+    query_vector = embed([query])[0]
+    with vectors.lock:
+        return vectors.scores(query_vector)
+
+
+def pending_count(user_id: int) -> int:
+    with _users_lock:
+        vectors = _users.get(user_id)
+    return len(vectors.pending) if vectors is not None else 0
+
+
+def blend(ids, sims, lexical: dict, alpha: float):
+    # 语义分与归一化后的词法分 (0~1) 线性混合；lexical 为 {note_id: 词法分}
+    scores = alpha * sims
+    if lexical and alpha < 1:
+        lex_ids = np.fromiter(lexical.keys(), dtype=np.int64, count=len(lexical))
+        lex_scores = np.fromiter(lexical.values(), dtype=np.float32, count=len(lexical))
+        order = np.argsort(lex_ids)
+        lex_ids, lex_scores = lex_ids[order], lex_scores[order]
+        idx = np.searchsorted(lex_ids, ids)
+        idx[idx == len(lex_ids)] = 0
+        hit = lex_ids[idx] == ids
+        scores = scores + (1 - alpha) * np.where(hit, lex_scores[idx], 0.0)
+    return scores
+
+
+def top_k(scores, k: int):
+    # argpartition 取前 k 个再排序，避免对全部笔记排序；返回下标数组
+    if len(scores) == 0:
+        return np.zeros(0, dtype=np.int64)
+    k = min(k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def reset():
+    with _users_lock:
+        _users.clear()
@@ -1,6 +1,17 @@
 import React, { useState, useEffect, useRef } from "react";
 import ReactMarkdown from "react-markdown";
 
+// 登录后由 /login 返回的访问令牌，所有请求经 apiFetch 自动带上
+let authToken = "";
+// 增量同步游标：首次从0拉取全部笔记，之后只拉取变更
+let syncCursor = 0;
+
+const apiFetch = (url, options = {}) => {
+  const headers = { ...(options.headers || {}) };
+  if (authToken) headers["Authorization"] = `Bearer ${authToken}`;
+  return fetch(url, { ...options, headers });
+};
+
 function App() {
   const [mode, setMode] = useState("login"); // "register" or "login"
   const [username, setUsername] = useState("");
@@ -84,7 +95,7 @@ function App() {
   const handleGetAiTags = async (noteId, content) => {
     setDetailMsg('正在获取AI标签...');
     try {
-      const res = await fetch(`http://127.0.0.1:8000/notes/${noteId}/ai_tags`, {method: 'POST'});
+      const res = await apiFetch(`http://127.0.0.1:8000/notes/${noteId}/ai_tags`, {method: 'POST'});
       const data = await res.json();
       setAiTags(prev => ({...prev, [noteId]: data.tags || []}));
       // 更新notes中对应笔记的tags
@@ -100,7 +111,7 @@ function App() {
     e.preventDefault();
     setMsg(""); setMsgType("");
     try {
-      const res = await fetch("http://127.0.0.1:8000/register", {
+      const res = await apiFetch("http://127.0.0.1:8000/register", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({ username, password }),
@@ -124,13 +135,15 @@ function App() {
     e.preventDefault();
     setMsg(""); setMsgType("");
     try {
-      const res = await fetch("http://127.0.0.1:8000/login", {
+      const res = await apiFetch("http://127.0.0.1:8000/login", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({ username, password }),
       });
       const data = await res.json();
       if (res.ok) {
+        authToken = data.access_token || "";
+        syncCursor = 0;
         setMsg(data.message || "登录成功");
         setMsgType("success");
         setCurrentUser(username);
@@ -148,11 +161,27 @@ function App() {
     }
   };
 
-  // 获取笔记
+  // 获取笔记（增量同步：只拉取上次同步之后新建、修改或删除的笔记并合并到本地）
   const fetchNotes = async (user) => {
-    const res = await fetch(`http://127.0.0.1:8000/notes/${user}`);
-    const data = await res.json();
-    setNotes(data);
+    const changed = new Map();
+    const deleted = new Set();
+    let hasMore = true;
+    while (hasMore) {
+      const res = await apiFetch(`http://127.0.0.1:8000/sync/${user}?since=${syncCursor}`);
+      if (!res.ok) return;
+      const data = await res.json();
+      data.notes.forEach(n => { changed.set(n.id, n); deleted.delete(n.id); });
+      data.deleted.notes.forEach(id => { deleted.add(id); changed.delete(id); });
+      syncCursor = data.cursor;
+      hasMore = data.has_more;
+    }
+    if (changed.size === 0 && deleted.size === 0) return;
+    setNotes(prev => {
+      const byId = new Map(prev.map(n => [n.id, n]));
+      deleted.forEach(id => byId.delete(id));
+      changed.forEach((n, id) => byId.set(id, n));
+      return Array.from(byId.values());
+    });
   };
 
   // 添加笔记
@@ -160,7 +189,7 @@ function App() {
     e.preventDefault();
     if (!noteTitle || !noteContent) return;
     try {
-      const res = await fetch("http://127.0.0.1:8000/notes/", {
+      const res = await apiFetch("http://127.0.0.1:8000/notes/", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({
@@ -187,7 +216,7 @@ function App() {
   // 删除笔记
   const handleDeleteNote = async (id) => {
     try {
-      await fetch(`http://127.0.0.1:8000/notes/${id}?username=${currentUser}`, {
+      await apiFetch(`http://127.0.0.1:8000/notes/${id}?username=${currentUser}`, {
         method: "DELETE",
       });
       fetchNotes(currentUser);
@@ -201,7 +230,7 @@ function App() {
   const handleSummarize = async (noteId, content) => {
     setAiSummary(prev => ({ ...prev, [noteId]: "正在生成摘要..." }));
     try {
-      const res = await fetch("http://127.0.0.1:8000/summarize/", {
+      const res = await apiFetch("http://127.0.0.1:8000/summarize/", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({ content, max_length: summaryLength, min_length: 30 }),
@@ -218,7 +247,7 @@ function App() {
   const handleKeywords = async (noteId, content) => {
     setAiKeywords(prev => ({ ...prev, [noteId]: "正在提取关键词..." }));
     try {
-      const res = await fetch("http://127.0.0.1:8000/extract_keywords/", {
+      const res = await apiFetch("http://127.0.0.1:8000/extract_keywords/", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({ content }),
@@ -235,7 +264,7 @@ function App() {
   const handleDetailSummarize = async () => {
     setDetailMsg('正在生成摘要...');
     try {
-      const res = await fetch('http://127.0.0.1:8000/summarize/', {
+      const res = await apiFetch('http://127.0.0.1:8000/summarize/', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ content: selectedNote.content, max_length: 200, min_length: 40 }),
@@ -252,7 +281,7 @@ function App() {
   const handleDetailKeywords = async () => {
     setDetailMsg("正在提取关键词...");
     try {
-      const res = await fetch("http://127.0.0.1:8000/extract_keywords/", {
+      const res = await apiFetch("http://127.0.0.1:8000/extract_keywords/", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({ content: selectedNote.content }),
@@ -275,7 +304,7 @@ function App() {
   const handleSaveEdit = async () => {
     setDetailMsg("正在保存...");
     try {
-      const res = await fetch(`http://127.0.0.1:8000/notes/${selectedNote.id}`, {
+      const res = await apiFetch(`http://127.0.0.1:8000/notes/${selectedNote.id}`, {
         method: "PUT",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({
@@ -315,7 +344,7 @@ function App() {
   // 获取用户标签
   const fetchTags = async () => {
     try {
-      const res = await fetch(`http://127.0.0.1:8000/tags/${currentUser}`);
+      const res = await apiFetch(`http://127.0.0.1:8000/tags/${currentUser}`);
       const data = await res.json();
       setTags(data);
     } catch (error) {
@@ -326,7 +355,7 @@ function App() {
   // 获取用户文件夹
   const fetchFolders = async (user) => {
     try {
-      const res = await fetch(`http://127.0.0.1:8000/folders/${user}`);
+      const res = await apiFetch(`http://127.0.0.1:8000/folders/${user}`);
       const data = await res.json();
       setFolders(data);
     } catch (error) {
@@ -340,7 +369,7 @@ function App() {
       setMsg("文件夹名称不能为空"); setMsgType("error"); return;
     }
     try {
-      const res = await fetch(`http://127.0.0.1:8000/folders/?username=${currentUser}`, {
+      const res = await apiFetch(`http://127.0.0.1:8000/folders/?username=${currentUser}`, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({
@@ -367,7 +396,7 @@ function App() {
   // 删除文件夹
   const deleteFolder = async (folderId) => {
     try {
-      await fetch(`http://127.0.0.1:8000/folders/${folderId}?username=${currentUser}`, {
+      await apiFetch(`http://127.0.0.1:8000/folders/${folderId}?username=${currentUser}`, {
         method: "DELETE",
       });
       fetchFolders(currentUser);
@@ -384,7 +413,7 @@ function App() {
   const updateFolder = async () => {
     if (!editingFolder || !newFolderName.trim()) return;
     try {
-      const res = await fetch(`http://127.0.0.1:8000/folders/${editingFolder.id}?username=${currentUser}`, {
+      const res = await apiFetch(`http://127.0.0.1:8000/folders/${editingFolder.id}?username=${currentUser}`, {
         method: "PUT",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({
@@ -407,7 +436,7 @@ function App() {
   // 为笔记添加标签
   const addTagsToNote = async (noteId, tagNames) => {
     try {
-      const res = await fetch(`http://127.0.0.1:8000/notes/${noteId}/tags`, {
+      const res = await apiFetch(`http://127.0.0.1:8000/notes/${noteId}/tags`, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({ tag_names: tagNames }),
@@ -423,7 +452,7 @@ function App() {
   // 自动生成标签
   const generateAutoTags = async (noteId) => {
     try {
-      const res = await fetch(`http://127.0.0.1:8000/notes/${noteId}/auto_tags`, {
+      const res = await apiFetch(`http://127.0.0.1:8000/notes/${noteId}/auto_tags`, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         // 不发送任何请求体
@@ -448,6 +477,8 @@ function App() {
 
   // 登出
   const handleLogout = () => {
+    authToken = "";
+    syncCursor = 0;
     setCurrentUser("");
     setUsername("");
     setPassword("");
@@ -482,7 +513,7 @@ function App() {
     
     setIsSearching(true);
     try {
-      const res = await fetch(`http://127.0.0.1:8000/search/${currentUser}?query=${encodeURIComponent(query)}`);
+      const res = await apiFetch(`http://127.0.0.1:8000/search/${currentUser}?query=${encodeURIComponent(query)}`);
       const data = await res.json();
       setSearchResults(data.results || []);
     } catch (error) {
@@ -965,7 +996,7 @@ function App() {
                   setPwdMsg("两次新密码不一致"); setPwdMsgType("error"); return;
                 }
                 try {
-                  const res = await fetch("http://127.0.0.1:8000/change_password", {
+                  const res = await apiFetch("http://127.0.0.1:8000/change_password", {
                     method: "POST",
                     headers: { "Content-Type": "application/json" },
                     body: JSON.stringify({
@@ -980,6 +1011,8 @@ function App() {
                   if (data.msgType === "success") {
                     setTimeout(() => {
                       setShowChangePwd(false);
+                      authToken = "";
+                      syncCursor = 0;
                       setCurrentUser(""); // 自动登出
                       setUsername(""); setPassword("");
                       setNotes([]); setMsg("密码修改成功，请重新登录"); setMsgType("success");